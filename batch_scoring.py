@@ -0,0 +1,161 @@
+import sys
+import logging
+import functools
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import string_utils
+
+logger = logging.getLogger(__name__)
+
+# Optional backend: without numpy/rapidfuzz utility.find_song scores songs one pair at a time
+try:
+    import numpy as np
+    from rapidfuzz import fuzz, process
+    BATCH_BACKEND = True
+except ImportError:
+    np = None
+    BATCH_BACKEND = False
+
+
+@functools.lru_cache(maxsize=65536)
+def _normalize(text):
+    return string_utils.clean_string(text) if text else ""
+
+
+def _as_list(artists):
+    if isinstance(artists, str):
+        return [artists]
+    return list(artists or [])
+
+
+def similarity_matrix(queries, choices):
+    """
+    Similarity (0-1) of every query against every choice, computed in one cdist pass.
+    Rounded to whole percentages, as the ratio of string_utils.are_strings_similar.
+    """
+    if not queries or not choices:
+        return np.zeros((len(queries), len(choices)))
+    return np.round(process.cdist(
+        [_normalize(q) for q in queries],
+        [_normalize(c) for c in choices],
+        scorer=fuzz.ratio, dtype=np.float64
+    )) / 100
+
+
+def artist_scores(query_artists, candidates_artists):
+    """Best similarity between any query artist and any artist of each candidate."""
+    query_artists = _as_list(query_artists)
+    flat = []
+    offsets = []
+    empty = []
+    for artists in candidates_artists:
+        artists = _as_list(artists)
+        offsets.append(len(flat))
+        empty.append(not artists)
+        flat.extend(artists or [""])
+
+    if not query_artists or not flat:
+        return np.zeros(len(offsets))
+
+    # Max over the query artists, then over the artists of each candidate
+    best = similarity_matrix(query_artists, flat).max(axis=0)
+    scores = np.maximum.reduceat(best, offsets)
+    scores[np.array(empty, dtype=bool)] = 0
+    return scores
+
+
+def component_scores(title, artists, album, candidates, consider_album=True,
+                     weights=None, threshold=None, stats=None):
+    """
+    Title, artist and album scores of one query against many (title, artist(s), album) candidates,
+    plus the mask of the complete matches (same title and album, at least one artist in common).
+
+    With weights and threshold, album and artist scores are only computed for the candidates
+    that can still reach the threshold (the others keep 0 and can't match anyway).
+    stats (a Counter) is updated with the number of scored and pruned candidates.
+    """
+    count = len(candidates)
+    titles = [c[0] for c in candidates]
+    albums = [c[2] for c in candidates]
+    prune = weights is not None and threshold is not None
+
+    query_artists = set(_as_list(artists))
+    exact = np.fromiter(
+        (t == title and a == album and bool(query_artists & set(_as_list(ca)))
+         for t, ca, a in candidates),
+        dtype=bool, count=count
+    )
+
+    # Title first: the most selective component, with the highest weight
+    title_scores = similarity_matrix([title], titles)[0]
+    alive = np.ones(count, dtype=bool)
+    if prune:
+        title_weight, artist_weight, album_weight = weights
+        alive = exact | (title_scores * title_weight + artist_weight + (album_weight if consider_album else 0) >= threshold)
+        pruned_title = count - int(alive.sum())
+
+    # Then the album, a single comparison per candidate
+    album_scores = np.zeros(count)
+    if consider_album:
+        positions = alive.nonzero()[0]
+        album_scores[positions] = similarity_matrix([album], [albums[p] for p in positions])[0]
+        if prune:
+            still_alive = exact | (title_scores * title_weight + artist_weight + album_scores * album_weight >= threshold)
+            pruned_album = int(alive.sum()) - int((alive & still_alive).sum())
+            alive &= still_alive
+
+    # Artists last: every query artist against every artist of the candidate
+    artist_component = np.zeros(count)
+    positions = alive.nonzero()[0]
+    artist_component[positions] = artist_scores(artists, [candidates[p][1] for p in positions])
+
+    if stats is not None:
+        stats["scored"] += count
+        if prune:
+            stats["pruned_title"] += pruned_title
+            stats["pruned_album"] += pruned_album if consider_album else 0
+
+    return title_scores, artist_component, album_scores, exact
+
+
+def weigh(title_scores, artist_component, album_scores, exact, weights=(0.6, 0.3, 0.1), threshold=0.85):
+    """
+    Weighted scores and matched mask from the component scores.
+    Without album scores (None) the album is not considered and complete matches don't apply.
+    """
+    title_weight, artist_weight, album_weight = weights
+    if album_scores is None:
+        album_scores = np.zeros(len(title_scores))
+    # Same operation order as match_song_weighed, so scores are identical
+    scores = title_scores * title_weight + artist_component * artist_weight + album_scores * album_weight
+    matched = scores >= threshold
+
+    # Complete matches score 1.0
+    if exact is not None:
+        scores[exact] = 1.0
+        matched |= exact
+    return matched, scores
+
+
+def score_candidates(title, artists, album, candidates, title_weight=0.6, artist_weight=0.3,
+                     album_weight=0.1, threshold=0.85, consider_album=True, stats=None):
+    """
+    Batch version of utility.match_song (simple_match=False) for one query and many candidates.
+
+    candidates is a list of (title, artist(s), album) tuples.
+    Returns the matched mask, the weighted scores and the title/artist/album component scores
+    (0 for the components of pruned candidates).
+    """
+    if not candidates:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=bool), empty, (empty, empty, empty)
+
+    weights = (title_weight, artist_weight, album_weight)
+    title_scores, artist_component, album_scores, exact = component_scores(
+        title, artists, album, candidates, consider_album=consider_album,
+        weights=weights, threshold=threshold, stats=stats)
+    matched, scores = weigh(title_scores, artist_component, album_scores if consider_album else None,
+                            exact if consider_album else None, weights, threshold)
+    return matched, scores, (title_scores, artist_component, album_scores)
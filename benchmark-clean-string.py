@@ -0,0 +1,100 @@
+import re
+import sys
+import os
+import time
+import random
+import logging
+import argparse
+
+import utility
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import log_utils
+
+logger = log_utils.setup_logging(os.path.basename(__file__), logging.INFO)
+
+WORDS = ["love", "night", "heart", "città", "perché", "dream", "fire", "rain", "sole", "luna",
+         "road", "home", "time", "light", "notte", "blue", "girl", "world", "life", "star",
+         "deep", "sleep", "step", "amore", "mare", "vita", "sempre", "ancora", "domani", "cuore"]
+SUFFIXES = [" (Remastered)", " - Remastered 2019", " - Live", " [Remastered Version]", " (Deluxe Edition)",
+            " - EP", " (2009 Remaster)", " - Mono / Remastered", " (Live)", " - With Elisa", ""]
+SPECIAL = ["’", "×", "·", "‐", "…", " / ", "E'", " - "]
+
+
+def legacy_clean_string(input_string):
+    """Reference implementation of utility.clean_string before precompilation."""
+    input_string = input_string.replace("’", "'")
+    input_string = input_string.replace("×", "x")
+    input_string = input_string.replace("·", "")
+    input_string = input_string.replace("‐", "-")
+    input_string = input_string.replace("…", "...")
+    input_string = input_string.replace(" / ", "/")
+    input_string = input_string.replace("A'", "à")
+    input_string = input_string.replace("E'", "è")
+    input_string = input_string.replace("I'", "ì")
+    input_string = input_string.replace("O'", "ò")
+    input_string = input_string.replace("U'", "ù")
+    input_string = input_string.replace("Sansiro", "San siro")
+    input_string = input_string.replace(" - ", "-")
+    input_string = input_string.replace("I RIO", "Rio")
+
+    input_string = input_string.strip().lower()
+
+    for term in utility.IGNORE_TERMS:
+        input_string = re.sub(term, "", input_string, flags=re.IGNORECASE)
+    return input_string.strip()
+
+
+def generate_corpus(size, unique_ratio=0.3, seed=42):
+    """Deterministic title corpus; titles repeat like titles, albums and artists of a real library."""
+    rng = random.Random(seed)
+    unique = []
+    for _ in range(max(1, int(size * unique_ratio))):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 5))]
+        if rng.random() < 0.3:
+            words.insert(rng.randint(0, len(words)), rng.choice(SPECIAL))
+        title = " ".join(words).title() if rng.random() < 0.8 else " ".join(words).upper()
+        unique.append(title + rng.choice(SUFFIXES))
+    return [rng.choice(unique) for _ in range(size)]
+
+
+def measure(function, corpus):
+    start = time.perf_counter()
+    for text in corpus:
+        function(text)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(corpus) / elapsed if elapsed else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark di utility.clean_string')
+    parser.add_argument('--size', type=int, default=200000, help='Numero di titoli del corpus')
+    parser.add_argument('--unique-ratio', type=float, default=0.3, help='Frazione di titoli distinti')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size, args.unique_ratio, args.seed)
+    logger.info(f"Corpus: {len(corpus)} titles, {len(set(corpus))} distinct")
+
+    # Same output as the reference implementation
+    mismatches = [text for text in set(corpus) if legacy_clean_string(text) != utility.clean_string(text)]
+    if mismatches:
+        logger.error(f"{len(mismatches)} outputs differ from the reference, e.g. {mismatches[:5]}")
+        return 1
+    utility.clean_string.cache_clear()
+
+    legacy_time, legacy_rate = measure(legacy_clean_string, corpus)
+    cold_time, cold_rate = measure(utility.clean_string, corpus)
+    warm_time, warm_rate = measure(utility.clean_string, corpus)
+
+    logger.info(f"Legacy:        {legacy_time:.3f}s ({legacy_rate:,.0f} titles/s)")
+    logger.info(f"Engine (cold): {cold_time:.3f}s ({cold_rate:,.0f} titles/s) x{legacy_time / cold_time:.1f}")
+    logger.info(f"Engine (warm): {warm_time:.3f}s ({warm_rate:,.0f} titles/s) x{legacy_time / warm_time:.1f}")
+    logger.info(f"Cache: {utility.clean_string.cache_info()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
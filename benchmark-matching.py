@@ -0,0 +1,208 @@
+import sys
+import os
+import gc
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib.util
+from datetime import datetime
+
+import utility
+import batch_scoring
+import song_index
+import user_inputs
+import verified_store
+import synthetic_library
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import json_utils, log_utils
+
+logger = log_utils.setup_logging(os.path.basename(__file__), logging.INFO)
+
+RESULTS_DIR = "benchmark_results"
+DEFAULT_SIZES = "1000,10000,50000,200000"
+
+
+def load_compare_script():
+    """compare-spotify-navidrome.py is a script, not a module: loaded by path."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compare-spotify-navidrome.py")
+    spec = importlib.util.spec_from_file_location("compare_spotify_navidrome", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def clear_caches():
+    utility.clear_caches()
+    if batch_scoring.BATCH_BACKEND:
+        batch_scoring._normalize.cache_clear()
+    gc.collect()
+
+
+def run_stage(name, function, trace_memory):
+    """
+    Runs a stage with cold caches and returns its time, throughput and peak memory.
+
+    function returns the number of processed items. Peak memory is measured with tracemalloc
+    in a second run, so its overhead does not affect the timings.
+    """
+    clear_caches()
+    start = time.perf_counter()
+    items = function()
+    seconds = time.perf_counter() - start
+
+    result = {"seconds": round(seconds, 4), "items": items,
+              "per_second": round(items / seconds, 1) if seconds else None}
+    if trace_memory:
+        clear_caches()
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_mb"] = round(peak / 2 ** 20, 2)
+
+    memory = f", peak {result['peak_mb']} MB" if trace_memory else ""
+    logger.info(f"  {name:<13} {seconds:8.3f}s  {items:>8} items  {result['per_second'] or 0:>12,.0f}/s{memory}")
+    return result
+
+
+def benchmark_size(size, args, compare_script):
+    logger.info(f"Library of {size} songs")
+    stages = {}
+    generated = {}
+
+    def generate():
+        generated["library"] = synthetic_library.generate_library(size, seed=args.seed)
+        generated["spotify"] = synthetic_library.generate_spotify_songs(generated["library"], args.queries, seed=args.seed)
+        return size + args.queries
+    stages["generate"] = run_stage("generate", generate, args.memory)
+    library = generated["library"]
+    spotify_songs = generated["spotify"]
+    queries = [(song["name"], [artist["name"] for artist in song["artists"]], song["album"]) for song in spotify_songs]
+
+    def clean_strings():
+        for song in library:
+            utility.normalize(song["title"])
+            utility.normalize(song["artist"])
+            utility.normalize(song["album"])
+        return len(library) * 3
+    stages["clean_string"] = run_stage("clean_string", clean_strings, args.memory)
+
+    built = {}
+
+    def build_index():
+        built["index"] = song_index.SongIndex(library, "navidrome")
+        return size
+    stages["index"] = run_stage("index", build_index, args.memory)
+    index = built["index"]
+
+    # Half unrelated pairs (pruned early), half a song against a Spotify-style variant of itself
+    rng = random.Random(args.seed)
+    pairs = [(rng.choice(queries), rng.choice(library)) for _ in range(args.pairs // 2)]
+    for song in rng.choices(library, k=args.pairs - len(pairs)):
+        variant = (song["title"] + rng.choice(synthetic_library.REMASTER_SUFFIXES),
+                   [synthetic_library.strip_accents(song["artist"])], song["album"])
+        pairs.append((variant, song))
+
+    def match_songs():
+        for (title, artists, album), song in pairs:
+            utility.match_song(title, artists, album, song["title"], song["artist"], song["album"], simple_match=False)
+        return len(pairs)
+    stages["match_song"] = run_stage("match_song", match_songs, args.memory)
+
+    def find_songs():
+        for title, artists, album in queries:
+            utility.find_song(title, artists, album, library, "navidrome", permit_choice=False, index=index)
+        return len(queries)
+    stages["find_song"] = run_stage("find_song", find_songs, args.memory)
+
+    def compare():
+        # Throwaway verified songs and deferred choices: nothing is asked or written to the real reports
+        with tempfile.TemporaryDirectory() as directory:
+            user_inputs.set_deferred_mode(os.path.join(directory, "deferred_choices.jsonl"))
+            verified_songs = verified_store.VerifiedStore(os.path.join(directory, "verified_songs.json"))
+            compare_script.compare_songs(library, spotify_songs, verified_songs, False, workers=args.workers)
+            user_inputs.set_deferred_mode(None)
+        return len(spotify_songs)
+    stages["compare_songs"] = run_stage("compare_songs", compare, args.memory)
+
+    return {"size": size, "queries": len(queries), "pairs": len(pairs), "stages": stages}
+
+
+def latest_results(directory, settings):
+    """Path and content of the latest results saved with the same settings (None if missing)."""
+    if not os.path.isdir(directory):
+        return None, None
+    files = sorted(name for name in os.listdir(directory) if name.startswith("matching-") and name.endswith(".json"))
+    for name in reversed(files):
+        path = os.path.join(directory, name)
+        previous = json_utils.load_json_data(path)
+        if all(previous.get(key) == value for key, value in settings.items()):
+            return path, previous
+    return None, None
+
+
+def log_comparison(previous_file, previous, results):
+    """Logs the time ratio of each stage against the previous results (>1 is slower)."""
+    previous_sizes = {entry["size"]: entry for entry in previous.get("results", [])}
+    logger.info(f"Compared with {previous_file}:")
+    for entry in results:
+        old = previous_sizes.get(entry["size"])
+        if not old:
+            continue
+        ratios = []
+        for stage, values in entry["stages"].items():
+            old_values = old["stages"].get(stage)
+            if old_values and old_values["seconds"] and old_values["items"] == values["items"]:
+                ratios.append(f"{stage} x{values['seconds'] / old_values['seconds']:.2f}")
+        logger.info(f"  {entry['size']}: {', '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del motore di confronto su librerie sintetiche')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Dimensioni delle librerie, separate da virgola (default: {DEFAULT_SIZES})')
+    parser.add_argument('--queries', type=int, default=500, help='Brani Spotify cercati in find_song e compare_songs')
+    parser.add_argument('--pairs', type=int, default=20000, help='Coppie confrontate con match_song')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Processi usati da compare_songs')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch', action='store_true', help='Attiva il calcolo vettoriale dei punteggi (numpy e rapidfuzz)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Non misurare la memoria di picco')
+    parser.add_argument('--output-dir', default=RESULTS_DIR, help=f'Cartella dei risultati JSON (default: {RESULTS_DIR})')
+    args = parser.parse_args()
+
+    if args.batch:
+        utility.USE_BATCH_SCORING = True
+    compare_script = load_compare_script()
+    # One log line per match would dominate the timings
+    for name in ("utility", "song_index", "compare_utils", "user_inputs", "verified_store", compare_script.logger.name):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    batch = utility.USE_BATCH_SCORING and batch_scoring.BATCH_BACKEND
+    logger.info(f"Scoring: {'batch' if batch else 'scalar'}, workers: {args.workers}, seed: {args.seed}")
+
+    results = [benchmark_size(int(size), args, compare_script) for size in args.sizes.split(",")]
+
+    settings = {"scoring": "batch" if batch else "scalar", "workers": args.workers, "seed": args.seed}
+    previous_file, previous = latest_results(args.output_dir, settings)
+    if previous_file:
+        log_comparison(previous_file, previous, results)
+
+    file_name = f"matching-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    json_utils.save_to_json_file({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **settings,
+        "results": results,
+    }, file_name, args.output_dir)
+    logger.info(f"Results saved in {os.path.join(args.output_dir, file_name)}")
+
+
+if __name__ == "__main__":
+    main()
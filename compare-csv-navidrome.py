@@ -1,8 +1,12 @@
 import utility
+import compare_utils
+import user_inputs
+import verified_store
 import sys
 import os
 import logging
 import time
+import argparse
 from datetime import datetime, timedelta
 
 sys.path.append('../')
@@ -25,36 +29,37 @@ NOT_FOUND_DOWNLOAD_FILE = "album_not_found_download.log"
 NOT_FOUND_LIST_FILE = "songs_not_found_list.log"
 PART_MATCH_LOG_FILE = "partially_matched.log"
 VERIFIED_FILE = "verified_songs.csv"
+DEFERRED_FILE = "deferred_choices.jsonl"
 
 def is_verified(song, verified_songs):
     """Controlla se il brano è già verificato confrontando i primi tre campi del CSV."""
-    return any(
-        song[0] == verified[0] and 
-        song[1] == verified[1] and 
-        song[2] == verified[2] 
-        for verified in verified_songs
-    )
-
-def compare_songs(navidrome_songs, csv_songs, verified_songs, simple_match=True):
+    return song in verified_songs
+
+def compare_songs(navidrome_songs, csv_songs, verified_songs, simple_match=True, workers=1):
     """Confronta i brani tra Navidrome e CSV."""
     found = []
     partially_matched = []
     not_found = []
 
-    for source_song in csv_songs:
-        # Salta i brani già verificati
+    # Salta i brani già verificati
+    pending_songs = [song for song in csv_songs if not is_verified(song, verified_songs)]
+    queries = [(song[0], [song[1]], song[2]) for song in pending_songs]
+
+    # Searches run in input order (or in parallel with workers > 1), choices are made here
+    results = compare_utils.search_all(queries, navidrome_songs, workers=workers, library_file=NAVIDROME_FILE)
+
+    for source_song, (source_title, source_artists, source_album), (matches, partial_matches) in zip(pending_songs, queries, results):
+        # Duplicate of a song matched earlier in this run
         if is_verified(source_song, verified_songs):
-            #print(f'Salto brano già verificato: {spotify_song["artists"][0]["name"]} - {spotify_song["album"]} - {spotify_song["name"]}')
             continue
 
         logger.info(f"Comparing: {source_song[0]} - {source_song[1]} - {source_song[2]}")
 
-        source_title = source_song[0]
-        source_artists = [source_song[1]]
-        source_album = source_song[2]
-
         # Search in Navidrome (including album)
-        match = utility.find_song(source_title, source_artists, source_album, navidrome_songs, "navidrome", only_first_result=False, permit_choice=True, consider_album=True)
+        context = {"report_dir": REPORT_DIR, "source_key": "source", "source": source_song, "verified_file": VERIFIED_FILE,
+                   "part_match_file": PART_MATCH_FILE, "not_found_file": NOT_FOUND_FILE}
+        match = compare_utils.resolve_match(matches, source_title, source_artists, source_album,
+                                            context={**context, "report": FOUND_FILE})
 
         if match:
             logger.info("MATCHED!")
@@ -62,13 +67,14 @@ def compare_songs(navidrome_songs, csv_songs, verified_songs, simple_match=True)
                 "source": source_song,
                 "navidrome": match
             })
-            verified_songs.append(source_song)
+            verified_songs.add(source_song)
             continue
 
         # Second search (without album)
         logger.info("No match. Trying without album...")
 
-        partial_match = utility.find_song(source_title, source_artists, source_album, navidrome_songs, "navidrome", only_first_result=False, permit_choice=True, consider_album=False)
+        partial_match = compare_utils.resolve_match(partial_matches, source_title, source_artists, source_album,
+                                                    context={**context, "report": PART_MATCH_FILE})
         
         if partial_match:
             logger.info("PARTIALLY MATCHED!")
@@ -123,13 +129,22 @@ def save_not_found_list(data, file_path, found=False, output_dir=None):
             )
 
 def main():
+    parser = argparse.ArgumentParser(description='Confronta i brani di un CSV con quelli di Navidrome')
+    parser.add_argument('--defer-choices', action='store_true',
+                        help=f'Non chiedere le scelte ambigue: accodale in {DEFERRED_FILE} (vedi resolve-deferred-choices.py)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Numero di processi per la ricerca dei brani')
+    args = parser.parse_args()
+
+    if args.defer_choices:
+        user_inputs.set_deferred_mode(file_utils.append_dir_to_file_name(DEFERRED_FILE, REPORT_DIR))
+
     # Carica i dati
     navidrome_songs = json_utils.load_json_data(NAVIDROME_FILE)
     csv_songs = json_utils.load_json_data(CSV_FILE)
-    verified_songs = json_utils.load_json_data(file_utils.append_dir_to_file_name(VERIFIED_FILE, REPORT_DIR), create_if_not_exists=True)
+    verified_songs = verified_store.VerifiedStore(file_utils.append_dir_to_file_name(VERIFIED_FILE, REPORT_DIR), verified_store.csv_keys)
 
     # Confronta i brani
-    found, partially_matched, not_found, verified_songs = compare_songs(navidrome_songs, csv_songs, verified_songs, False)
+    found, partially_matched, not_found, verified_songs = compare_songs(navidrome_songs, csv_songs, verified_songs, False, workers=args.workers)
 
     # Salva i report in formato JSON e leggibile
     if found:
@@ -143,12 +158,14 @@ def main():
         save_readable_list(not_found, NOT_FOUND_LOG_FILE, found=False, output_dir=REPORT_DIR)
         save_not_found_list(not_found, NOT_FOUND_LIST_FILE, found=False, output_dir=REPORT_DIR)
         save_download_album_list(not_found, NOT_FOUND_DOWNLOAD_FILE, found=False, output_dir=REPORT_DIR)
-    if verified_songs:
-        json_utils.save_to_json_file(verified_songs, VERIFIED_FILE, REPORT_DIR) #No need to append because the file is read before.
+    # I brani verificati sono già stati aggiunti al journal di verified_songs durante il confronto
 
     logger.info(f"{len(found)} songs found. Saved in {FOUND_FILE} e {FOUND_LOG_FILE}.")
     logger.info(f"{len(partially_matched)} partial match songs. Saved in {PART_MATCH_FILE} e {PART_MATCH_LOG_FILE}.")
     logger.info(f"{len(not_found)} songs not found. Saved in {NOT_FOUND_FILE} e {NOT_FOUND_LOG_FILE}.")
+    if user_inputs.deferred_count():
+        logger.info(f"{user_inputs.deferred_count()} choices deferred. Resolve them with resolve-deferred-choices.py.")
+    utility.log_match_stats()
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -1,8 +1,16 @@
 import utility
+import compare_utils
+import song_index
+import user_inputs
+import verified_store
+import resident
+import music_service
 import sys
+import json
 import os
 import logging
 import time
+import argparse
 from datetime import datetime, timedelta
 
 sys.path.append('../')
@@ -27,39 +35,41 @@ NOT_FOUND_DOWNLOAD_FILE = "album_not_found_download.log"
 NOT_FOUND_LIST_FILE = "songs_not_found_list.log"
 PART_MATCH_LOG_FILE = "partially_matched.log"
 VERIFIED_FILE = "verified_songs.json"
+DEFERRED_FILE = "deferred_choices.jsonl"
+STATE_FILE = "compare_state.json"
 
 def is_verified(song, verified_songs):
-    """Controlla se il brano è già verificato."""
-    if "id" in song and song["id"]:
-        return any(song["id"] == verified["id"] for verified in verified_songs)
-    else:
-        return any(
-            song["name"] == verified["name"] and 
-            song["artists"][0]["name"] == verified["artists"][0]["name"] and 
-            song["album"] == verified["album"] 
-            for verified in verified_songs
-        )
+    """Controlla se il brano è già verificato (per id o per titolo, primo artista e album)."""
+    return song in verified_songs
     
-def compare_songs(navidrome_songs, spotify_songs, verified_songs, simple_match=True):
+def compare_songs(navidrome_songs, spotify_songs, verified_songs, simple_match=True, workers=1):
     """Confronta i brani tra Navidrome e Spotify."""
     found = []
     partially_matched = []
     not_found = []
 
-    for spotify_song in spotify_songs:
-        # Salta i brani già verificati
+    # Salta i brani già verificati
+    pending_songs = [song for song in spotify_songs if not is_verified(song, verified_songs)]
+    queries = [
+        (song["name"], [artist["name"] for artist in song["artists"]], utility.album_title_match(song["album"]))
+        for song in pending_songs
+    ]
+
+    # Searches run in input order (or in parallel with workers > 1), choices are made here
+    results = compare_utils.search_all(queries, navidrome_songs, workers=workers, library_file=NAVIDROME_FILE)
+
+    for spotify_song, (spotify_title, spotify_artists, spotify_album), (matches, partial_matches) in zip(pending_songs, queries, results):
+        # Duplicate of a song matched earlier in this run
         if is_verified(spotify_song, verified_songs):
-            #print(f'Salto brano già verificato: {spotify_song["artists"][0]["name"]} - {spotify_song["album"]} - {spotify_song["name"]}')
             continue
 
         logger.info(f"Comparing: {spotify_song['name']} - {spotify_song['artists'][0]['name']} - {spotify_song['album']}")
 
-        spotify_title = spotify_song["name"]
-        spotify_artists = [artist["name"] for artist in spotify_song["artists"]]
-        spotify_album = utility.album_title_match(spotify_song["album"])
-
         # Search in Navidrome (including album)
-        match = utility.find_song(spotify_title, spotify_artists, spotify_album, navidrome_songs, "navidrome", only_first_result=False, permit_choice=True, consider_album=True)
+        context = {"report_dir": REPORT_DIR, "source_key": "spotify", "source": spotify_song, "verified_file": VERIFIED_FILE,
+                   "part_match_file": PART_MATCH_FILE, "not_found_file": NOT_FOUND_FILE}
+        match = compare_utils.resolve_match(matches, spotify_title, spotify_artists, spotify_album,
+                                            context={**context, "report": FOUND_FILE})
 
         if match:
             logger.info("MATCHED!")
@@ -67,13 +77,14 @@ def compare_songs(navidrome_songs, spotify_songs, verified_songs, simple_match=T
                 "spotify": spotify_song,
                 "navidrome": match
             })
-            verified_songs.append(spotify_song)
+            verified_songs.add(spotify_song)
             continue
 
         # Second search (without album)
         logger.info("No match. Trying without album...")
 
-        partial_match = utility.find_song(spotify_title, spotify_artists, spotify_album, navidrome_songs, "navidrome", only_first_result=False, permit_choice=True, consider_album=False)
+        partial_match = compare_utils.resolve_match(partial_matches, spotify_title, spotify_artists, spotify_album,
+                                                    context={**context, "report": PART_MATCH_FILE})
         
         if partial_match:
             logger.info("PARTIALLY MATCHED!")
@@ -87,6 +98,67 @@ def compare_songs(navidrome_songs, spotify_songs, verified_songs, simple_match=T
 
     return found, partially_matched, not_found, verified_songs
 
+def spotify_key(song):
+    """Chiave stabile di un brano Spotify (id o titolo, primo artista e album)."""
+    return json.dumps(verified_store.spotify_keys(song)[0], ensure_ascii=False)
+
+def spotify_fields(song):
+    return [song["name"], [artist["name"] for artist in song["artists"]], song["album"]]
+
+def navidrome_fields(song):
+    return [song.get("title"), song.get("artist"), song.get("album")]
+
+def load_state():
+    """Hash degli snapshot Spotify e Navidrome dell'ultimo confronto (None se non c'è)."""
+    path = file_utils.append_dir_to_file_name(STATE_FILE, REPORT_DIR)
+    if not os.path.exists(path):
+        return None
+    return json_utils.load_json_data(path)
+
+def load_report(file_name):
+    path = file_utils.append_dir_to_file_name(file_name, REPORT_DIR)
+    if not os.path.exists(path):
+        return []
+    return json_utils.load_json_data(path) or []
+
+def select_incremental(spotify_songs, navidrome_songs, verified_songs, state, spotify_hashes, navidrome_hashes):
+    """
+    Sceglie i brani da riconfrontare rispetto all'ultimo confronto.
+
+    Restano validi i brani parzialmente trovati e non trovati dell'ultimo report se il brano
+    Spotify non è cambiato, se il brano Navidrome associato c'è ancora e se nessuno dei brani
+    aggiunti o modificati in Navidrome può corrispondere. Tutti gli altri brani non verificati
+    (nuovi, modificati o assenti dai report) vengono riconfrontati con l'intera libreria.
+    """
+    changed_spotify, _ = compare_utils.snapshot_diff(state.get("spotify", {}), spotify_hashes)
+    changed_navidrome, removed_navidrome = compare_utils.snapshot_diff(state.get("navidrome", {}), navidrome_hashes)
+    logger.info(f"Incremental compare: {len(changed_spotify)} Spotify songs new or changed, "
+                f"{len(changed_navidrome)} Navidrome songs new or changed, {len(removed_navidrome)} removed")
+
+    new_songs = [song for song in navidrome_songs if song["id"] in changed_navidrome]
+    new_index = song_index.SongIndex(new_songs, "navidrome") if new_songs else None
+
+    def still_valid(song):
+        key = spotify_key(song)
+        if key not in spotify_hashes or key in changed_spotify or song in verified_songs:
+            return False
+        # Candidati tra i brani nuovi di Navidrome: va riconfrontato
+        return new_index is None or not new_index.candidate_positions(
+            song["name"], [artist["name"] for artist in song["artists"]], fallback=False)
+
+    kept_partial = [entry for entry in load_report(PART_MATCH_FILE)
+                    if entry["navidrome"].get("id") not in removed_navidrome
+                    and entry["navidrome"].get("id") not in changed_navidrome
+                    and still_valid(entry["spotify"])]
+    kept_not_found = [song for song in load_report(NOT_FOUND_FILE) if still_valid(song)]
+
+    kept_keys = {spotify_key(entry["spotify"]) for entry in kept_partial} | {spotify_key(song) for song in kept_not_found}
+    to_compare = [song for song in spotify_songs if spotify_key(song) not in kept_keys]
+    return to_compare, kept_partial, kept_not_found
+
+def save_state(spotify_hashes, navidrome_hashes):
+    json_utils.save_to_json_file({"spotify": spotify_hashes, "navidrome": navidrome_hashes}, STATE_FILE, REPORT_DIR)
+
 def save_readable_list(data, file_path, found=True, output_dir=None):
     """Salva una lista leggibile dei brani in un file di testo."""
     file_path = file_utils.append_dir_to_file_name(file_path, output_dir)
@@ -128,34 +200,70 @@ def save_not_found_list(data, file_path, found=False, output_dir=None):
             )
 
 def main():
+    parser = argparse.ArgumentParser(description='Confronta i brani preferiti di Spotify e Navidrome')
+    parser.add_argument('--defer-choices', action='store_true',
+                        help=f'Non chiedere le scelte ambigue: accodale in {DEFERRED_FILE} (vedi resolve-deferred-choices.py)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Numero di processi per la ricerca dei brani')
+    parser.add_argument('--incremental', '-i', action='store_true',
+                        help=f'Riconfronta solo i brani cambiati rispetto all\'ultimo confronto (vedi {STATE_FILE})')
+    args = parser.parse_args()
+
+    if args.defer_choices:
+        user_inputs.set_deferred_mode(file_utils.append_dir_to_file_name(DEFERRED_FILE, REPORT_DIR))
+
     # Carica i dati
-    navidrome_songs = json_utils.load_json_data(NAVIDROME_FILE)
-    spotify_songs = json_utils.load_json_data(SPOTIFY_FILE)
-    verified_songs = json_utils.load_json_data(file_utils.append_dir_to_file_name(VERIFIED_FILE, REPORT_DIR), create_if_not_exists=True)
+    # Con il servizio residente i file vengono riletti solo se sono cambiati
+    navidrome_songs = resident.keep(("json", NAVIDROME_FILE), lambda: json_utils.load_json_data(NAVIDROME_FILE), resident.file_version(NAVIDROME_FILE))
+    spotify_songs = resident.keep(("json", SPOTIFY_FILE), lambda: json_utils.load_json_data(SPOTIFY_FILE), resident.file_version(SPOTIFY_FILE))
+    verified_songs = verified_store.VerifiedStore(file_utils.append_dir_to_file_name(VERIFIED_FILE, REPORT_DIR), verified_store.spotify_keys)
+
+    spotify_hashes = compare_utils.snapshot_hashes(spotify_songs, spotify_key, spotify_fields)
+    navidrome_hashes = compare_utils.snapshot_hashes(navidrome_songs, lambda song: song["id"], navidrome_fields)
+
+    # In modalità incrementale confronta solo i brani cambiati, gli altri restano nei report
+    state = load_state() if args.incremental else None
+    if args.incremental and state is None:
+        logger.info(f"No previous state in {STATE_FILE}: comparing all songs")
+    songs_to_compare, kept_partial, kept_not_found = spotify_songs, [], []
+    if state is not None:
+        songs_to_compare, kept_partial, kept_not_found = select_incremental(
+            spotify_songs, navidrome_songs, verified_songs, state, spotify_hashes, navidrome_hashes)
+        logger.info(f"{len(kept_partial) + len(kept_not_found)} songs unchanged since the last compare")
 
     # Confronta i brani
-    found, partially_matched, not_found, verified_songs = compare_songs(navidrome_songs, spotify_songs, verified_songs, False)
+    found, partially_matched, not_found, verified_songs = compare_songs(navidrome_songs, songs_to_compare, verified_songs, False, workers=args.workers)
+    partially_matched = kept_partial + partially_matched
+    not_found = kept_not_found + not_found
 
     # Salva i report in formato JSON e leggibile
     if found:
         json_utils.save_to_json_file(found, FOUND_FILE, REPORT_DIR, append=True)
         save_readable_list(found, FOUND_LOG_FILE, found=True, output_dir=REPORT_DIR)
-    if partially_matched:
+    # In modalità incrementale i report vanno riscritti anche se vuoti, altrimenti verrebbero ripresi
+    if partially_matched or args.incremental:
         json_utils.save_to_json_file(partially_matched, PART_MATCH_FILE, REPORT_DIR)
         save_readable_list(partially_matched, PART_MATCH_LOG_FILE, found=True, output_dir=REPORT_DIR)
-    if not_found:
+    if not_found or args.incremental:
         json_utils.save_to_json_file(not_found, NOT_FOUND_FILE, REPORT_DIR)
         save_readable_list(not_found, NOT_FOUND_LOG_FILE, found=False, output_dir=REPORT_DIR)
         save_not_found_list(not_found, NOT_FOUND_LIST_FILE, found=False, output_dir=REPORT_DIR)
         save_download_album_list(not_found, NOT_FOUND_DOWNLOAD_FILE, found=False, output_dir=REPORT_DIR)
-    if verified_songs:
-        json_utils.save_to_json_file(verified_songs, VERIFIED_FILE, REPORT_DIR) #No need to append because the file is read before.
+    # I brani verificati sono già stati aggiunti al journal di verified_songs durante il confronto
+    save_state(spotify_hashes, navidrome_hashes)
 
     logger.info(f"{len(found)} songs found. Saved in {FOUND_FILE} e {FOUND_LOG_FILE}.")
     logger.info(f"{len(partially_matched)} partial match songs. Saved in {PART_MATCH_FILE} e {PART_MATCH_LOG_FILE}.")
     logger.info(f"{len(not_found)} songs not found. Saved in {NOT_FOUND_FILE} e {NOT_FOUND_LOG_FILE}.")
+    if user_inputs.deferred_count():
+        logger.info(f"{user_inputs.deferred_count()} choices deferred. Resolve them with resolve-deferred-choices.py.")
+    utility.log_match_stats()
 
 if __name__ == "__main__":
+    # Con il servizio residente avviato (music-service.py) il comando viene eseguito lì
+    exit_code = music_service.run_in_service(__file__)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     start_time = time.time()
     start_datetime = datetime.now()
     
@@ -0,0 +1,104 @@
+import json
+import os
+import hashlib
+import logging
+import multiprocessing
+
+import utility
+import user_inputs
+import song_index
+import resident
+
+logger = logging.getLogger(__name__)
+
+# Library shared with the worker processes, loaded once per worker
+_worker_songs = None
+_worker_index = None
+
+
+def search_matches(title, artists, album, navidrome_songs, index=None):
+    """
+    Best Navidrome matches of a song with and without album, without asking the user.
+
+    Both come from a single scoring pass. The album-agnostic matches are only returned when
+    the album-aware search did not find a single match, i.e. when the compare falls back to
+    them (no match or a choice to skip).
+    """
+    matches, partial_matches = utility.find_best_matches_by_album(title, artists, album, navidrome_songs,
+                                                                  "navidrome", index=index)
+    if len(matches) == 1:
+        partial_matches = []
+    return matches, partial_matches
+
+
+def resolve_match(best_matches, title, artists, album, context=None):
+    """
+    Same result as utility.find_song with permit_choice=True on the given best matches.
+
+    context is stored with the case when choices are deferred (see user_inputs.set_deferred_mode).
+    """
+    if len(best_matches) > 1:
+        with user_inputs.deferred_context(**(context or {})):
+            return utility.choose_match(best_matches, title, artists, album, "navidrome")
+    return best_matches[0] if best_matches else []
+
+
+def _init_worker(navidrome_songs):
+    global _worker_songs, _worker_index
+    _worker_songs = navidrome_songs
+    _worker_index = song_index.SongIndex(navidrome_songs, "navidrome")
+
+
+def _search_worker(query):
+    title, artists, album = query
+    result = search_matches(title, artists, album, _worker_songs, _worker_index)
+    # Scoring counters of this query, merged into the parent ones
+    stats = dict(utility.MATCH_STATS)
+    utility.MATCH_STATS.clear()
+    return result, stats
+
+
+def search_all(queries, navidrome_songs, workers=1, chunk_size=None, library_file=None):
+    """
+    Yields search_matches results for each (title, artists, album) query, in input order.
+
+    With more than one worker the queries are spread over a process pool; the library is
+    handed to each worker once (inherited with fork) and indexed there. library_file is the
+    snapshot navidrome_songs was loaded from: the resident service reuses the index until it changes.
+    """
+    if workers <= 1 or len(queries) < 2:
+        build = lambda: song_index.SongIndex(navidrome_songs, "navidrome")
+        if library_file:
+            index = resident.keep("compare.index", build, (os.path.abspath(library_file), resident.file_version(library_file)))
+        else:
+            index = build()
+        for title, artists, album in queries:
+            yield search_matches(title, artists, album, navidrome_songs, index)
+        return
+
+    if chunk_size is None:
+        chunk_size = max(1, min(64, len(queries) // (workers * 4)))
+
+    logger.info(f"Searching {len(queries)} songs with {workers} workers (chunks of {chunk_size})")
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(navidrome_songs,)) as pool:
+        # imap keeps the input order: the merge is the same as in a serial run
+        for result, stats in pool.imap(_search_worker, queries, chunksize=chunk_size):
+            utility.add_match_stats(stats)
+            yield result
+
+
+def content_hash(item):
+    """Stable hash of a JSON-serializable item."""
+    return hashlib.sha1(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def snapshot_hashes(items, key, fields):
+    """Content hash of the matching fields of each item of a snapshot, by item key."""
+    return {key(item): content_hash(fields(item)) for item in items}
+
+
+def snapshot_diff(previous, current):
+    """Keys added or changed and keys removed between two snapshot_hashes results."""
+    changed = {key for key, digest in current.items() if previous.get(key) != digest}
+    removed = set(previous) - set(current)
+    return changed, removed
@@ -1,4 +1,5 @@
 import csv
+import verified_store
 import sys
 import os
 import logging
@@ -19,7 +20,7 @@ VERIFIED_SONGS_FILE = "verified_songs.json"
 MATCHES_CSV_FILE = "manual-merge.csv"  # Il tuo file CSV con le corrispondenze
 
 def update_verified_songs(songs_not_found, verified_songs, matches):
-    """Aggiungi le corrispondenze verificate al file verified_songs.json."""
+    """Aggiungi le corrispondenze verificate ai brani verificati."""
     for match in matches:
         spotify_id = match["id_song_spotify"]
         navidrome_id = match["id_song_navidrome"]
@@ -29,7 +30,7 @@ def update_verified_songs(songs_not_found, verified_songs, matches):
 
         if song_to_verify:
             print(f"✅ Trovata corrispondenza verificata: Spotify ID {spotify_id}, Navidrome ID {navidrome_id}")
-            verified_songs.append(song_to_verify.get("spotify", {}))
+            verified_songs.add(song_to_verify.get("spotify", {}))
         else:
             print(f"⚠️ Spotify ID {spotify_id} non trovato in songs_not_found.")
 
@@ -47,14 +48,13 @@ def load_csv_matches(csv_file):
 def main():
     # Carica i file JSON
     songs_not_found = json_utils.load_json_data(file_utils.append_dir_to_file_name(SONGS_NOT_FOUND_FILE, REPORT_DIR))
-    verified_songs = json_utils.load_json_data(file_utils.append_dir_to_file_name(VERIFIED_SONGS_FILE, REPORT_DIR))
+    verified_songs = verified_store.VerifiedStore(file_utils.append_dir_to_file_name(VERIFIED_SONGS_FILE, REPORT_DIR))
 
     # Carica le corrispondenze dal CSV
     matches = load_csv_matches(file_utils.append_dir_to_file_name(MATCHES_CSV_FILE, REPORT_DIR))
 
-    # Aggiorna il file verified_songs.json
-    updated_verified_songs = update_verified_songs(songs_not_found, verified_songs, matches)
-    json_utils.save_to_json_file(updated_verified_songs, VERIFIED_SONGS_FILE, REPORT_DIR, append=False)
+    # Aggiorna i brani verificati (aggiunti in coda al journal di verified_songs)
+    update_verified_songs(songs_not_found, verified_songs, matches)
 
     print(f"Aggiornato il file {VERIFIED_SONGS_FILE} con {len(matches)} corrispondenze.")
 
@@ -0,0 +1,41 @@
+import sys
+import os
+import logging
+import argparse
+
+import music_service
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import log_utils
+
+logger = log_utils.setup_logging(os.path.basename(__file__), logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description='Servizio residente: sessione Navidrome, client Spotify, libreria e indici restano caricati tra un comando e l\'altro')
+    parser.add_argument('command', nargs='?', default='start', choices=['start', 'status', 'stop'],
+                        help='start: avvia il servizio (default), status: mostra lo stato, stop: ferma il servizio')
+    args = parser.parse_args()
+
+    if music_service.AUTHKEY is None:
+        logger.error("MUSIC_SERVICE_KEY is not set (.env): the service needs a secret shared with the scripts")
+        return
+
+    if args.command == 'start':
+        try:
+            music_service.serve()
+        except KeyboardInterrupt:
+            logger.info("Service stopped")
+        return
+
+    answer = music_service.send_command(args.command)
+    if answer is None:
+        logger.info(f"No service running on {music_service.ADDRESS}")
+    elif args.command == 'status':
+        logger.info(f"Service running (pid {answer['pid']}): {answer['jobs']} jobs, kept: {', '.join(answer['kept']) or '-'}")
+    else:
+        logger.info("Service stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import sys
+import runpy
+import getpass
+import hashlib
+import logging
+import builtins
+import tempfile
+import traceback
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from dotenv import load_dotenv
+
+import resident
+import user_inputs
+import utility
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Local socket (named pipe on Windows) of the service, reachable only by this user
+if sys.platform == "win32":
+    DEFAULT_ADDRESS = rf"\\.\pipe\music-tools-{getpass.getuser()}"
+else:
+    DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), f"music-tools-{getpass.getuser()}.sock")
+ADDRESS = os.getenv("MUSIC_SERVICE_ADDRESS", DEFAULT_ADDRESS)
+# MUSIC_SERVICE=0: the scripts always run on their own
+ENABLED = os.getenv("MUSIC_SERVICE", "1") != "0"
+# Shared secret of service and scripts: without it the service does not start and the scripts run on their own
+SERVICE_KEY = os.getenv("MUSIC_SERVICE_KEY")
+AUTHKEY = hashlib.sha256(f"music-tools:{SERVICE_KEY}".encode("utf-8")).digest() if SERVICE_KEY else None
+
+# Only the scripts of this folder can be run by the service
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+# Client
+
+def run_in_service(script_file, address=ADDRESS):
+    """
+    Runs the script in the service, if one is running, with the same arguments and folder.
+
+    Logs and prints are shown here and input() prompts are answered from here.
+    Returns the exit code of the job, or None if there is no service (or this already
+    is the service): the script then runs on its own.
+    """
+    if not ENABLED or resident.ACTIVE or AUTHKEY is None:
+        return None
+    try:
+        connection = Client(address, authkey=AUTHKEY)
+    except (OSError, AuthenticationError):
+        return None
+
+    with connection:
+        connection.send(("run", os.path.abspath(script_file), sys.argv[1:], os.getcwd()))
+        while True:
+            try:
+                kind, value = connection.recv()
+            except EOFError:
+                print("Servizio interrotto durante l'esecuzione", file=sys.stderr)
+                return 1
+            if kind == "log":
+                print(value, file=sys.stderr, flush=True)
+            elif kind == "stdout":
+                sys.stdout.write(value)
+                sys.stdout.flush()
+            elif kind == "input":
+                try:
+                    answer = input(value)
+                except EOFError:
+                    answer = None
+                connection.send(("input", answer))
+            elif kind == "exit":
+                return value
+
+
+def send_command(command, address=ADDRESS):
+    """Sends 'status' or 'stop' to the service; returns its answer, None if it is not running."""
+    if AUTHKEY is None:
+        return None
+    try:
+        connection = Client(address, authkey=AUTHKEY)
+    except (OSError, AuthenticationError):
+        return None
+    with connection:
+        connection.send((command,))
+        return connection.recv()[1]
+
+
+# Service
+
+class _ConnectionHandler(logging.Handler):
+    """Sends the log records of a job to its client."""
+
+    def __init__(self, connection):
+        super().__init__()
+        self.connection = connection
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record):
+        try:
+            self.connection.send(("log", self.format(record)))
+        except (OSError, ValueError):
+            pass  # Client gone: the job keeps going, its log is still in the service output
+
+
+class _ConnectionWriter:
+    """sys.stdout of a job: prints go to the client."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def write(self, text):
+        if text:
+            self.connection.send(("stdout", text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _remote_input(connection):
+    def ask(prompt=""):
+        connection.send(("input", str(prompt)))
+        _, answer = connection.recv()
+        if answer is None:
+            raise EOFError
+        return answer
+    return ask
+
+
+def _reset_job_state():
+    """Module state that a job must not inherit from the previous ones."""
+    # choose_user.py may have switched user: the settings read by the job come from the current .env
+    load_dotenv(override=True)
+    user_inputs.reset_state()
+    utility.MATCH_STATS.clear()
+
+
+def _run_job(connection, script, argv, cwd):
+    """Runs a script as __main__ in this process; returns its exit code."""
+    script = os.path.abspath(script)
+    if os.path.dirname(script) != SCRIPTS_DIR or not script.endswith(".py"):
+        logger.warning(f"Rejected job: {script}")
+        return 2
+
+    saved = (sys.argv, list(sys.path), os.getcwd(), sys.stdout, builtins.input)
+    handler = _ConnectionHandler(connection)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    sys.argv = [script, *argv]
+    sys.stdout = _ConnectionWriter(connection)
+    builtins.input = _remote_input(connection)
+    code = 0
+    try:
+        os.chdir(cwd)
+        _reset_job_state()
+        logger.info(f"▶️ Job: {os.path.basename(script)} {' '.join(argv)}")
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+        logger.error(f"Client disconnected: {e}")
+        code = 1
+    except Exception:
+        logger.error(f"Job failed:\n{traceback.format_exc()}")
+        code = 1
+    finally:
+        root.removeHandler(handler)
+        sys.argv, sys.path[:], _, sys.stdout, builtins.input = saved
+        os.chdir(saved[2])
+    return code
+
+
+def serve(address=ADDRESS):
+    """Runs jobs sent by the scripts, one at a time, until stopped (Ctrl+C or send_command('stop'))."""
+    if AUTHKEY is None:
+        raise RuntimeError("MUSIC_SERVICE_KEY is not set: the service needs a secret shared with the scripts")
+    resident.ACTIVE = True
+    if sys.platform != "win32" and os.path.exists(address):
+        if send_command("status", address) is not None:
+            raise RuntimeError(f"Service already running on {address}")
+        os.unlink(address)  # Left by a service that did not stop cleanly
+
+    with Listener(address, authkey=AUTHKEY) as listener:
+        if sys.platform != "win32":
+            os.chmod(address, 0o600)
+        logger.info(f"🎧 Service listening on {address}")
+        jobs = 0
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                logger.warning(f"Connection refused: {e}")
+                continue
+            with connection:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    continue
+                if message[0] == "run":
+                    code = _run_job(connection, *message[1:])
+                    jobs += 1
+                    try:
+                        connection.send(("exit", code))
+                    except OSError:
+                        pass
+                    logger.info(f"⏹️ Job finished with code {code} ({jobs} jobs, kept: {', '.join(map(str, resident.kept())) or '-'})")
+                elif message[0] == "status":
+                    connection.send(("status", {"pid": os.getpid(), "jobs": jobs, "kept": [str(key) for key in resident.kept()]}))
+                elif message[0] == "stop":
+                    connection.send(("stop", True))
+                    logger.info("Service stopped")
+                    return
@@ -2,7 +2,10 @@ import utility
 import sys
 import os
 import logging
+import argparse
 import navidrome
+import navidrome_mirror
+import music_service
 import time
 from datetime import datetime, timedelta
 
@@ -45,7 +48,7 @@ def write_partial_matches(file_path, source_track, founded_tracks, input_service
                 )
         file.write("\n")
 
-def main(source_file_path, input_service):
+def main(source_file_path, input_service, offline=False):
     logger.info(f"Processing file: {source_file_path} (service={input_service})")
 
     # Carica i dati
@@ -54,11 +57,21 @@ def main(source_file_path, input_service):
     # Autenticazione a Navidrome
     session = navidrome.authenticate()
 
+    # Ricerche: una richiesta per brano, oppure nessuna con la copia locale della libreria
+    if offline:
+        mirror = navidrome_mirror.open_mirror(session)
+        search_song = lambda artists, album, title: navidrome_mirror.search_song(mirror, artists, album, title)
+        get_song_by_id = mirror.get_song_by_id
+    else:
+        search_song = lambda artists, album, title: navidrome.search_song(session, artists, album, title)
+        get_song_by_id = lambda song_id: navidrome.get_song_by_id(session, song_id)
+
     # Contatori per il riepilogo
     added_to_favorites_count = 0
     partial_matches_count = 0
 
-    # Cerca e aggiorna i preferiti
+    # Cerca i brani, poi li aggiunge ai preferiti tutti insieme (più brani per richiesta)
+    songs_to_star = []
     id = None
     for song in songs_to_add:
         if input_service=='spotify':
@@ -76,16 +89,16 @@ def main(source_file_path, input_service):
         # Cerca il brano esatto su Navidrome
         if id:
             try:
-                match = [navidrome.get_song_by_id(session, id)]
+                match = [get_song_by_id(id)]
             except ValueError:
                 logger.info("Song not found by ID, trying searching...")
-                match = navidrome.search_song(session, artists, album, title)
+                match = search_song(artists, album, title)
         else:
-            match = navidrome.search_song(session, artists, album, title)
+            match = search_song(artists, album, title)
 
         if match:
             logger.info(f"Trovato brano per {title} - {artists} ({album}).")
-            navidrome.add_to_favorites(session, [match])
+            songs_to_star.extend(match if isinstance(match, list) else [match])
             added_to_favorites_count += 1
             continue
         else:
@@ -101,12 +114,26 @@ def main(source_file_path, input_service):
 #        else:
 #            logger.info(f"Nessun brano trovato per {title} - {artists} ({album}).")
     
+    reports = navidrome.add_to_favorites(session, songs_to_star)
+    failed = navidrome.failed_ids(reports)
+    added_to_favorites_count -= len(failed)
+
     # Riepilogo
     logger.info("\n--- Riepilogo ---")
     logger.info(f"Brani aggiunti ai preferiti: {added_to_favorites_count}")
 #    logger.info(f"Partial match trovati: {partial_matches_count}")
 
 if __name__ == "__main__":
+    # Con il servizio residente avviato (music-service.py) il comando viene eseguito lì
+    exit_code = music_service.run_in_service(__file__)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    parser = argparse.ArgumentParser(description='Aggiunge ai preferiti di Navidrome i brani di un file')
+    parser.add_argument('--offline', action='store_true',
+                        help='Cerca i brani nella copia locale della libreria (navidrome_mirror.py) invece di una richiesta per brano')
+    args = parser.parse_args()
+
     default_source_file = "compare_report/songs_not_found.json"
     source_file_path = input(f"Enter the path to your source file (default: {default_source_file}): ").strip()
     if not source_file_path:
@@ -120,7 +147,7 @@ if __name__ == "__main__":
     
     logger.info(f"🚀 Start time: {start_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    main(source_file_path, input_service)
+    main(source_file_path, input_service, args.offline)
 
     end_time = time.time()
     end_datetime = datetime.now()
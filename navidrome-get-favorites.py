@@ -1,7 +1,9 @@
 import navidrome
+import navidrome_db
 import os
 import sys
 import time
+import argparse
 from datetime import datetime, timedelta
 
 sys.path.append('../')
@@ -12,20 +14,30 @@ from common_py_utils import json_utils, log_utils
 PLAYLIST_NAME = "Brani preferiti"
 logger = log_utils.setup_logging(os.path.basename(__file__))
 
-def get_starred_songs(session):
+def get_starred_songs(session, db_path=None):
     """Recupera tutti i brani preferiti."""
+    # Dal database di Navidrome (sola lettura), se indicato
+    if db_path:
+        with navidrome_db.open_database(db_path) as database:
+            return database.get_starred()
+
     # Ottieni tutti i brani
     starred_songs = navidrome.get_starred(session)
     
     return starred_songs
 
 def main():
+    parser = argparse.ArgumentParser(description='Salva i brani preferiti di Navidrome')
+    parser.add_argument('--db', nargs='?', const=navidrome_db.DEFAULT_DB, default=None,
+                        help='Legge i preferiti direttamente dal database di Navidrome (sola lettura, default: NAVIDROME_DB)')
+    args = parser.parse_args()
+
     # Authentication
     session = navidrome.authenticate()
 
     try:
         # Ottieni i brani preferiti
-        starred_songs = get_starred_songs(session)
+        starred_songs = get_starred_songs(session, args.db)
         logger.info(f"Trovati {len(starred_songs)} brani preferiti")
 
         # Save data to file
@@ -1,4 +1,6 @@
 import navidrome
+import navidrome_async
+import music_service
 import os
 import sys
 import time
@@ -12,6 +14,10 @@ from common_py_utils import json_utils, log_utils
 
 logger = log_utils.setup_logging(os.path.basename(__file__))
 
+OUTPUT_DIR = "navidrome-playlists"
+# changed/songCount di ogni playlist all'ultima esportazione: le playlist invariate non vengono riscaricate
+EXPORT_STATE_FILE = "playlists_export_state.json"
+
 def get_playlist_by_name(session, playlists, name):
     """Finds a playlist by name."""
     for playlist in playlists:
@@ -19,24 +25,69 @@ def get_playlist_by_name(session, playlists, name):
             return playlist
     raise ValueError(f"Playlist '{name}' not found.")
 
-def show_all_playlists(session, playlists):
-    """Mostra tutte le playlist disponibili e le salva in file JSON separati."""
+def load_export_state():
+    path = os.path.join(OUTPUT_DIR, EXPORT_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    return json_utils.load_json_data(path)
+
+def save_atomically(data, file_name):
+    """Scrive il file JSON in un file temporaneo e lo sostituisce all'originale: un'interruzione non lascia file a metà."""
+    temp_name = f".{file_name}.tmp"
+    temp_path = os.path.join(OUTPUT_DIR, temp_name)
+    try:
+        json_utils.save_to_json_file(data, temp_name, OUTPUT_DIR)
+        os.replace(temp_path, os.path.join(OUTPUT_DIR, file_name))
+    except BaseException:
+        # Anche con Ctrl+C: il file temporaneo non deve restare in OUTPUT_DIR
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def export_fingerprint(playlist):
+    return {"changed": playlist.get("changed"), "songCount": playlist.get("songCount"), "file": playlist["name"] + ".json"}
+
+def is_unchanged(playlist, state):
+    """True se la playlist non è cambiata dall'ultima esportazione e il suo file c'è ancora."""
+    fingerprint = export_fingerprint(playlist)
+    return (state.get(playlist["id"]) == fingerprint
+            and os.path.exists(os.path.join(OUTPUT_DIR, fingerprint["file"])))
+
+def show_all_playlists(session, playlists, force=False):
+    """
+    Mostra tutte le playlist disponibili e le salva in file JSON separati.
+
+    Sono scaricate (in parallelo) solo le playlist il cui changed/songCount è diverso
+    dall'ultima esportazione, o tutte con force.
+    """
+    state = {} if force else load_export_state()
     logger.info("Playlist disponibili:")
+    to_export = []
     for playlist in playlists:
-        logger.info(f"- {playlist['name']} (ID: {playlist['id']})")
-        
-        # Ottieni e salva le canzoni per ogni playlist
-        try:
-            entries = navidrome.get_playlist_songs(session, playlist["id"])
-            logger.info(f"  ↳ {len(entries)} brani trovati")
-            json_utils.save_to_json_file(entries, playlist['name']+".json", "navidrome-playlists")
-        except Exception as e:
-            logger.error(f"  ↳ Errore nel recupero della playlist {playlist['name']}: {e}")
+        unchanged = is_unchanged(playlist, state)
+        logger.info(f"- {playlist['name']} (ID: {playlist['id']}){' invariata' if unchanged else ''}")
+        if not unchanged:
+            to_export.append(playlist)
+
+    # Ottieni e salva le canzoni delle playlist cambiate
+    results = navidrome_async.get_playlists_songs(session, [playlist["id"] for playlist in to_export])
+    new_state = {playlist["id"]: export_fingerprint(playlist) for playlist in playlists if is_unchanged(playlist, state)}
+    for playlist, entries in zip(to_export, results):
+        if isinstance(entries, Exception):
+            logger.error(f"  ↳ Errore nel recupero della playlist {playlist['name']}: {entries}")
+            continue
+        logger.info(f"  ↳ {playlist['name']}: {len(entries)} brani trovati")
+        save_atomically(entries, playlist['name'] + ".json")
+        new_state[playlist["id"]] = export_fingerprint(playlist)
+
+    save_atomically(new_state, EXPORT_STATE_FILE)
+    logger.info(f"{len(to_export)} playlist esportate, {len(playlists) - len(to_export)} invariate")
 
 def main():
     # Configurazione degli argomenti da riga di comando
     parser = argparse.ArgumentParser(description='Ottieni le canzoni da una playlist Navidrome')
     parser.add_argument('--playlist', '-p', help='Nome della playlist da recuperare')
+    parser.add_argument('--force', '-f', action='store_true', help='Esporta di nuovo tutte le playlist, anche quelle invariate')
     args = parser.parse_args()
 
     # Authentication
@@ -47,7 +98,7 @@ def main():
         navidrome_playlists = navidrome.get_playlists(session)
         
         if not args.playlist:
-            show_all_playlists(session, navidrome_playlists)
+            show_all_playlists(session, navidrome_playlists, args.force)
             return
 
         requested_playlist = get_playlist_by_name(session, navidrome_playlists, args.playlist)
@@ -58,12 +109,17 @@ def main():
         logger.info(f"{len(entries)} tracks found in playlist.")
 
         # Save data to file
-        json_utils.save_to_json_file(entries, args.playlist+".json", "navidrome-playlists")
+        save_atomically(entries, args.playlist+".json")
 
     except Exception as e:
         logger.error(f"Error: {e}")
 
 if __name__ == "__main__":
+    # Con il servizio residente avviato (music-service.py) il comando viene eseguito lì
+    exit_code = music_service.run_in_service(__file__)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     start_time = time.time()
     start_datetime = datetime.now()
     
@@ -0,0 +1,47 @@
+import sys
+import os
+import logging
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import navidrome
+import navidrome_mirror
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import log_utils
+
+logger = log_utils.setup_logging(os.path.basename(__file__), logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggiorna la copia locale (SQLite) della libreria Navidrome')
+    parser.add_argument('--db', default=navidrome_mirror.DEFAULT_DB, help=f'File del database (default: {navidrome_mirror.DEFAULT_DB})')
+    parser.add_argument('--full', action='store_true', help='Scarica di nuovo tutti i brani')
+    args = parser.parse_args()
+
+    session = navidrome.authenticate()
+    with navidrome_mirror.NavidromeMirror(args.db) as mirror:
+        mirror.refresh(session, full=args.full)
+        logger.info(f"Brani: {len(mirror.get_all_songs())}, preferiti: {len(mirror.get_starred())}, "
+                    f"album: {len(mirror.get_albums())}, playlist: {len(mirror.get_playlists())}")
+
+if __name__ == "__main__":
+    start_time = time.time()
+    start_datetime = datetime.now()
+    
+    logger.info(f"🚀 Start time: {start_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    main()
+
+    end_time = time.time()
+    end_datetime = datetime.now()
+    duration = timedelta(seconds=int(end_time - start_time))
+    
+    hours = duration.seconds // 3600
+    minutes = (duration.seconds % 3600) // 60
+    seconds = duration.seconds % 60
+    
+    logger.info(f"✅ End time: {end_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"⏱️ Duration: {hours} hours, {minutes} minutes, {seconds} seconds")
@@ -12,6 +12,9 @@ from common_py_utils import file_utils, json_utils, log_utils
 
 logger = log_utils.setup_logging(os.path.basename(__file__), logging.DEBUG)
 
+# Brani non ancora rimossi (vedi navidrome.MutationQueue): un'esecuzione interrotta riprende da qui
+WRITES_JOURNAL = "navidrome-playlists/pending_unstar.jsonl"
+
 def main(source_file_path):
     logger.info(f"Processing file: {source_file_path}")
 
@@ -21,13 +24,15 @@ def main(source_file_path):
     # Autenticazione a Navidrome
     session = navidrome.authenticate()
 
-    # Contatori per il riepilogo
-    removed_from_favorites_count = 0
-
-    # Rimuovi dai preferiti
+    # Rimuovi dai preferiti (più brani per richiesta)
+    writes = navidrome.MutationQueue(session, journal=WRITES_JOURNAL)
     for song in songs_to_remove:
-        navidrome.remove_from_favorites(session, song['id'])
-        removed_from_favorites_count += 1            
+        writes.unstar(song['id'])
+    queued = len(writes)
+    failed = writes.flush()
+    removed_from_favorites_count = queued - len(failed)
+    if failed:
+        logger.error(f"Brani non rimossi dai preferiti: {len(failed)}")
 
     logger.info("\n--- Riepilogo ---")
     logger.info(f"Brani rimossi dai preferiti: {removed_from_favorites_count}")
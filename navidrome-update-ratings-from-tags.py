@@ -7,7 +7,12 @@ Legge i tag SPOTIFY_POPULARITY dai file audio e aggiorna le stelline su Navidrom
 import sys
 import os
 import logging
+import argparse
 import navidrome
+import navidrome_mirror
+import navidrome_db
+import resident
+import music_service
 import tags_utils
 import time
 from datetime import datetime, timedelta
@@ -21,6 +26,9 @@ from common_py_utils import log_utils
 logger = log_utils.setup_logging(os.path.basename(__file__), logging.DEBUG)
 base_path = "M:/"
 
+# Rating non ancora inviati (vedi navidrome.MutationQueue): un'esecuzione interrotta riprende da qui
+WRITES_JOURNAL = "navidrome-playlists/pending_ratings.jsonl"
+
 def convert_popularity_to_rating(popularity):
     """
     Converte la popolarità Spotify (0-100) in rating a stelle (1-5)
@@ -77,6 +85,13 @@ def find_audio_file_path(song):
 
 def main():
     """Funzione principale"""
+    parser = argparse.ArgumentParser(description='Aggiorna i rating di Navidrome dai tag SPOTIFY_POPULARITY')
+    parser.add_argument('--mirror', action='store_true',
+                        help=f'Legge i brani dalla copia locale della libreria ({navidrome_mirror.DEFAULT_DB}), aggiornata in modo incrementale')
+    parser.add_argument('--db', nargs='?', const=navidrome_db.DEFAULT_DB, default=None,
+                        help='Legge i brani direttamente dal database di Navidrome (sola lettura, default: NAVIDROME_DB); i rating vengono comunque scritti tramite API')
+    args = parser.parse_args()
+
     logger.info("🎵 Avvio aggiornamento rating Navidrome da tag Spotify Popularity")
     
     start_time = time.time()
@@ -90,7 +105,18 @@ def main():
         
         # Recupera tutti i brani
         logger.info("Recupero tutti i brani da Navidrome...")
-        all_songs = navidrome.get_all_songs(session)
+        if args.db:
+            with navidrome_db.open_database(args.db) as database:
+                all_songs = database.get_all_songs()
+        elif args.mirror:
+            with navidrome_mirror.open_mirror(session) as mirror:
+                all_songs = mirror.get_all_songs()
+        else:
+            # Con il servizio residente la libreria viene riscaricata solo dopo una nuova scansione (o con un altro utente)
+            scan_status = navidrome.get_scan_status(session)
+            all_songs = resident.keep("navidrome.songs", lambda: navidrome.get_all_songs(session),
+                                      (navidrome.NAVIDROME_URL, navidrome.USERNAME,
+                                       scan_status.get("lastScan"), scan_status.get("count")))
         
         if not all_songs:
             logger.warning("Nessun brano trovato su Navidrome")
@@ -108,7 +134,8 @@ def main():
         
         logger.info(f"Trovati {stats['total_songs']} brani su Navidrome")
         
-        # Processa ogni brano
+        # Processa ogni brano (i rating vengono inviati tutti insieme alla fine)
+        updates = []
         for i, song in enumerate(all_songs, 1):
             try:
                 song_title = song.get('title', 'Unknown')
@@ -137,23 +164,27 @@ def main():
                 
                 # Converte in rating
                 rating = convert_popularity_to_rating(popularity)
-                
-                # Aggiorna il rating su Navidrome
-                if navidrome.set_song_rating(session, song_id, rating):
-                    stats['ratings_updated'] += 1
-                    logger.info(f"✅ Rating aggiornato: {song_artist} - {song_title} | Popularity: {popularity} → Rating: {rating} stelle")
-                else:
-                    stats['errors'] += 1
-                    logger.error(f"❌ Errore aggiornamento: {song_artist} - {song_title}")
-                
-                # Pausa per non sovraccaricare il server
-                time.sleep(0.05)
+                updates.append((song_id, rating, song_artist, song_title, popularity))
                 
             except Exception as e:
                 stats['errors'] += 1
                 logger.error(f"Errore processando brano {i}: {e}")
                 continue
         
+        # Aggiorna i rating su Navidrome, con un numero limitato di richieste contemporanee
+        logger.info(f"Aggiornamento di {len(updates)} rating su Navidrome...")
+        writes = navidrome.MutationQueue(session, journal=WRITES_JOURNAL)
+        for song_id, rating, *_ in updates:
+            writes.set_rating(song_id, rating)
+        failed = {mutation.song_id for mutation in writes.flush()}
+        for song_id, rating, song_artist, song_title, popularity in updates:
+            if song_id not in failed:
+                stats['ratings_updated'] += 1
+                logger.info(f"✅ Rating aggiornato: {song_artist} - {song_title} | Popularity: {popularity} → Rating: {rating} stelle")
+            else:
+                stats['errors'] += 1
+                logger.error(f"❌ Errore aggiornamento: {song_artist} - {song_title}")
+        
         # Report finale
         end_time = time.time()
         duration = timedelta(seconds=int(end_time - start_time))
@@ -187,5 +218,10 @@ def main():
     return 0
 
 if __name__ == "__main__":
+    # Con il servizio residente avviato (music-service.py) il comando viene eseguito lì
+    exit_code = music_service.run_in_service(__file__)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     exit_code = main()
     sys.exit(exit_code)
\ No newline at end of file
@@ -1,12 +1,21 @@
 import requests
 import os
 import json
+import time
+import threading
+from collections import namedtuple
 import hashlib
 import utility
 from dotenv import load_dotenv
 import sys
 import logging
 import user_inputs
+import atexit
+import resident
+import navidrome_cache
+import navidrome_transport
+import subsonic_stream
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 sys.path.append('../')
 sys.path.append('../common_py_utils')
@@ -18,16 +27,59 @@ logger = logging.getLogger(__name__)
 # Load credentials from .env file
 load_dotenv()
 
-USERNAME = os.getenv("NAVIDROME_USERNAME")
-PASSWORD = os.getenv("NAVIDROME_PASSWORD")
-NAVIDROME_URL = os.getenv("NAVIDROME_URL")
-CLIENT_ID = os.getenv("NAVIDROME_CLIENT_ID")
-API_VERSION = os.getenv("NAVIDROME_API_VERSION")
+USERNAME = PASSWORD = NAVIDROME_URL = CLIENT_ID = API_VERSION = None
+
+def load_config():
+    """
+    Reads the Navidrome settings from the environment.
+
+    Called again by authenticate(): in the resident service the environment is reloaded
+    from .env before each job (choose_user.py may have switched user).
+    """
+    global USERNAME, PASSWORD, NAVIDROME_URL, CLIENT_ID, API_VERSION
+    USERNAME = os.getenv("NAVIDROME_USERNAME")
+    PASSWORD = os.getenv("NAVIDROME_PASSWORD")
+    NAVIDROME_URL = os.getenv("NAVIDROME_URL")
+    CLIENT_ID = os.getenv("NAVIDROME_CLIENT_ID")
+    API_VERSION = os.getenv("NAVIDROME_API_VERSION")
+    return (NAVIDROME_URL, USERNAME, PASSWORD, CLIENT_ID, API_VERSION)
+
+load_config()
+
+# Response cache of the read-only endpoints (see navidrome_cache.py); the file keeps it between runs
+CACHE_ENABLED = os.getenv("NAVIDROME_CACHE", "1") != "0"
+CACHE_FILE = os.getenv("NAVIDROME_CACHE_FILE")
+
+# Songs returned by a search2 lookup
+SEARCH_SONG_COUNT = 1000
+
+# Paging of get_all_songs
+PAGING_WORKERS = 4
+PAGE_SIZE = 500
+MIN_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+PAGE_TARGET_SECONDS = 1.0
+PAGE_MAX_BYTES = 8 * 1024 * 1024
+PAGE_RETRIES = 3
+PAGE_RETRY_DELAY = 0.5
+
+# Ids sent in a single star/unstar request (repeated id parameters), to stay under URL length limits
+IDS_PER_REQUEST = 150
+
+# Requests sent at the same time by MutationQueue.flush
+MUTATION_WORKERS = 4
 
 def authenticate():
-    """Authenticates and returns a session object."""
+    """Authenticates and returns a session object (the same one for the jobs of the resident service with the same user)."""
+    return resident.keep("navidrome.session", _new_session, load_config())
+
+def _new_session():
     token, salt = generate_token(PASSWORD)
-    session = requests.Session()
+    if CACHE_ENABLED:
+        session = navidrome_cache.CachedSession(path=CACHE_FILE)
+        atexit.register(session.close)
+    else:
+        session = requests.Session()
     session.params = {
         "u": USERNAME,
         "t": token,
@@ -36,6 +88,7 @@ def authenticate():
         "c": CLIENT_ID
     }
     session.verify=True #SSL verification
+    navidrome_transport.configure(session, max(navidrome_transport.DEFAULT_POOL_SIZE, PAGING_WORKERS))
     return session
 
 def generate_token(password):
@@ -44,50 +97,154 @@ def generate_token(password):
     token = hashlib.md5(f"{password}{salt}".encode("utf-8")).hexdigest()
     return token, salt
 
-def search_song(session, artist, album, title, consider_album=True, only_one_result=False, permit_choice=True):
-    """Searches for an exact song match in Navidrome based on artist, album and title."""
-    response = session.get(f"{NAVIDROME_URL}/search2.view", params={
+def search(session, title):
+    """Returns the songs found by search2 for a title (up to SEARCH_SONG_COUNT, unfiltered)."""
+    with session.get(f"{NAVIDROME_URL}/search2.view", params={
         "query": string_utils.clean_string(title),
-        "songCount": 1000,
+        "songCount": SEARCH_SONG_COUNT,
+        "albumCount": 0,
+        "artistCount": 0,
         "f": "json"
-    })
-    
-    logger.debug(response.text)
-    #logger.debug(json.dumps(response.json(), indent=2))
+    }, stream=True) as response:
+        if response.status_code != 200:
+            logger.error(f"Error searching for {title}: {response.text}")
+            return []
+        try:
+            songs = [song for _, song in subsonic_stream.iter_items(response, ["subsonic-response.searchResult2.song"], compact_items=True)]
+        except RuntimeError as e:
+            # One failed search must not stop a whole compare
+            logger.error(f"Error searching for {title}: {e}")
+            return []
+
+    logger.debug(f"search2 '{title}': {len(songs)} songs")
+    return songs
+
+def match_search_results(results, artist, album, title, consider_album=True, permit_choice=True):
+    """Filters search results looking for an exact match on artist, album and title."""
+    if not results:
+        return []
+    return utility.find_song(title, artist, album, results, "navidrome", only_first_result=False, permit_choice=permit_choice, consider_album=consider_album)
+
+def search_song(session, artist, album, title, consider_album=True, only_one_result=False, permit_choice=True):
+    """Searches for an exact song match in Navidrome based on artist, album and title."""
+    return match_search_results(search(session, title), artist, album, title, consider_album=consider_album)
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
+# Outcome of a write call
+CALL_OK = "ok"
+CALL_FAILED = "failed"  # Subsonic status 'failed': Navidrome refused it, nothing was applied
+CALL_ERROR = "error"    # No readable answer: Navidrome may or may not have applied it
+
+def _call_outcome(response):
     if response.status_code != 200:
-        logger.error(f"Error searching for {title}: {response.text}")
-        return []
+        return CALL_ERROR
+    try:
+        status = response.json().get("subsonic-response", {}).get("status")
+    except ValueError:
+        return CALL_ERROR
+    return CALL_FAILED if status == "failed" else CALL_OK
 
-    # Filter results looking for an exact match on artist, album and title
-    results = response.json().get("subsonic-response", {}).get("searchResult2", {}).get("song", [])
+def _is_ok(response):
+    """True if the call succeeded: Subsonic errors come back with HTTP 200 and status 'failed'."""
+    return _call_outcome(response) == CALL_OK
+
+def _call_with_ids(session, endpoint, ids, id_param="id", **params):
+    """Calls an endpoint with a repeated id parameter (id=1&id=2&...). Returns CALL_OK, CALL_FAILED or CALL_ERROR."""
+    try:
+        response = session.get(f"{NAVIDROME_URL}/{endpoint}", params={**params, id_param: list(ids), "f": "json"})
+    except requests.RequestException as e:
+        logger.error(f"❌ {endpoint} error: {e}")
+        return CALL_ERROR
+    outcome = _call_outcome(response)
+    if outcome != CALL_OK:
+        logger.debug(f"{endpoint} {outcome}: {response.text}")
+    return outcome
+
+def _call_in_chunks(session, endpoint, song_ids, chunk_size, id_param="id", **params):
+    """
+    Calls an endpoint with chunk_size song ids per request (repeated id_param parameters).
+
+    A chunk refused by Navidrome (Subsonic status 'failed', e.g. one unknown id) is retried
+    one id at a time. A chunk without a readable answer (connection error, timeout, HTTP error)
+    is reported as failed and not sent again: Navidrome may have applied it, and adding songs
+    to a playlist twice would duplicate them.
+    Returns one report per chunk:
+    {"ids": [...], "bulk": True if the single request succeeded, "failed": [ids not updated],
+     "unknown": [ids of a chunk without answer, also in "failed": Navidrome may have applied them]}.
+    """
+    reports = []
+    chunks = list(_chunks(list(song_ids), chunk_size))
+    for number, chunk in enumerate(chunks, 1):
+        outcome = _call_with_ids(session, endpoint, chunk, id_param, **params)
+        if outcome == CALL_OK:
+            reports.append({"ids": chunk, "bulk": True, "failed": [], "unknown": []})
+            logger.info(f"✅ {endpoint} {number}/{len(chunks)}: {len(chunk)} songs")
+            continue
+        if outcome == CALL_ERROR:
+            reports.append({"ids": chunk, "bulk": False, "failed": list(chunk), "unknown": list(chunk)})
+            logger.error(f"❌ {endpoint} {number}/{len(chunks)}: no answer for {len(chunk)} songs, not sent again")
+            continue
+
+        # Fallback: one request per song, only for this chunk
+        logger.warning(f"⚠️ {endpoint} {number}/{len(chunks)} failed, retrying {len(chunk)} songs one by one")
+        failed = [song_id for song_id in chunk if _call_with_ids(session, endpoint, [song_id], id_param, **params) != CALL_OK]
+        reports.append({"ids": chunk, "bulk": False, "failed": failed, "unknown": []})
+        if failed:
+            logger.error(f"❌ {endpoint} {number}/{len(chunks)}: {len(failed)}/{len(chunk)} songs failed: {failed}")
+        else:
+            logger.info(f"✅ {endpoint} {number}/{len(chunks)}: {len(chunk)} songs (one by one)")
+    return reports
 
-    return utility.find_song(title, artist, album, results, "navidrome", only_first_result=False, permit_choice=True, consider_album=consider_album)
+def star_songs(session, song_ids, chunk_size=IDS_PER_REQUEST):
+    """Adds songs to favorites, many ids per request. Returns the per-chunk reports (see _call_in_chunks)."""
+    return _call_in_chunks(session, "star.view", dict.fromkeys(song_ids), chunk_size)
+
+def unstar_songs(session, song_ids, chunk_size=IDS_PER_REQUEST):
+    """Removes songs from favorites, many ids per request. Returns the per-chunk reports (see _call_in_chunks)."""
+    return _call_in_chunks(session, "unstar.view", dict.fromkeys(song_ids), chunk_size)
+
+def failed_ids(reports):
+    return {song_id for report in reports for song_id in report["failed"]}
+
+def unknown_ids(reports):
+    return {song_id for report in reports for song_id in report["unknown"]}
 
 def add_to_favorites(session, navidrome_songs):
     """Adds songs to favorites in Navidrome."""
+    to_star = []
     for song in navidrome_songs:
         starred = song.get('starred', 'No')
         if (starred=="No"):
-            response = session.get(f"{NAVIDROME_URL}/star.view", params={
-                "id": song["id"],
-                "f": "json"
-            })
-            if response.status_code == 200:
-                logger.info(f"✅ Song added to favorites: {song['title']} - {song['artist']} ({song['album']})")
-            else:
-                logger.error(f"❌ Error adding song: {song['title']} - {song['artist']}")
+            to_star.append(song)
         else:
             logger.info(f"Song already favorite: {song['title']} - {song['artist']} ({song['album']})")
 
-def get_playlist_songs(session, playlist_id):
-    """Retrieves the songs from a specific playlist."""
-    response = session.get(f"{NAVIDROME_URL}/getPlaylist.view", params={
+    if not to_star:
+        return []
+    reports = star_songs(session, [song["id"] for song in to_star])
+    failed = failed_ids(reports)
+    for song in to_star:
+        if song["id"] in failed:
+            logger.error(f"❌ Error adding song: {song['title']} - {song['artist']}")
+        else:
+            logger.info(f"✅ Song added to favorites: {song['title']} - {song['artist']} ({song['album']})")
+    return reports
+
+def iter_playlist_songs(session, playlist_id, batch_size=subsonic_stream.BATCH_SIZE):
+    """Yields the songs of a playlist in lists of up to batch_size, decoded as they arrive."""
+    with session.get(f"{NAVIDROME_URL}/getPlaylist.view", params={
         "f": "json",
         "id": playlist_id,
-    })
-    response.raise_for_status()
-    return response.json()["subsonic-response"]["playlist"]["entry"]
+    }, stream=True) as response:
+        response.raise_for_status()
+        yield from subsonic_stream.iter_batches(response, "subsonic-response.playlist.entry", batch_size)
+
+def get_playlist_songs(session, playlist_id):
+    """Retrieves the songs from a specific playlist (an empty list for an empty playlist)."""
+    return [song for batch in iter_playlist_songs(session, playlist_id) for song in batch]
     
 def get_playlists(session):
     """Retrieves all playlists from Navidrome."""
@@ -175,85 +332,210 @@ def get_song_by_id(session, songId):
         raise ValueError("No 'song' field found in API response.")
     return data["song"]
 
-def remove_from_favorites(session, id):
-    """Remove song from favorites in Navidrome."""
-    response = session.get(f"{NAVIDROME_URL}/unstar.view", params={
-        "id": id,
-        "f": "json"
+def get_scan_status(session):
+    """Retrieves the library scan status (lastScan, count, scanning) from Navidrome."""
+    response = session.get(f"{NAVIDROME_URL}/getScanStatus.view", params={
+        "f": "json",
     })
 
-    if response.status_code == 200:
-        logger.info(f"✅ Song removed from favorites: {id})")
-    else:
-        logger.error(f"❌ Error unstarring song: {id}")
+    if response.status_code != 200:
+        logger.error("API call error:")
+        response.raise_for_status()
 
-def get_starred(session):
-    """Retrieves all starred songs from Navidrome."""
-    response = session.get(f"{NAVIDROME_URL}/getStarred2.view", params={
+    data = response.json()["subsonic-response"]
+    if "scanStatus" not in data:
+        raise ValueError("No 'scanStatus' field found in API response.")
+    return data["scanStatus"]
+
+def get_album_list(session, list_type="newest", size=500, offset=0):
+    """Retrieves a page of albums (getAlbumList2) sorted by list_type."""
+    response = session.get(f"{NAVIDROME_URL}/getAlbumList2.view", params={
+        "type": list_type,
+        "size": size,
+        "offset": offset,
         "f": "json",
     })
 
-    logger.debug(response.text)
-
     if response.status_code != 200:
         logger.error("API call error:")
         response.raise_for_status()
 
-    logger.debug("API response getStarred2.view:")
-    logger.debug(json.dumps(response.json(), indent=2))
+    data = response.json()["subsonic-response"]
+    if "albumList2" not in data:
+        raise ValueError("No 'albumList2' field found in API response.")
+    return data["albumList2"].get("album", [])
+
+def get_album(session, albumId):
+    """Retrieves an album with its songs from Navidrome."""
+    response = session.get(f"{NAVIDROME_URL}/getAlbum.view", params={
+        "f": "json",
+        "id": albumId,
+    })
+
+    if response.status_code != 200:
+        logger.error("API call error:")
+        response.raise_for_status()
 
-    # Get starred songs
     data = response.json()["subsonic-response"]
-    if "starred2" not in data:
-        raise ValueError("No 'starred2' field found in API response.")
-    return data["starred2"]["song"]
+    if "album" not in data:
+        raise ValueError("No 'album' field found in API response.")
+    return data["album"]
+
+def remove_from_favorites(session, song_ids):
+    """Removes songs (a list of ids, or one id) from favorites in Navidrome. Returns the per-chunk reports."""
+    if isinstance(song_ids, str):
+        song_ids = [song_ids]
+    if not song_ids:
+        return []
+    reports = unstar_songs(session, song_ids)
+    failed = failed_ids(reports)
+    for song_id in dict.fromkeys(song_ids):
+        if song_id in failed:
+            logger.error(f"❌ Error unstarring song: {song_id}")
+        else:
+            logger.info(f"✅ Song removed from favorites: {song_id}")
+    return reports
+
+def get_starred_items(session):
+    """Retrieves all starred songs, albums and artists from Navidrome (the starred2 object)."""
+    starred = {"song": [], "album": [], "artist": []}
+    with session.get(f"{NAVIDROME_URL}/getStarred2.view", params={
+        "f": "json",
+    }, stream=True) as response:
+        if response.status_code != 200:
+            logger.error("API call error:")
+            response.raise_for_status()
+
+        paths = {f"subsonic-response.starred2.{key}": key for key in starred}
+        for path, item in subsonic_stream.iter_items(response, list(paths)):
+            starred[paths[path]].append(item)
+
+    logger.debug(f"getStarred2.view: {', '.join(f'{len(items)} {key}' for key, items in starred.items())}")
+    return starred
+
+def iter_starred(session, batch_size=subsonic_stream.BATCH_SIZE):
+    """Yields the starred songs in lists of up to batch_size, decoded as they arrive."""
+    with session.get(f"{NAVIDROME_URL}/getStarred2.view", params={
+        "f": "json",
+    }, stream=True) as response:
+        if response.status_code != 200:
+            logger.error("API call error:")
+            response.raise_for_status()
+        yield from subsonic_stream.iter_batches(response, "subsonic-response.starred2.song", batch_size)
+
+def get_starred(session):
+    """Retrieves all starred songs from Navidrome."""
+    return [song for batch in iter_starred(session) for song in batch]
+
+def _fetch_songs_page(session, offset, count):
+    """Fetches one search2 page: returns the songs, the response time and the payload size."""
+    start = time.perf_counter()
+    stats = {}
+    with session.get(f"{NAVIDROME_URL}/search2.view", params={
+        "query": "",  # Query vuota per ottenere tutti i brani
+        "songOffset": offset,
+        "songCount": count,
+        "albumOffset": 0,
+        "albumCount": 0,
+        "artistOffset": 0,
+        "artistCount": 0,
+        "f": "json"
+    }, stream=True) as response:
+        response.raise_for_status()
+        songs = [song for _, song in subsonic_stream.iter_items(response, ["subsonic-response.searchResult2.song"], stats, compact_items=True)]
+    return songs, time.perf_counter() - start, stats["bytes"]
+
+def _fetch_songs_page_with_retries(session, offset, count, retries=PAGE_RETRIES):
+    """Fetches a page retrying it on errors; returns None if every attempt failed."""
+    for attempt in range(1, retries + 1):
+        try:
+            return _fetch_songs_page(session, offset, count)
+        except Exception as e:
+            logger.warning(f"Errore pagina brani {offset}-{offset + count} (tentativo {attempt}/{retries}): {e}")
+            if attempt < retries:
+                time.sleep(PAGE_RETRY_DELAY * 2 ** (attempt - 1))
+    return None
+
+def _adapt_page_size(page_size, elapsed, payload_size):
+    """Halves the page size on slow or large pages, doubles it on fast and small ones."""
+    if elapsed > PAGE_TARGET_SECONDS or payload_size > PAGE_MAX_BYTES:
+        return max(MIN_PAGE_SIZE, page_size // 2)
+    if elapsed < PAGE_TARGET_SECONDS / 2 and payload_size < PAGE_MAX_BYTES / 2:
+        return min(MAX_PAGE_SIZE, page_size * 2)
+    return page_size
+
+def iter_all_songs(session, workers=PAGING_WORKERS, page_size=PAGE_SIZE, failed_pages=None):
+    """
+    Yields all songs from Navidrome (search2 with pagination), in library order.
+
+    Up to `workers` pages are fetched at the same time; the page size adapts to the response
+    time and payload size. A failed page is retried on its own and, if it keeps failing,
+    skipped and reported at the end instead of stopping the whole download
+    (the (offset, count) of the skipped pages are added to failed_pages, if given).
+    """
+    pending = {}
+    fetched = {}
+    next_offset = 0
+    yield_offset = 0
+    end_offset = None
+    failed = []
+    consecutive_failures = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="navidrome-paging") as executor:
+
+        def submit():
+            nonlocal next_offset
+            future = executor.submit(_fetch_songs_page_with_retries, session, next_offset, page_size)
+            pending[future] = (next_offset, page_size)
+            next_offset += page_size
+
+        for _ in range(workers):
+            submit()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                offset, count = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    failed.append((offset, count))
+                    fetched[offset] = ([], count)
+                    consecutive_failures += 1
+                    continue
+
+                consecutive_failures = 0
+                songs, elapsed, payload_size = result
+                fetched[offset] = (songs, count)
+                if len(songs) < count:
+                    # Last page: no more pages after this one
+                    end = offset + len(songs)
+                    end_offset = end if end_offset is None else min(end_offset, end)
+                else:
+                    page_size = _adapt_page_size(page_size, elapsed, payload_size)
+
+            if consecutive_failures >= workers and end_offset is None:
+                logger.error("Troppe pagine fallite di seguito: interrompo il recupero dei brani")
+                end_offset = next_offset
+            while end_offset is None and len(pending) < workers:
+                submit()
+
+            # Songs are yielded in order, as soon as the pages before them have arrived
+            while yield_offset in fetched:
+                songs, count = fetched.pop(yield_offset)
+                yield from songs
+                yield_offset += count
+                logger.debug(f"Recuperati {yield_offset} brani finora...")
+
+    missing = sorted((offset, count) for offset, count in failed if end_offset is None or offset < end_offset)
+    for offset, count in missing:
+        logger.error(f"❌ Brani {offset}-{offset + count} non recuperati")
+    if failed_pages is not None:
+        failed_pages.extend(missing)
 
 def get_all_songs(session):
     """Retrieves all songs from Navidrome using search2 with pagination."""
-    all_songs = []
-    offset = 0
-    batch_size = 500
-    
     logger.info("Recupero tutti i brani da Navidrome...")
-    
-    while True:
-        try:
-            response = session.get(f"{NAVIDROME_URL}/search2.view", params={
-                "query": "",  # Query vuota per ottenere tutti i brani
-                "songOffset": offset,
-                "songCount": batch_size,
-                "albumOffset": 0,
-                "albumCount": 0,
-                "artistOffset": 0,
-                "artistCount": 0,
-                "f": "json"
-            })
-            
-            if response.status_code != 200:
-                logger.error(f"Errore API search2: {response.text}")
-                break
-                
-            data = response.json().get("subsonic-response", {})
-            search_result = data.get("searchResult2", {})
-            songs = search_result.get("song", [])
-            
-            if not songs:
-                break  # Nessun altro brano da recuperare
-                
-            all_songs.extend(songs)
-            offset += batch_size
-            
-            # logger.debug(f"{songs}")
-            logger.debug(f"Recuperati {len(all_songs)} brani finora...")
-            
-            # Pausa per non sovraccaricare il server
-            import time
-            time.sleep(0.1)
-            
-        except Exception as e:
-            logger.error(f"Errore durante recupero brani: {e}")
-            break
-    
+    all_songs = list(iter_all_songs(session))
     logger.info(f"Recuperati {len(all_songs)} brani totali da Navidrome")
     return all_songs
 
@@ -272,22 +554,36 @@ def set_song_rating(session, song_id, rating):
         logger.error(f"❌ Error setting rating for song {song_id}: {response.text}")
         return False
 
-def create_playlist(session, name):
-    """Creates a new playlist in Navidrome."""
+def create_playlist(session, name, song_ids=None):
+    """Creates a new playlist in Navidrome, with its first songs if given."""
+    song_ids = [song_ids] if isinstance(song_ids, str) else list(song_ids or [])
+    first_chunk, other_songs = song_ids[:IDS_PER_REQUEST], song_ids[IDS_PER_REQUEST:]
+
     response = session.get(f"{NAVIDROME_URL}/createPlaylist.view", params={
         "name": name,
+        "songId": first_chunk,
         "f": "json"
     })
     
-    if response.status_code == 200:
+    if _is_ok(response):
         playlist_data = response.json().get("subsonic-response", {}).get("playlist", {})
         playlist_id = playlist_data.get("id")
-        logger.info(f"✅ Playlist created successfully: {name} (ID: {playlist_id})")
+        logger.info(f"✅ Playlist created successfully: {name} (ID: {playlist_id}, {len(first_chunk)} songs)")
+        if other_songs:
+            add_songs_to_playlist(session, playlist_id, other_songs)
         return playlist_id
     else:
         logger.error(f"❌ Error creating playlist {name}: {response.text}")
         return None
 
+def update_playlist(session, playlist_id, song_ids, chunk_size=IDS_PER_REQUEST):
+    """Adds songs to a playlist, many per request (repeated songIdToAdd). Returns the per-chunk reports."""
+    reports = _call_in_chunks(session, "updatePlaylist.view", song_ids, chunk_size,
+                              id_param="songIdToAdd", playlistId=playlist_id)
+    failed = failed_ids(reports)
+    logger.info(f"Added {len(song_ids) - len(failed)}/{len(song_ids)} songs to playlist {playlist_id} in {len(reports)} requests")
+    return reports
+
 def add_songs_to_playlist(session, playlist_id, song_ids):
     """Adds songs to an existing playlist in Navidrome."""
     if not song_ids:
@@ -297,49 +593,8 @@ def add_songs_to_playlist(session, playlist_id, song_ids):
     # Convert song_ids to list if it's a single ID
     if isinstance(song_ids, str):
         song_ids = [song_ids]
-    
-    params = {
-        "playlistId": playlist_id,
-        "f": "json"
-    }
-    
-    # Add each song ID as a separate parameter
-    for i, song_id in enumerate(song_ids):
-        params[f"songIdToAdd"] = song_id if i == 0 else params.get("songIdToAdd", []) + [song_id]
-    
-    # Handle multiple song IDs properly
-    if len(song_ids) == 1:
-        params["songIdToAdd"] = song_ids[0]
-    else:
-        # For multiple songs, we need to make multiple calls or use a different approach
-        # Let's make individual calls for each song to be safe
-        success_count = 0
-        for song_id in song_ids:
-            single_params = {
-                "playlistId": playlist_id,
-                "songIdToAdd": song_id,
-                "f": "json"
-            }
-            response = session.get(f"{NAVIDROME_URL}/updatePlaylist.view", params=single_params)
-            
-            if response.status_code == 200:
-                success_count += 1
-                logger.debug(f"✅ Song {song_id} added to playlist {playlist_id}")
-            else:
-                logger.error(f"❌ Error adding song {song_id} to playlist: {response.text}")
-        
-        logger.info(f"Added {success_count}/{len(song_ids)} songs to playlist {playlist_id}")
-        return success_count == len(song_ids)
-    
-    # Single song case
-    response = session.get(f"{NAVIDROME_URL}/updatePlaylist.view", params=params)
-    
-    if response.status_code == 200:
-        logger.info(f"✅ Song(s) added to playlist {playlist_id}")
-        return True
-    else:
-        logger.error(f"❌ Error adding songs to playlist: {response.text}")
-        return False
+
+    return not failed_ids(update_playlist(session, playlist_id, song_ids))
 
 def find_or_create_playlist(session, name):
     """Finds an existing playlist by name or creates a new one."""
@@ -359,3 +614,190 @@ def find_or_create_playlist(session, name):
     except Exception as e:
         logger.error(f"Error finding/creating playlist {name}: {e}")
         return None
+
+# Bulk mutation queue
+
+STAR, UNSTAR, SET_RATING, ADD_TO_PLAYLIST = "star", "unstar", "setRating", "addToPlaylist"
+
+# value: the rating for SET_RATING, the playlist id for ADD_TO_PLAYLIST, None otherwise
+Mutation = namedtuple("Mutation", ["op", "song_id", "value"], defaults=[None])
+
+class MutationQueue:
+    """
+    Writes to Navidrome collected during a run and sent together by flush().
+
+    Operations are coalesced: the last star/unstar and the last rating of a song win,
+    a song added twice to the same playlist is added once. flush() stars/unstars
+    IDS_PER_REQUEST songs per request, adds songs to each playlist in chunks (in order,
+    one playlist at a time) and sets ratings one per request, with at most `workers`
+    requests in flight.
+
+    With a journal file, every queued operation and every completed one is written to it:
+    an interrupted run resumes the pending writes and skips the completed ones once each,
+    when the script queues them again before the first flush(). A different write to the
+    same song (unstar after star, another rating) ends the skipping for it, so a deliberate
+    write is never dropped. The journal is removed once everything has been sent.
+    Playlist additions without an answer are never sent again (Navidrome may have applied
+    them, and a second request would duplicate the songs): they are journaled as done and
+    listed in `unknown` after flush().
+    """
+
+    def __init__(self, session, journal=None, workers=MUTATION_WORKERS, chunk_size=IDS_PER_REQUEST):
+        self.session = session
+        self.journal = journal
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._favorites = {}
+        self._ratings = {}
+        self._playlists = {}
+        self._done = set()
+        self.unknown = []
+        self._lock = threading.Lock()
+        if journal:
+            self._load_journal()
+
+    def __len__(self):
+        return len(self._favorites) + len(self._ratings) + sum(len(songs) for songs in self._playlists.values())
+
+    def _load_journal(self):
+        if not os.path.exists(self.journal):
+            return
+        queued = []
+        with open(self.journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Last line cut by an interruption
+                if "done" in entry:
+                    self._done.update(Mutation(*item) for item in entry["done"])
+                else:
+                    queued.append(Mutation(*entry["op"]))
+        for mutation in queued:
+            if mutation not in self._done:
+                self._queue(mutation)
+        logger.info(f"Resuming {len(self)} pending Navidrome writes from {self.journal} ({len(self._done)} already done)")
+
+    def _write_journal(self, entry):
+        if not self.journal:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.journal)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.journal, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _queue(self, mutation):
+        if mutation in self._done:
+            self._done.discard(mutation)  # The replay of a completed write, skipped once
+            return False
+        if self._done:
+            self._done = {done for done in self._done if not self._supersedes(mutation, done)}
+        if mutation.op in (STAR, UNSTAR):
+            self._favorites.pop(mutation.song_id, None)  # The latest one goes last
+            self._favorites[mutation.song_id] = mutation.op
+        elif mutation.op == SET_RATING:
+            self._ratings[mutation.song_id] = mutation.value
+        elif mutation.op == ADD_TO_PLAYLIST:
+            self._playlists.setdefault(mutation.value, {})[mutation.song_id] = None
+        else:
+            raise ValueError(f"Unknown Navidrome write: {mutation.op}")
+        return True
+
+    @staticmethod
+    def _supersedes(mutation, done):
+        if mutation.song_id != done.song_id:
+            return False
+        if mutation.op in (STAR, UNSTAR):
+            return done.op in (STAR, UNSTAR)
+        return mutation.op == done.op == SET_RATING
+
+    def add(self, op, song_id, value=None):
+        mutation = Mutation(op, song_id, value)
+        if self._queue(mutation):
+            self._write_journal({"op": list(mutation)})
+
+    def star(self, song_id):
+        self.add(STAR, song_id)
+
+    def unstar(self, song_id):
+        self.add(UNSTAR, song_id)
+
+    def set_rating(self, song_id, rating):
+        self.add(SET_RATING, song_id, rating)
+
+    def add_to_playlist(self, playlist_id, song_id):
+        self.add(ADD_TO_PLAYLIST, song_id, playlist_id)
+
+    def _completed(self, mutations):
+        if mutations:
+            self._write_journal({"done": [list(mutation) for mutation in mutations]})
+
+    def _send_favorites(self, op, chunk):
+        reports = _call_in_chunks(self.session, f"{op}.view", chunk, self.chunk_size)
+        failed = failed_ids(reports)
+        self._completed([Mutation(op, song_id) for song_id in chunk if song_id not in failed])
+        return [Mutation(op, song_id) for song_id in chunk if song_id in failed]
+
+    def _send_rating(self, song_id, rating):
+        if _call_with_ids(self.session, "setRating.view", [song_id], rating=rating) == CALL_OK:
+            self._completed([Mutation(SET_RATING, song_id, rating)])
+            return []
+        logger.error(f"❌ Error setting rating for song {song_id}")
+        return [Mutation(SET_RATING, song_id, rating)]
+
+    def _send_playlist(self, playlist_id, song_ids):
+        failed = []
+        for chunk in _chunks(song_ids, self.chunk_size):
+            reports = _call_in_chunks(self.session, "updatePlaylist.view", chunk, self.chunk_size,
+                                      id_param="songIdToAdd", playlistId=playlist_id)
+            chunk_failed = failed_ids(reports)
+            chunk_unknown = unknown_ids(reports)
+            self._completed([Mutation(ADD_TO_PLAYLIST, song_id, playlist_id) for song_id in chunk if song_id not in chunk_failed])
+            failed += [Mutation(ADD_TO_PLAYLIST, song_id, playlist_id)
+                       for song_id in chunk if song_id in chunk_failed and song_id not in chunk_unknown]
+            unknown = [Mutation(ADD_TO_PLAYLIST, song_id, playlist_id) for song_id in chunk if song_id in chunk_unknown]
+            if unknown:
+                # Not replayed by the next run: it would skip them as completed
+                self._write_journal({"done": [list(mutation) for mutation in unknown], "unknown": True})
+                with self._lock:
+                    self.unknown += unknown
+        return failed
+
+    def flush(self):
+        """
+        Sends the queued writes; returns the ones that failed (kept in the journal for the next run).
+        Playlist additions without an answer are not returned: see `unknown`.
+        """
+        tasks = []
+        for op in (STAR, UNSTAR):
+            song_ids = [song_id for song_id, queued_op in self._favorites.items() if queued_op == op]
+            tasks += [(self._send_favorites, op, chunk) for chunk in _chunks(song_ids, self.chunk_size)]
+        tasks += [(self._send_rating, song_id, rating) for song_id, rating in self._ratings.items()]
+        tasks += [(self._send_playlist, playlist_id, list(song_ids)) for playlist_id, song_ids in self._playlists.items()]
+        self._done.clear()  # From here on, every write queued is a new one
+        self.unknown = []
+        if not tasks:
+            return []
+
+        total = len(self)
+        logger.info(f"Sending {total} Navidrome writes in {len(tasks)} batches ({self.workers} at a time)")
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for result in executor.map(lambda task: task[0](*task[1:]), tasks):
+                failed += result
+        self._favorites, self._ratings, self._playlists = {}, {}, {}
+
+        if self.unknown:
+            logger.error(f"❌ {len(self.unknown)} playlist additions got no answer and are not sent again, "
+                         f"check the playlists: {[mutation.song_id for mutation in self.unknown]}")
+        if failed:
+            logger.error(f"❌ {len(failed)}/{total} Navidrome writes failed, kept in {self.journal or 'memory'}")
+            for mutation in failed:
+                self._queue(mutation)
+        else:
+            logger.info(f"✅ {total - len(self.unknown)} Navidrome writes sent")
+            if self.journal and os.path.exists(self.journal):
+                os.remove(self.journal)
+        return failed
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import navidrome
+import navidrome_transport
+
+logger = logging.getLogger(__name__)
+
+# Requests sent to Navidrome at the same time
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("NAVIDROME_MAX_IN_FLIGHT", "8"))
+
+
+class AsyncNavidrome:
+    """
+    asyncio client with the same calls as navidrome.py, at most max_in_flight requests at a time.
+
+    Requests go through the authenticated requests session of navidrome.py (in worker threads),
+    so they behave exactly like the blocking calls. Choices between equivalent matches are
+    asked in the event loop thread, one at a time.
+    """
+
+    def __init__(self, session=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.session = session or navidrome.authenticate()
+        self.max_in_flight = max_in_flight
+        self._semaphore = None
+        # Own threads: the default executor may have fewer threads than max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="navidrome")
+        # One connection per request in flight, otherwise urllib3 discards the extra ones
+        navidrome_transport.configure(self.session, max_in_flight)
+
+    async def _call(self, function, *args, **kwargs):
+        if self._semaphore is None:
+            # Created here so it belongs to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(function, self.session, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def search(self, title):
+        return await self._call(navidrome.search, title)
+
+    async def search_song(self, artist, album, title, consider_album=True, permit_choice=True):
+        results = await self.search(title)
+        return navidrome.match_search_results(results, artist, album, title, consider_album, permit_choice)
+
+    async def star(self, song):
+        return await self._call(navidrome.add_to_favorites, [song])
+
+    async def unstar(self, song_ids):
+        return await self._call(navidrome.remove_from_favorites, song_ids)
+
+    async def set_rating(self, song_id, rating):
+        return await self._call(navidrome.set_song_rating, song_id, rating)
+
+    async def get_song(self, song_id):
+        return await self._call(navidrome.get_song_by_id, song_id)
+
+    async def get_artist_info(self, artist_id):
+        return await self._call(navidrome.get_artist_info, artist_id)
+
+    async def get_playlists(self):
+        return await self._call(navidrome.get_playlists)
+
+    async def get_playlist_songs(self, playlist_id):
+        return await self._call(navidrome.get_playlist_songs, playlist_id)
+
+    async def create_playlist(self, name):
+        return await self._call(navidrome.create_playlist, name)
+
+    async def add_songs_to_playlist(self, playlist_id, song_ids):
+        return await self._call(navidrome.add_songs_to_playlist, playlist_id, song_ids)
+
+    async def find_or_create_playlist(self, name):
+        return await self._call(navidrome.find_or_create_playlist, name)
+
+    async def map(self, method, arguments):
+        """
+        Calls a method once per tuple of arguments, concurrently.
+
+        Results are in input order; a failed call returns its exception instead of raising,
+        so one error doesn't stop the other calls.
+        """
+        call = getattr(self, method)
+        return await asyncio.gather(*(call(*args) for args in arguments), return_exceptions=True)
+
+
+# Sync wrappers: blocking calls for the scripts, each running a batch of requests concurrently
+
+def run_many(session, method, arguments, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """Runs AsyncNavidrome.<method> for each tuple of arguments and returns the results in input order."""
+    arguments = [args if isinstance(args, tuple) else (args,) for args in arguments]
+    if not arguments:
+        return []
+    client = AsyncNavidrome(session, max_in_flight)
+    try:
+        results = asyncio.run(client.map(method, arguments))
+    finally:
+        client.close()
+    for args, result in zip(arguments, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ {method}{args} failed: {result}")
+    return results
+
+
+def search_songs(session, queries, consider_album=True, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """navidrome.search_song for each (artist, album, title) query."""
+    return run_many(session, "search_song", [(artist, album, title, consider_album) for artist, album, title in queries], max_in_flight)
+
+
+def add_to_favorites(session, navidrome_songs, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """navidrome.add_to_favorites with the songs starred concurrently."""
+    return run_many(session, "star", navidrome_songs, max_in_flight)
+
+
+def remove_from_favorites(session, song_ids, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """navidrome.remove_from_favorites with IDS_PER_REQUEST ids per request, the requests sent concurrently."""
+    chunks = navidrome._chunks(list(dict.fromkeys(song_ids)), navidrome.IDS_PER_REQUEST)
+    return run_many(session, "unstar", [(chunk,) for chunk in chunks], max_in_flight)
+
+
+def set_song_ratings(session, ratings, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """navidrome.set_song_rating for each (song_id, rating): True/False (or the exception) per rating."""
+    return run_many(session, "set_rating", ratings, max_in_flight)
+
+
+def get_songs_by_id(session, song_ids, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    return run_many(session, "get_song", song_ids, max_in_flight)
+
+
+def get_artists_info(session, artist_ids, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    return run_many(session, "get_artist_info", artist_ids, max_in_flight)
+
+
+def get_playlists_songs(session, playlist_ids, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    return run_many(session, "get_playlist_songs", playlist_ids, max_in_flight)
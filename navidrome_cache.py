@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a response of a read-only endpoint is reused without asking the server.
+# getPlaylist and getStarred2 are streamed (subsonic_stream.py), and streamed requests are never cached
+CACHE_TTLS = {
+    "getPlaylists": 60,
+    "getSong": 600,
+    "getAlbum": 600,
+    "getArtists": 3600,
+    "getArtistInfo": 86400,
+}
+
+# Cached endpoints whose responses may change after a write call
+INVALIDATES = {
+    "star": ["getSong", "getAlbum", "getArtists"],
+    "unstar": ["getSong", "getAlbum", "getArtists"],
+    "setRating": ["getSong", "getAlbum"],
+    "createPlaylist": ["getPlaylists"],
+    "updatePlaylist": ["getPlaylists"],
+    "deletePlaylist": ["getPlaylists"],
+    "startScan": list(CACHE_TTLS),
+}
+
+DEFAULT_MAX_BYTES = int(os.getenv("NAVIDROME_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Marks the cache files written by CachedSession.save (JSON: nothing in them is executed on load)
+FILE_FORMAT = "music-tools/navidrome-cache"
+FILE_VERSION = 1
+
+
+def endpoint_name(url):
+    """'https://host/rest/getSong.view' -> 'getSong'."""
+    name = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+    return name[:-5] if name.endswith(".view") else name
+
+
+@dataclass
+class CacheEntry:
+    status_code: int
+    headers: dict
+    content: bytes
+    url: str
+    encoding: str
+    expires: float
+    etag: str = None
+    last_modified: str = None
+    size: int = field(default=0)
+
+    def to_json(self):
+        data = dict(self.__dict__)
+        data["content"] = base64.b64encode(self.content).decode("ascii")
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        data = dict(data)
+        data["content"] = base64.b64decode(data["content"])
+        return cls(**data)
+
+    def to_response(self):
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.url = self.url
+        response.encoding = self.encoding
+        response.reason = "OK"
+        return response
+
+
+class CachedSession(requests.Session):
+    """
+    requests session with a read-through cache for the read-only endpoints in CACHE_TTLS.
+
+    A fresh response is returned without any request; an expired one is revalidated with
+    If-None-Match/If-Modified-Since when the server sent an ETag/Last-Modified, otherwise
+    fetched again. Only successful Subsonic responses are cached, within max_bytes (least
+    recently used entries are evicted first). Write calls (INVALIDATES) drop the cached
+    responses they may change. With a path, the cache is kept on disk between runs (JSON).
+    The session may be shared by several threads: entries and stats change under one lock.
+    Responses are kept per server and per user (the session 'u' parameter): starred flags,
+    ratings and playlists of one user are never served to another.
+    """
+
+    def __init__(self, ttls=None, max_bytes=DEFAULT_MAX_BYTES, path=None):
+        super().__init__()
+        self.ttls = dict(CACHE_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.path = path
+        self.stats = Counter()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+        if path:
+            self._load()
+
+    def _key(self, endpoint, url, params):
+        """(endpoint, server url, user, arguments): the auth parameters change at every login, the user doesn't."""
+        params = params or {}
+        user = params.get("u") or (self.params or {}).get("u")
+        items = []
+        for name, value in sorted(params.items()):
+            if name in ("f", "u", "t", "s", "p"):
+                continue
+            items.append((name, tuple(value) if isinstance(value, (list, tuple)) else value))
+        return endpoint, url.split("?", 1)[0], user, tuple(items)
+
+    def request(self, method, url, params=None, **kwargs):
+        endpoint = endpoint_name(url)
+
+        if method.upper() != "GET" or kwargs.get("stream"):
+            return super().request(method, url, params=params, **kwargs)
+
+        if endpoint in INVALIDATES:
+            response = super().request(method, url, params=params, **kwargs)
+            self.invalidate(*INVALIDATES[endpoint])
+            return response
+
+        ttl = self.ttls.get(endpoint)
+        if ttl is None:
+            return super().request(method, url, params=params, **kwargs)
+
+        key = self._key(endpoint, url, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry.expires > time.time():
+            self._count("hits")
+            return entry.to_response()
+
+        # Expired: conditional request if the server gave us a validator
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        response = super().request(method, url, params=params, headers=headers, **kwargs)
+
+        if entry is not None and response.status_code == 304:
+            with self._lock:
+                self.stats["revalidated"] += 1
+                entry.expires = time.time() + ttl
+            return entry.to_response()
+
+        self._count("misses")
+        if self._cacheable(response):
+            self._store(key, CacheEntry(
+                status_code=response.status_code,
+                headers=dict(response.headers),
+                content=response.content,
+                url=response.url,
+                encoding=response.encoding,
+                expires=time.time() + ttl,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                size=len(response.content),
+            ))
+        return response
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _cacheable(self, response):
+        if response.status_code != 200:
+            return False
+        try:
+            return response.json().get("subsonic-response", {}).get("status") == "ok"
+        except ValueError:
+            return False
+
+    def _store(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.stats["evictions"] += 1
+
+    def invalidate(self, *endpoints):
+        """Drops the cached responses of the given endpoints (all of them without arguments)."""
+        with self._lock:
+            for key in [key for key in self._entries if not endpoints or key[0] in endpoints]:
+                self._size -= self._entries.pop(key).size
+                self.stats["invalidated"] += 1
+
+    def log_stats(self):
+        requests_count = self.stats["hits"] + self.stats["misses"] + self.stats["revalidated"]
+        if not requests_count:
+            return
+        logger.info(f"Response cache: {self.stats['hits']} hits, {self.stats['revalidated']} revalidated, "
+                    f"{self.stats['misses']} misses ({(self.stats['hits'] + self.stats['revalidated']) / requests_count:.0%} served from cache), "
+                    f"{self.stats['evictions']} evicted, {self.stats['invalidated']} invalidated, "
+                    f"{len(self._entries)} entries / {self._size / 2 ** 20:.1f} MB")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get("format") != FILE_FORMAT or data.get("version") != FILE_VERSION:
+                raise ValueError("not a response cache of this version")
+            entries = []
+            for (endpoint, url, user, items), entry in data["entries"]:
+                items = tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in items)
+                entries.append(((endpoint, url, user, items), CacheEntry.from_json(entry)))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Response cache {self.path} not loaded: {e}")
+            return
+        now = time.time()
+        for key, entry in entries:
+            if key[0] not in self.ttls:
+                continue  # No longer cached
+            # Expired entries are kept only if they can be revalidated
+            if entry.expires > now or entry.etag or entry.last_modified:
+                self._store(key, entry)
+
+    def save(self):
+        """Writes the cache to its path (if any)."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            entries = [[list(key), entry.to_json()] for key, entry in self._entries.items()]
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": FILE_FORMAT, "version": FILE_VERSION, "entries": entries}, f)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        self.save()
+        self.log_stats()
+        super().close()
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import posixpath
+import logging
+import mimetypes
+from urllib.parse import quote
+
+import navidrome
+
+logger = logging.getLogger(__name__)
+
+# Navidrome database (navidrome.db in its data folder), only read: writes still go through the API
+DEFAULT_DB = os.getenv("NAVIDROME_DB")
+
+# Subsonic field <- media_file column, as returned by search2.view
+SONG_COLUMNS = [
+    ("id", "id"), ("parent", "album_id"), ("title", "title"), ("album", "album"), ("artist", "artist"),
+    ("track", "track_number"), ("year", "year"), ("genre", "genre"), ("size", "size"), ("suffix", "suffix"),
+    ("duration", "duration"), ("bitRate", "bit_rate"), ("path", "path"), ("discNumber", "disc_number"),
+    ("created", "created_at"), ("albumId", "album_id"), ("artistId", "artist_id"),
+]
+ALBUM_COLUMNS = [
+    ("id", "id"), ("name", "name"), ("artist", "album_artist"), ("artistId", "album_artist_id"),
+    ("songCount", "song_count"), ("duration", "duration"), ("created", "created_at"),
+    ("year", "max_year"), ("genre", "genre"),
+]
+ARTIST_COLUMNS = [("id", "id"), ("name", "name"), ("albumCount", "album_count")]
+INTEGER_FIELDS = {"track", "year", "size", "duration", "bitRate", "discNumber", "songCount", "albumCount"}
+
+
+def subsonic_time(value):
+    """'2024-05-01 10:20:30.123456789+00:00' (Navidrome storage) -> '2024-05-01T10:20:30Z'."""
+    if not value:
+        return None
+    value = str(value).replace("T", " ")
+    return f"{value[:10]}T{value[11:19]}Z"
+
+
+class NavidromeDatabase:
+    """
+    Read-only access to the Navidrome database, for bulk jobs on the same host as the server.
+
+    Songs, albums and artists are loaded with a few queries instead of paging search2.view,
+    and come back in the same shape as the navidrome.py functions with the same name,
+    with the starred flag and rating of `username` (default: the configured user).
+    Columns missing in the installed Navidrome version are left out of the records.
+    """
+
+    def __init__(self, path=DEFAULT_DB, username=None):
+        username = username or navidrome.USERNAME
+        if not path or not os.path.exists(path):
+            raise FileNotFoundError(f"Navidrome database not found: {path}")
+        self.path = path
+        # mode=ro: the server keeps writing the file, we never do
+        self.connection = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA query_only = ON")
+        self._columns = {}
+        self.user_id = self._user_id(username)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def columns(self, table):
+        if table not in self._columns:
+            self._columns[table] = {row["name"] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+        return self._columns[table]
+
+    def _user_id(self, username):
+        name_column = "user_name" if "user_name" in self.columns("user") else "username"
+        row = self.connection.execute(f"SELECT id FROM user WHERE {name_column} = ?", (username,)).fetchone()
+        if row is None:
+            raise ValueError(f"User '{username}' not found in {self.path}")
+        return row["id"]
+
+    def _select(self, table, mapping, alias):
+        """SELECT list of the mapped columns that exist in this Navidrome version."""
+        available = self.columns(table)
+        return [(field, f"{alias}.{column}") for field, column in mapping if column in available]
+
+    def _query(self, table, mapping, item_type, where="", parameters=(), order=""):
+        fields = self._select(table, mapping, "t")
+        select = ", ".join(f"{expression} AS \"{field}\"" for field, expression in fields)
+        path_prefix = ""
+        # From Navidrome 0.55 paths are relative to the library folder
+        if table == "media_file" and "library_id" in self.columns("media_file") and self.columns("library"):
+            path_prefix = ", l.path AS library_path"
+        sql = (f"SELECT {select}, a.starred AS starred_flag, a.starred_at, a.rating, a.play_count, a.play_date{path_prefix} "
+               f"FROM {table} t LEFT JOIN annotation a ON a.item_id = t.id AND a.item_type = ? AND a.user_id = ? ")
+        if path_prefix:
+            sql += "LEFT JOIN library l ON l.id = t.library_id "
+        conditions = [where] if where else []
+        if "missing" in self.columns(table):
+            conditions.append("NOT t.missing")
+        if conditions:
+            sql += "WHERE " + " AND ".join(f"({condition})" for condition in conditions) + " "
+        sql += order
+        rows = self.connection.execute(sql, (item_type, self.user_id, *parameters))
+        return [self._record(row, [field for field, _ in fields], table) for row in rows]
+
+    def _record(self, row, fields, table):
+        record = {}
+        for field in fields:
+            value = row[field]
+            if value is None or value == "":
+                continue
+            if field in INTEGER_FIELDS:
+                value = int(value)
+            elif field == "created":
+                value = subsonic_time(value)
+            record[field] = value
+
+        if table == "media_file":
+            record["isDir"] = False
+            record["type"] = "music"
+            record["isVideo"] = False
+            if "suffix" in record:
+                record["contentType"] = mimetypes.guess_type(f"x.{record['suffix']}")[0] or "application/octet-stream"
+            # Server-side paths: POSIX on the server even when the tools run on Windows
+            if "library_path" in row.keys() and row["library_path"] and "path" in record and not posixpath.isabs(record["path"]):
+                record["path"] = posixpath.join(row["library_path"], record["path"])
+        if row["starred_flag"]:
+            record["starred"] = subsonic_time(row["starred_at"])
+        if row["rating"]:
+            record["userRating"] = row["rating"]
+        if row["play_count"]:
+            record["playCount"] = row["play_count"]
+            if row["play_date"]:
+                record["played"] = subsonic_time(row["play_date"])
+        return record
+
+    def get_all_songs(self):
+        return self._query("media_file", SONG_COLUMNS, "media_file", order="ORDER BY t.path")
+
+    def get_starred(self):
+        return self._query("media_file", SONG_COLUMNS, "media_file", "a.starred", order="ORDER BY a.starred_at")
+
+    def get_starred_items(self):
+        """Starred songs, albums and artists (the starred2 object of navidrome.get_starred_items)."""
+        return {
+            "song": self.get_starred(),
+            "album": self._query("album", ALBUM_COLUMNS, "album", "a.starred", order="ORDER BY a.starred_at"),
+            "artist": self._query("artist", ARTIST_COLUMNS, "artist", "a.starred", order="ORDER BY a.starred_at"),
+        }
+
+    def get_song_by_id(self, songId):
+        songs = self._query("media_file", SONG_COLUMNS, "media_file", "t.id = ?", (songId,))
+        if not songs:
+            raise ValueError(f"Song {songId} not found in {self.path}.")
+        return songs[0]
+
+    def get_album_songs(self, albumId):
+        return self._query("media_file", SONG_COLUMNS, "media_file", "t.album_id = ?", (albumId,),
+                           order="ORDER BY t.disc_number, t.track_number")
+
+    def get_albums(self):
+        return self._query("album", ALBUM_COLUMNS, "album", order="ORDER BY t.name")
+
+    def get_artists(self):
+        return self._query("artist", ARTIST_COLUMNS, "artist", order="ORDER BY t.name")
+
+
+def open_database(path=DEFAULT_DB, username=None):
+    """Opens the Navidrome database read-only (see NavidromeDatabase)."""
+    database = NavidromeDatabase(path, username)
+    logger.info(f"Navidrome database {path}: reading songs directly, without search2.view")
+    return database
@@ -0,0 +1,375 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import logging
+from datetime import datetime, timedelta, timezone
+
+import navidrome
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import string_utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = os.getenv("NAVIDROME_MIRROR_DB", "navidrome-playlists/navidrome_mirror.db")
+# A full download also catches songs edited or removed between scans of new albums
+FULL_REFRESH_DAYS = 7
+ALBUM_PAGE_SIZE = 500
+UPSERT_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS songs (
+    id TEXT PRIMARY KEY, position INTEGER, title TEXT, artist TEXT, album TEXT, album_id TEXT, artist_id TEXT,
+    created TEXT, starred TEXT, user_rating INTEGER, data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_position ON songs(position);
+CREATE INDEX IF NOT EXISTS songs_album ON songs(album_id);
+CREATE TABLE IF NOT EXISTS albums (
+    id TEXT PRIMARY KEY, name TEXT, artist TEXT, artist_id TEXT, created TEXT, song_count INTEGER, starred TEXT
+);
+CREATE TABLE IF NOT EXISTS artists (
+    id TEXT PRIMARY KEY, position INTEGER, index_name TEXT, name TEXT, starred TEXT, data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    id TEXT PRIMARY KEY, position INTEGER, name TEXT, song_count INTEGER, changed TEXT, data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_songs (
+    playlist_id TEXT, position INTEGER, song_id TEXT, data TEXT NOT NULL, PRIMARY KEY (playlist_id, position)
+);
+"""
+# Full-text index of the songs for the offline search (accents and case folded like search2)
+FTS_SCHEMA = 'CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(title, artist, album, tokenize="unicode61 remove_diacritics 2")'
+WORD = re.compile(r"\w+")
+
+
+def parse_time(value):
+    """Parses Subsonic timestamps (ISO 8601, with 'Z' and optional fractions); None if missing."""
+    if not value:
+        return None
+    value = value.replace("Z", "+00:00")
+    # fromisoformat (before Python 3.11) only accepts 3 or 6 fraction digits
+    if "." in value:
+        head, _, tail = value.partition(".")
+        digits = len(tail) - len(tail.lstrip("0123456789"))
+        tail = tail[:digits][:6].ljust(6, "0") + tail[digits:]
+        value = f"{head}.{tail}"
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class NavidromeMirror:
+    """
+    Local SQLite copy of the Navidrome library: songs, albums, artists, starred flags, ratings and playlists.
+
+    refresh() downloads only what changed since the last refresh (see its docstring); the
+    get_* methods return the same data as the navidrome.py functions with the same name,
+    without any request to the server.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.execute(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search() falls back to LIKE
+            logger.warning("SQLite FTS5 not available: offline search will be slower")
+            self.has_fts = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _count(self, table):
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    # Refresh
+
+    def refresh(self, session, full=False):
+        """
+        Brings the mirror up to date and returns a summary of what was downloaded.
+
+        - Library: nothing is downloaded if the server has not scanned since the last refresh
+          (getScanStatus lastScan). After a scan, only the albums created after the newest song
+          of the mirror are downloaded; if the song count still differs from the server one
+          (songs removed or moved), or on the first run, with full=True or every
+          FULL_REFRESH_DAYS, all songs are downloaded again.
+        - Starred flags (one getStarred2 call) and playlists (getPlaylists, entries only of the
+          playlists whose `changed` or song count differ) are refreshed every time.
+        - Ratings are those of the last download of each song, refreshed every time for the
+          starred songs.
+        """
+        summary = {"library": "unchanged"}
+        status = navidrome.get_scan_status(session)
+        last_scan = status.get("lastScan")
+        library_changed = last_scan is None or last_scan != self._get_meta("last_scan")
+
+        last_full = parse_time(self._get_meta("last_full_refresh"))
+        full_due = last_full is None or datetime.now(timezone.utc) - last_full > timedelta(days=FULL_REFRESH_DAYS)
+
+        if full or full_due or not self._count("songs"):
+            summary.update(self._refresh_all_songs(session), library="full")
+        elif library_changed:
+            summary.update(self._refresh_new_albums(session), library="new albums")
+            expected = status.get("count")
+            if expected is not None and int(expected) != self._count("songs"):
+                logger.info(f"Mirror has {self._count('songs')} songs, server {expected}: downloading all songs")
+                summary.update(self._refresh_all_songs(session), library="full")
+
+        if summary["library"] != "unchanged":
+            self._rebuild_albums()
+            self._rebuild_search_index()
+        if summary["library"] != "unchanged" or not self._count("artists"):
+            summary["artists"] = self._refresh_artists(session)
+        summary["starred"] = self._refresh_starred(session)
+        summary["playlists"] = self._refresh_playlists(session)
+
+        self._set_meta("last_scan", last_scan)
+        self._set_meta("last_refresh", datetime.now(timezone.utc).isoformat())
+        self.connection.commit()
+        logger.info(f"Mirror refreshed ({self.path}): {summary}")
+        return summary
+
+    def _song_row(self, song, position):
+        return (song["id"], position, song.get("title"), song.get("artist"), song.get("album"), song.get("albumId"),
+                song.get("artistId"), song.get("created"), song.get("starred"), song.get("userRating"),
+                json.dumps(song, ensure_ascii=False))
+
+    def _upsert_songs(self, rows):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO songs (id, position, title, artist, album, album_id, artist_id, created, starred, user_rating, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _refresh_all_songs(self, session):
+        existing = {row["id"] for row in self.connection.execute("SELECT id FROM songs")}
+        seen = set()
+        rows = []
+        failed_pages = []
+        for position, song in enumerate(navidrome.iter_all_songs(session, failed_pages=failed_pages)):
+            seen.add(song["id"])
+            rows.append(self._song_row(song, position))
+            if len(rows) >= UPSERT_BATCH:
+                self._upsert_songs(rows)
+                rows = []
+        self._upsert_songs(rows)
+
+        if failed_pages:
+            # Songs of the missing pages would look removed: keep them until the next full download
+            logger.warning(f"{len(failed_pages)} pages not downloaded: removed songs will be detected on the next full refresh")
+            return {"songs_added": len(seen - existing), "songs_removed": 0, "failed_pages": len(failed_pages)}
+
+        removed = existing - seen
+        self.connection.executemany("DELETE FROM songs WHERE id = ?", ((song_id,) for song_id in removed))
+        self._set_meta("last_full_refresh", datetime.now(timezone.utc).isoformat())
+        return {"songs_added": len(seen - existing), "songs_removed": len(removed)}
+
+    def _newest_created(self):
+        newest = None
+        for row in self.connection.execute("SELECT DISTINCT created FROM songs WHERE created IS NOT NULL"):
+            created = parse_time(row["created"])
+            if newest is None or created > newest:
+                newest = created
+        return newest
+
+    def _refresh_new_albums(self, session):
+        """Downloads the songs of the albums created after the newest song of the mirror."""
+        since = self._newest_created()
+        position = self.connection.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM songs").fetchone()[0]
+        existing = {row["id"]: row["position"] for row in self.connection.execute("SELECT id, position FROM songs")}
+        albums = 0
+        added = 0
+        offset = 0
+        while True:
+            page = navidrome.get_album_list(session, "newest", ALBUM_PAGE_SIZE, offset)
+            new_albums = [album for album in page if since is None or (parse_time(album.get("created")) or since) >= since]
+            for album in new_albums:
+                songs = navidrome.get_album(session, album["id"]).get("song", [])
+                rows = []
+                for song in songs:
+                    if song["id"] in existing:
+                        rows.append(self._song_row(song, existing[song["id"]]))
+                        continue
+                    added += 1
+                    rows.append(self._song_row(song, position))
+                    position += 1
+                self._upsert_songs(rows)
+                albums += 1
+            # Albums are sorted newest first: stop at the first page with older albums
+            if len(new_albums) < len(page) or len(page) < ALBUM_PAGE_SIZE:
+                break
+            offset += ALBUM_PAGE_SIZE
+        return {"albums_downloaded": albums, "songs_added": added}
+
+    def _rebuild_albums(self):
+        self.connection.execute("DELETE FROM albums")
+        self.connection.execute(
+            "INSERT INTO albums (id, name, artist, artist_id, created, song_count) "
+            "SELECT album_id, MIN(album), MIN(artist), MIN(artist_id), MIN(created), COUNT(*) "
+            "FROM songs WHERE album_id IS NOT NULL GROUP BY album_id")
+
+    def _rebuild_search_index(self):
+        if not self.has_fts:
+            return
+        self.connection.execute("DELETE FROM songs_fts")
+        self.connection.execute("INSERT INTO songs_fts (rowid, title, artist, album) SELECT rowid, title, artist, album FROM songs")
+
+    def _refresh_artists(self, session):
+        self.connection.execute("DELETE FROM artists")
+        rows = []
+        for index in navidrome.get_artists(session):
+            for artist in index.get("artist", []):
+                rows.append((artist["id"], len(rows), index.get("name"), artist.get("name"), artist.get("starred"),
+                             json.dumps(artist, ensure_ascii=False)))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO artists (id, position, index_name, name, starred, data) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def _refresh_starred(self, session):
+        starred = navidrome.get_starred_items(session)
+        for table, key in (("songs", "song"), ("albums", "album"), ("artists", "artist")):
+            self.connection.execute(f"UPDATE {table} SET starred = NULL WHERE starred IS NOT NULL")
+            self.connection.executemany(f"UPDATE {table} SET starred = ? WHERE id = ?",
+                                        ((item.get("starred"), item["id"]) for item in starred.get(key, [])))
+            # Ratings of the starred songs are fresh too
+            if key == "song":
+                self.connection.executemany("UPDATE songs SET user_rating = ? WHERE id = ?",
+                                            ((item.get("userRating"), item["id"]) for item in starred.get(key, [])))
+        return len(starred.get("song", []))
+
+    def _refresh_playlists(self, session):
+        stored = {row["id"]: (row["changed"], row["song_count"])
+                  for row in self.connection.execute("SELECT id, changed, song_count FROM playlists")}
+        playlists = navidrome.get_playlists(session)
+        downloaded = 0
+        for position, playlist in enumerate(playlists):
+            playlist_id = playlist["id"]
+            if stored.get(playlist_id) != (playlist.get("changed"), playlist.get("songCount")):
+                self.connection.execute("DELETE FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))
+                # Written batch by batch: a large playlist is never held in memory at once
+                number = 0
+                for entries in navidrome.iter_playlist_songs(session, playlist_id):
+                    self.connection.executemany(
+                        "INSERT INTO playlist_songs (playlist_id, position, song_id, data) VALUES (?, ?, ?, ?)",
+                        ((playlist_id, number + offset, entry.get("id"), json.dumps(entry, ensure_ascii=False))
+                         for offset, entry in enumerate(entries)))
+                    number += len(entries)
+                downloaded += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO playlists (id, position, name, song_count, changed, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (playlist_id, position, playlist.get("name"), playlist.get("songCount"), playlist.get("changed"),
+                 json.dumps(playlist, ensure_ascii=False)))
+
+        removed = set(stored) - {playlist["id"] for playlist in playlists}
+        for playlist_id in removed:
+            self.connection.execute("DELETE FROM playlists WHERE id = ?", (playlist_id,))
+            self.connection.execute("DELETE FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))
+        return {"total": len(playlists), "downloaded": downloaded, "removed": len(removed)}
+
+    # Queries: same results as the navidrome.py functions
+
+    def _song(self, row):
+        song = json.loads(row["data"])
+        if row["starred"]:
+            song["starred"] = row["starred"]
+        else:
+            song.pop("starred", None)
+        if row["user_rating"]:
+            song["userRating"] = row["user_rating"]
+        else:
+            song.pop("userRating", None)
+        return song
+
+    def search(self, title, limit=navidrome.SEARCH_SONG_COUNT):
+        """
+        Offline navidrome.search: songs whose title, artist or album contain every word of the
+        cleaned title (as word prefixes, like search2), in library order.
+        """
+        words = WORD.findall(string_utils.clean_string(title))
+        if not words:
+            rows = self.connection.execute("SELECT * FROM songs ORDER BY position LIMIT ?", (limit,))
+        elif self.has_fts:
+            if not self.connection.execute("SELECT 1 FROM songs_fts LIMIT 1").fetchone() and self._count("songs"):
+                self._rebuild_search_index()
+                self.connection.commit()
+            query = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+            rows = self.connection.execute(
+                "SELECT songs.* FROM songs_fts JOIN songs ON songs.rowid = songs_fts.rowid "
+                "WHERE songs_fts MATCH ? ORDER BY songs.position LIMIT ?", (query, limit))
+        else:
+            conditions = " AND ".join(["(COALESCE(title, '') || ' ' || COALESCE(artist, '') || ' ' || COALESCE(album, '')) LIKE ?"] * len(words))
+            rows = self.connection.execute(f"SELECT * FROM songs WHERE {conditions} ORDER BY position LIMIT ?",
+                                           [f"%{word}%" for word in words] + [limit])
+        return [self._song(row) for row in rows]
+
+    def get_all_songs(self):
+        return [self._song(row) for row in self.connection.execute("SELECT * FROM songs ORDER BY position")]
+
+    def get_starred(self):
+        return [self._song(row) for row in self.connection.execute("SELECT * FROM songs WHERE starred IS NOT NULL ORDER BY starred")]
+
+    def get_song_by_id(self, songId):
+        row = self.connection.execute("SELECT * FROM songs WHERE id = ?", (songId,)).fetchone()
+        if row is None:
+            raise ValueError(f"Song {songId} not found in the mirror.")
+        return self._song(row)
+
+    def get_album_songs(self, albumId):
+        return [self._song(row) for row in self.connection.execute("SELECT * FROM songs WHERE album_id = ? ORDER BY position", (albumId,))]
+
+    def get_albums(self):
+        return [dict(row) for row in self.connection.execute("SELECT * FROM albums ORDER BY name")]
+
+    def get_artists(self):
+        indexes = []
+        for row in self.connection.execute("SELECT index_name, starred, data FROM artists ORDER BY position"):
+            if not indexes or indexes[-1]["name"] != row["index_name"]:
+                indexes.append({"name": row["index_name"], "artist": []})
+            artist = json.loads(row["data"])
+            if row["starred"]:
+                artist["starred"] = row["starred"]
+            else:
+                artist.pop("starred", None)
+            indexes[-1]["artist"].append(artist)
+        return indexes
+
+    def get_playlists(self):
+        return [json.loads(row["data"]) for row in self.connection.execute("SELECT data FROM playlists ORDER BY position")]
+
+    def get_playlist_songs(self, playlist_id):
+        return [json.loads(row["data"]) for row in self.connection.execute(
+            "SELECT data FROM playlist_songs WHERE playlist_id = ? ORDER BY position", (playlist_id,))]
+
+
+def open_mirror(session, path=DEFAULT_DB, full=False):
+    """Opens the mirror and refreshes it."""
+    mirror = NavidromeMirror(path)
+    mirror.refresh(session, full=full)
+    return mirror
+
+
+def search_song(mirror, artist, album, title, consider_album=True, only_one_result=False, permit_choice=True):
+    """navidrome.search_song on the mirror: same arguments (the mirror instead of the session) and results."""
+    return navidrome.match_search_results(mirror.search(title), artist, album, title, consider_album=consider_album)
@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from navidrome_cache import endpoint_name
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive connections per host: one per request in flight
+DEFAULT_POOL_SIZE = int(os.getenv("NAVIDROME_POOL_SIZE", os.getenv("NAVIDROME_MAX_IN_FLIGHT", "8")))
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (10, 300)
+
+# Retries of idempotent calls, with exponential backoff and full jitter
+RETRIES = int(os.getenv("NAVIDROME_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Calls that must not be repeated: a retry after a lost response would add the songs twice
+NON_IDEMPOTENT = {"createPlaylist", "updatePlaylist"}
+
+# Consecutive failures that pause every request, and how long (doubled while the server keeps failing)
+BREAKER_THRESHOLD = 10
+BREAKER_COOLDOWN = 5
+BREAKER_MAX_COOLDOWN = 120
+
+
+def backoff(attempt, retry_after=None):
+    """Seconds to wait before retry number attempt (1-based): Retry-After if given, otherwise full jitter."""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Shared by all the threads of a session: after threshold consecutive failures every request
+    waits for the cooldown, then a single probe request is let through. A successful probe
+    resumes everyone, a failed one pauses again for twice as long (up to max_cooldown).
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.trips = 0
+        self._failures = 0
+        self._current_cooldown = cooldown
+        self._open_until = 0
+        self._probing = False
+        self._condition = threading.Condition()
+
+    def wait(self):
+        """Blocks while the circuit is open."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.state == "open" and now >= self._open_until:
+                    self.state = "half_open"
+                    self._probing = False
+                if self.state == "closed":
+                    return
+                if self.state == "half_open" and not self._probing:
+                    self._probing = True
+                    return
+                self._condition.wait(max(self._open_until - now, 0) if self.state == "open" else 1.0)
+
+    def record_success(self):
+        with self._condition:
+            if self.state != "closed":
+                logger.info("✅ Navidrome is responding again, resuming requests")
+            self.state = "closed"
+            self._failures = 0
+            self._current_cooldown = self.cooldown
+            self._condition.notify_all()
+
+    def record_failure(self):
+        with self._condition:
+            if self.state == "half_open":
+                self._open()
+            elif self.state == "closed":
+                self._failures += 1
+                if self._failures >= self.threshold:
+                    self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.trips += 1
+        self._open_until = time.monotonic() + self._current_cooldown
+        logger.warning(f"⚠️ Navidrome is failing, pausing all requests for {self._current_cooldown}s")
+        self._current_cooldown = min(self._current_cooldown * 2, self.max_cooldown)
+        self._condition.notify_all()
+
+
+class RetryingAdapter(HTTPAdapter):
+    """HTTPAdapter with a sized pool, a default timeout, retries of idempotent calls and a circuit breaker."""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, retries=RETRIES, breaker=None):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+
+    def send(self, request, timeout=None, **kwargs):
+        endpoint = endpoint_name(request.url)
+        retries = self.retries if endpoint not in NON_IDEMPOTENT else 0
+        attempt = 0
+        while True:
+            self.breaker.wait()
+            try:
+                response = super().send(request, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                reason, delay = e.__class__.__name__, backoff(attempt + 1)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt >= retries:
+                    return response
+                reason, delay = f"HTTP {response.status_code}", backoff(attempt + 1, retry_after(response))
+                response.close()
+
+            attempt += 1
+            logger.warning(f"⚠️ {endpoint}: {reason}, retry {attempt}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def configure(session, pool_size=DEFAULT_POOL_SIZE):
+    """
+    Mounts a RetryingAdapter on the session and asks for compressed responses.
+
+    If one is already mounted with a large enough pool it is kept. Otherwise it is replaced by
+    a larger one (never a smaller one: other users of the session may need it), keeping the
+    circuit breaker shared, and the replaced adapters are closed with their connections.
+    """
+    current = session.get_adapter("https://")
+    if isinstance(current, RetryingAdapter):
+        if current.pool_size >= pool_size:
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            return session
+        pool_size = max(pool_size, current.pool_size)
+    breaker = current.breaker if isinstance(current, RetryingAdapter) else None
+    replaced = []
+    for prefix in ("http://", "https://"):
+        old = session.adapters.get(prefix)
+        if old is not None and all(old is not adapter for adapter in replaced):
+            replaced.append(old)
+        session.mount(prefix, RetryingAdapter(pool_size, breaker=breaker))
+        breaker = session.get_adapter(prefix).breaker
+    for adapter in replaced:
+        adapter.close()
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
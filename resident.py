@@ -0,0 +1,53 @@
+import os
+import threading
+
+# Objects kept alive between the jobs of music-service.py (session, snapshots, library, indexes).
+# Outside the service ACTIVE is False and every keep() just builds the object.
+
+ACTIVE = False
+
+_objects = {}
+_lock = threading.Lock()
+
+
+def keep(key, build, version=None):
+    """
+    Returns build(), reused by the following calls with the same key while the service runs.
+
+    The kept object is rebuilt when version (e.g. a file's mtime or the library scan time)
+    differs from the one it was built with.
+    """
+    if not ACTIVE:
+        return build()
+    with _lock:
+        entry = _objects.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = build()
+    with _lock:
+        _objects[key] = (version, value)
+    return value
+
+
+def file_version(path):
+    """(mtime, size) of a file, None if missing: a snapshot is reloaded when it changes."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def forget(key=None):
+    """Drops a kept object (all of them without a key)."""
+    with _lock:
+        if key is None:
+            _objects.clear()
+        else:
+            _objects.pop(key, None)
+
+
+def kept():
+    """Keys of the objects kept so far."""
+    with _lock:
+        return list(_objects)
@@ -0,0 +1,165 @@
+import sys
+import os
+import logging
+import argparse
+import time
+import importlib.util
+from datetime import datetime, timedelta
+
+import user_inputs
+import verified_store
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import file_utils, json_utils, log_utils
+
+logger = log_utils.setup_logging(os.path.basename(__file__), logging.INFO)
+
+DEFAULT_QUEUE_FILE = "compare_report/deferred_choices.jsonl"
+# Script del compare che ha accodato la scelta, in base alla chiave del brano sorgente nei report
+COMPARE_SCRIPTS = {"spotify": "compare-spotify-navidrome.py", "source": "compare-csv-navidrome.py"}
+
+
+def remove_from_report(report_dir, file_name, source, source_key=None):
+    """Rimuove il brano sorgente da un report JSON (se presente)."""
+    path = file_utils.append_dir_to_file_name(file_name, report_dir)
+    if not os.path.exists(path):
+        return
+    entries = json_utils.load_json_data(path)
+    kept = [e for e in entries if (e.get(source_key) if source_key else e) != source]
+    if len(kept) != len(entries):
+        json_utils.save_to_json_file(kept, file_name, report_dir)
+
+
+def apply_compare_choice(context, chosen):
+    """Applica ai report del compare la scelta fatta per un brano."""
+    report_dir = context["report_dir"]
+    source_key = context["source_key"]
+    source = context["source"]
+    entry = {source_key: source, "navidrome": chosen}
+
+    if context["report"] == context["part_match_file"]:
+        # Trovato senza album: da non trovato a parzialmente trovato
+        remove_from_report(report_dir, context["not_found_file"], source)
+        json_utils.save_to_json_file([entry], context["report"], report_dir, append=True)
+        logger.info(f"Aggiunto a {context['report']}")
+        return
+
+    # Trovato con album: lo tolgo dagli altri report e lo segno come verificato
+    remove_from_report(report_dir, context["not_found_file"], source)
+    remove_from_report(report_dir, context["part_match_file"], source, source_key)
+    json_utils.save_to_json_file([entry], context["report"], report_dir, append=True)
+    keys = verified_store.spotify_keys if source_key == "spotify" else verified_store.csv_keys
+    verified_store.VerifiedStore(file_utils.append_dir_to_file_name(context["verified_file"], report_dir), keys).add(source)
+    logger.info(f"Aggiunto a {context['report']} e {context['verified_file']}")
+
+
+def load_compare_script(source_key):
+    """I compare sono script, non moduli: caricati dal percorso."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), COMPARE_SCRIPTS[source_key])
+    spec = importlib.util.spec_from_file_location(os.path.splitext(COMPARE_SCRIPTS[source_key])[0].replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def refresh_readable_reports(report_dir, source_key):
+    """Riscrive i report leggibili (.log) di un compare dai report JSON aggiornati con le scelte."""
+    script = load_compare_script(source_key)
+
+    def load(file_name):
+        path = file_utils.append_dir_to_file_name(file_name, report_dir)
+        return json_utils.load_json_data(path) if os.path.exists(path) else []
+
+    found = load(script.FOUND_FILE)
+    partially_matched = load(script.PART_MATCH_FILE)
+    not_found = load(script.NOT_FOUND_FILE)
+    script.save_readable_list(found, script.FOUND_LOG_FILE, found=True, output_dir=report_dir)
+    script.save_readable_list(partially_matched, script.PART_MATCH_LOG_FILE, found=True, output_dir=report_dir)
+    script.save_readable_list(not_found, script.NOT_FOUND_LOG_FILE, found=False, output_dir=report_dir)
+    script.save_not_found_list(not_found, script.NOT_FOUND_LIST_FILE, found=False, output_dir=report_dir)
+    script.save_download_album_list(not_found, script.NOT_FOUND_DOWNLOAD_FILE, found=False, output_dir=report_dir)
+    logger.info(f"Report leggibili aggiornati in {report_dir}")
+
+
+def same_source(entry, other):
+    return entry["context"].get("source") is not None and entry["context"].get("source") == other["context"].get("source")
+
+
+def resolve(entries, pending, queue_file, touched_reports):
+    """Chiede le scelte in sospeso e le applica ai report; touched_reports raccoglie i report toccati."""
+    resolved_count = 0
+    for entry in pending:
+        # Già risolto insieme a un'altra scelta per lo stesso brano
+        if entry.get("resolved"):
+            continue
+
+        query = entry["query"]
+        context = entry["context"]
+        if entry["song_list_format"] == "spotify_ext":
+            # La scelta finisce nella cache degli album dello script che l'ha differita
+            user_inputs.set_album_cache_file(entry["album_cache_file"])
+
+        chosen = user_inputs.choose_song(entry["candidates"], query["title"], query["artist"], query["album"], entry["song_list_format"])
+
+        entry["resolved"] = True
+        entry["choice"] = chosen.get("id") if chosen else None
+
+        if chosen and context.get("report_dir"):
+            apply_compare_choice(context, chosen)
+            touched_reports[context["report_dir"]] = context["source_key"]
+            if context["report"] != context["part_match_file"]:
+                # Il brano è trovato: le altre scelte per lo stesso brano non servono più
+                for other in entries:
+                    if not other.get("resolved") and same_source(entry, other):
+                        other["resolved"] = True
+                        other["choice"] = None
+
+        resolved_count += 1
+        # Salvo dopo ogni scelta: la sessione si può interrompere e riprendere
+        user_inputs.save_deferred_queue(queue_file, entries)
+
+    logger.info(f"{resolved_count} scelte risolte")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Risolve le scelte ambigue accodate in modalità differita')
+    parser.add_argument('queue_file', nargs='?', default=DEFAULT_QUEUE_FILE, help=f'File della coda (default: {DEFAULT_QUEUE_FILE})')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queue_file):
+        logger.info(f"Nessuna coda trovata in {args.queue_file}")
+        return
+
+    entries = user_inputs.load_deferred_queue(args.queue_file)
+    pending = [e for e in entries if not e.get("resolved")]
+    logger.info(f"{len(pending)} scelte da risolvere su {len(entries)} in coda")
+
+    # Report dei compare toccati dalle scelte: i .log si riscrivono alla fine (anche se interrotto)
+    touched_reports = {}
+    try:
+        resolve(entries, pending, args.queue_file, touched_reports)
+    finally:
+        for report_dir, source_key in touched_reports.items():
+            refresh_readable_reports(report_dir, source_key)
+
+
+if __name__ == "__main__":
+    start_time = time.time()
+    start_datetime = datetime.now()
+
+    logger.info(f"🚀 Start time: {start_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    main()
+
+    end_time = time.time()
+    end_datetime = datetime.now()
+    duration = timedelta(seconds=int(end_time - start_time))
+
+    hours = duration.seconds // 3600
+    minutes = (duration.seconds % 3600) // 60
+    seconds = duration.seconds % 60
+
+    logger.info(f"✅ End time: {end_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"⏱️ Duration: {hours} hours, {minutes} minutes, {seconds} seconds")
@@ -0,0 +1,120 @@
+import re
+import math
+import logging
+import unicodedata
+from collections import Counter, defaultdict
+
+import utility
+
+logger = logging.getLogger(__name__)
+
+# Separators used in artist credits ("A feat. B", "A & B", "A, B", ...)
+ARTIST_SEPARATORS = re.compile(r"\s*(?:,|;|/|&|\+|\bfeat\.?|\bft\.?|\bfeaturing\b|\bwith\b|\bx\b|\band\b|\be\b)\s*", re.IGNORECASE)
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# Artist words too common to narrow anything ("The Beatles" must still find "Beatles")
+ARTIST_STOPWORDS = {"the", "a", "an", "of", "and", "il", "la", "le", "lo", "los", "las", "i", "gli", "les"}
+
+
+def normalize_key(text):
+    """Lowercase, strip accents and punctuation: used only to build index keys."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return NON_ALNUM.sub(" ", text).strip()
+
+
+def title_keys(title):
+    """Index keys of a title: whole tokens plus character trigrams of the title the scorer compares."""
+    normalized = normalize_key(utility.normalize(title))
+    if not normalized:
+        return set()
+    keys = {f"w:{token}" for token in normalized.split()}
+    padded = f" {normalized} "
+    keys.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return keys
+
+
+def artist_keys(artists):
+    """Index keys of an artist credit (string or list): each credited artist and each of its words."""
+    if isinstance(artists, str):
+        artists = [artists]
+    keys = set()
+    for artist in artists or []:
+        if not artist:
+            continue
+        full = normalize_key(artist)
+        if full:
+            keys.add(full)
+        for part in ARTIST_SEPARATORS.split(str(artist)):
+            part = normalize_key(part)
+            if part:
+                keys.add(part)
+        keys.update(f"w:{word}" for word in full.split() if word not in ARTIST_STOPWORDS)
+    return keys
+
+
+class SongIndex:
+    """
+    In-memory candidate index over a song list, built once and reused by utility.find_song.
+
+    Songs are keyed by the tokens and trigrams of their cleaned title (utility.normalize,
+    as compared by the scorer) and by their artists and artist words.
+    A song is a candidate for a query when it shares at least `min_overlap` of the
+    query title keys, or when it shares an artist or an artist word with the query.
+    With no candidate at all the whole list is scanned. Candidates keep the order of
+    the original list, so ties are resolved exactly as in the full scan.
+    """
+
+    def __init__(self, song_list, song_list_format="navidrome", min_overlap=0.25):
+        self.songs = list(song_list)
+        self.song_list_format = song_list_format
+        self.min_overlap = min_overlap
+        self._title_postings = defaultdict(list)
+        self._artist_postings = defaultdict(list)
+        # (title, artist, album) of each song, extracted once
+        self.fields = [utility.get_song_fields(song, song_list_format) for song in self.songs]
+
+        for position, (title, artist, _) in enumerate(self.fields):
+            for key in title_keys(title):
+                self._title_postings[key].append(position)
+            for key in artist_keys(artist):
+                self._artist_postings[key].append(position)
+
+        logger.info(f"Song index built: {len(self.songs)} songs, {len(self._title_postings)} title keys, {len(self._artist_postings)} artist keys")
+
+    def __len__(self):
+        return len(self.songs)
+
+    def candidate_positions(self, title, artists, fallback=True):
+        """
+        Returns the sorted positions of the songs worth scoring for a query.
+
+        With fallback=False a query that shares no key with any song gets no candidates
+        instead of the full scan (to tell whether some song may match at all).
+        """
+        query_keys = title_keys(title)
+        if not query_keys:
+            # Nothing to filter on: fall back to the full scan
+            return list(range(len(self.songs)))
+
+        counts = Counter()
+        for key in query_keys:
+            counts.update(self._title_postings.get(key, ()))
+
+        required = max(1, math.ceil(len(query_keys) * self.min_overlap))
+        positions = {position for position, count in counts.items() if count >= required}
+
+        for key in artist_keys(artists):
+            positions.update(self._artist_postings.get(key, ()))
+
+        if not positions and fallback:
+            # A match can still come from fuzzy title and artist scores: keep the full scan
+            return list(range(len(self.songs)))
+        return sorted(positions)
+
+    def candidates(self, title, artists):
+        """Returns the songs worth scoring for a query, in library order."""
+        positions = self.candidate_positions(title, artists)
+        logger.debug(f"Index candidates: {len(positions)}/{len(self.songs)}")
+        return [self.songs[position] for position in positions]
@@ -2,6 +2,8 @@ import os
 import argparse
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+import resident
+import music_service
 from dotenv import load_dotenv
 import sys
 import logging
@@ -68,10 +70,12 @@ def main():
     parser.add_argument('--playlist-ids', nargs='*', help="ID delle playlist da esportare (separati da spazio)")
     args = parser.parse_args()
 
-    sp = spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=CLIENT_ID,
-                                                   client_secret=CLIENT_SECRET,
-                                                   redirect_uri=REDIRECT_URI,
-                                                   scope=SCOPES))
+    # Con il servizio residente il client viene ricreato se cambia l'utente (credenziali o token in .cache)
+    sp = resident.keep("spotify.client", lambda: spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=CLIENT_ID,
+                                                                                          client_secret=CLIENT_SECRET,
+                                                                                          redirect_uri=REDIRECT_URI,
+                                                                                          scope=SCOPES)),
+                       (CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, os.path.abspath(".cache"), resident.file_version(".cache")))
 
     if args.playlist_ids:
         # Esporta solo le playlist specificate
@@ -107,6 +111,11 @@ def main():
         json_utils.save_to_json_file(liked_songs, "Brani preferiti.json", OUTPUT_DIR)
 
 if __name__ == "__main__":
+    # Con il servizio residente avviato (music-service.py) il comando viene eseguito lì
+    exit_code = music_service.run_in_service(__file__)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     start_time = time.time()
     start_datetime = datetime.now()
     
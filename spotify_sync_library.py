@@ -8,12 +8,15 @@ import os
 import sys
 import argparse
 import traceback
+import queue
+import threading
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Any
 import time
 from dotenv import load_dotenv
 import utility
+import user_inputs
 
 sys.path.append('../')
 sys.path.append('../common_py_utils')
@@ -40,6 +43,7 @@ except ImportError as e:
 load_dotenv()
 
 REPORT_DIR = "spotify_sync_report"
+DEFERRED_FILE = "deferred_choices.jsonl"
 CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI')
@@ -55,6 +59,11 @@ def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
         'spotify_search_limit': 30,
         'progress_report_interval': 100,
         'base_delay': 0.1,
+        'read_workers': 4,
+        'spotify_workers': 4,
+        'write_workers': 2,
+        'queue_size': 256,
+        'defer_choices': False,
         'supported_formats': ['.mp3', '.flac', '.m4a', '.ogg', '.opus'],
         'report_dir': 'spotify_sync_report',
         'progress_bar': {
@@ -80,6 +89,29 @@ def load_config(config_file: Optional[str] = None) -> Dict[str, Any]:
     
     return default_config
 
+class RateLimiter:
+    """Intervallo minimo tra le chiamate API, condiviso da tutti i thread"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Attende il proprio turno prima di una chiamata"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_call)
+            self._next_call = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        """Sospende le chiamate di tutti i thread (rate limit Spotify)"""
+        with self._lock:
+            self._next_call = max(self._next_call, time.monotonic() + seconds)
+
+
 class MusicLibrarySync:
     """Classe principale per la sincronizzazione con Spotify"""
     
@@ -124,6 +156,17 @@ class MusicLibrarySync:
         self.spotify_search_limit = config.get('spotify_search_limit', 30)
         self.progress_report_interval = config.get('progress_report_interval', 100)
         self.base_delay = config.get('base_delay', 0.1)
+        self.defer_choices = config.get('defer_choices', False)
+        
+        # Pipeline: lettura tag, ricerca Spotify e scrittura tag in thread separati
+        self.read_workers = max(1, config.get('read_workers', 4))
+        self.spotify_workers = max(1, config.get('spotify_workers', 4))
+        self.write_workers = max(1, config.get('write_workers', 2))
+        self.queue_size = max(1, config.get('queue_size', 256))
+        self.rate_limiter = RateLimiter(self.base_delay)
+        self._stats_lock = threading.Lock()
+        # Le scelte dell'utente (e il contesto delle scelte differite) una alla volta
+        self._choice_lock = threading.Lock()
         
         # Aggiorna formati supportati se specificati
         if 'supported_formats' in config:
@@ -139,6 +182,10 @@ class MusicLibrarySync:
         self.logger.info(f"Inizializzazione script - Modalità: {'SCRITTURA' if self.write_tags else 'SIMULAZIONE'}")
         self.logger.info(f"Max retries per rate limit: {self.max_retries}")
 
+        # Scelte ambigue accodate invece di bloccare l'esecuzione
+        if self.defer_choices:
+            user_inputs.set_deferred_mode(file_utils.append_dir_to_file_name(DEFERRED_FILE, REPORT_DIR))
+
         # Setup Spotify
         self.setup_spotify()
         
@@ -156,6 +203,11 @@ class MusicLibrarySync:
         
         # Report dettagliato
         self.detailed_report = []
+    
+    def _count(self, stat: str):
+        """Incrementa una statistica (chiamata dai thread della pipeline)"""
+        with self._stats_lock:
+            self.stats[stat] += 1
         
     def setup_spotify(self):
         """Configura connessione Spotify"""
@@ -327,12 +379,13 @@ class MusicLibrarySync:
             return [str(v) for v in audio_file[tag_name] if v]
         return []
     
-    def search_spotify_track(self, metadata: Dict[str, str]) -> Optional[Dict]:
-        """Cerca brano su Spotify con retry per rate limit"""
+    def search_spotify_track(self, metadata: Dict[str, str], file_path: Optional[Path] = None) -> Optional[Dict]:
+        """Cerca brano su Spotify con retry per rate limit (può girare in più thread)"""
         retry_count = 0
         
         while retry_count <= self.max_retries:
             try:
+                track = None
                 # Costruisci query di ricerca
                 query_parts = []
                 
@@ -361,6 +414,7 @@ class MusicLibrarySync:
                     query = ' '.join(query_parts)
                     
                     # Ricerca su Spotify
+                    self.rate_limiter.wait()
                     results = self.spotify.search(q=query, type='track', limit=self.spotify_search_limit)
                 
                     if not results['tracks']['items']:
@@ -369,12 +423,19 @@ class MusicLibrarySync:
                             simple_query = f"{' '.join(metadata['artists'])} {metadata.get('title', '')}"
                         else:
                             simple_query = f"{metadata.get('artist', '')} {metadata.get('title', '')}"
+                        self.rate_limiter.wait()
                         results = self.spotify.search(q=simple_query, type='track', limit=self.spotify_search_limit)
                 
                     if results['tracks']['items']:
                         # Usa lista artisti se disponibile, altrimenti fallback su artista singolo
                         artists = metadata.get('artists', [metadata.get('artist', '')])
-                        track = utility.find_song(metadata["title"], artists, metadata["album"], results['tracks']['items'], "spotify_ext", only_first_result=False, permit_choice=True, consider_album=True)
+                        best_matches = utility.find_best_matches(metadata["title"], artists, metadata["album"], results['tracks']['items'], "spotify_ext", consider_album=True)
+                        if len(best_matches) > 1:
+                            # Il punteggio si calcola in parallelo, le scelte si fanno una alla volta
+                            with self._choice_lock, user_inputs.deferred_context(file=str(file_path)):
+                                track = utility.choose_match(best_matches, metadata["title"], artists, metadata["album"], "spotify_ext")
+                        elif best_matches:
+                            track = best_matches[0]
                         # Prendi il primo risultato (più rilevante)
                         #track = results['tracks']['items'][0]
                 
@@ -398,6 +459,7 @@ class MusicLibrarySync:
                     # Aggiungi audio features se richieste
                     if self.audio_features:
                         try:
+                            self.rate_limiter.wait()
                             features = self.spotify.audio_features(track['id'])[0]
                             if features:
                                 spotify_data.update({
@@ -417,12 +479,13 @@ class MusicLibrarySync:
                 # Controlla se è un rate limit
                 if 'rate limit' in error_msg:
                     retry_count += 1
-                    self.stats['rate_limit_retries'] += 1
+                    self._count('rate_limit_retries')
                     
                     if retry_count <= self.max_retries:
                         wait_time = 10 * retry_count  # Tempo di attesa progressivo
                         self.logger.warning(f"Rate limit raggiunto (tentativo {retry_count}/{self.max_retries}), attendo {wait_time} secondi...")
-                        time.sleep(wait_time)
+                        # Si fermano tutti i thread, non solo questo
+                        self.rate_limiter.pause(wait_time)
                         continue
                     else:
                         self.logger.error(f"Rate limit persistente dopo {self.max_retries} tentativi, abbandono ricerca")
@@ -457,9 +520,9 @@ class MusicLibrarySync:
             
         return False
     
-    def process_file(self, file_path: Path) -> Dict:
-        """Processa singolo file audio"""
-        self.stats['files_processed'] += 1
+    def read_file(self, file_path: Path) -> Dict:
+        """Primo stadio: legge i metadati e decide se il file va cercato su Spotify (stato 'pending')"""
+        self._count('files_processed')
         
         result = {
             'file': str(file_path),
@@ -473,7 +536,7 @@ class MusicLibrarySync:
         metadata = self.get_audio_file_metadata(file_path)
         if not metadata:
             result['message'] = 'Impossibile leggere metadati'
-            self.stats['errors'] += 1
+            self._count('errors')
             return result
             
         result['metadata'] = metadata
@@ -482,41 +545,58 @@ class MusicLibrarySync:
         if metadata.get('already_synced') and self.skip_synced:
             result['message'] = 'File già sincronizzato (spotify_id presente)'
             result['status'] = 'already_synced'
-            self.stats['already_synced'] += 1
+            self._count('already_synced')
             return result
         
         # Verifica metadati minimi
         if not metadata.get('title') or not metadata.get('artist'):
             result['message'] = 'Metadati insufficienti (titolo/artista mancanti)'
-            self.stats['skipped'] += 1
+            self._count('skipped')
             result['status'] = 'skipped'
             return result
         
+        result['status'] = 'pending'
+        return result
+    
+    def match_file(self, file_path: Path, result: Dict) -> Dict:
+        """Secondo stadio: cerca il brano su Spotify (stato 'found' o 'not_found')"""
+        metadata = result['metadata']
         self.logger.info(f"{metadata.get('artist')} - {metadata.get('album')} - {metadata.get('title')}")
 
         # Cerca su Spotify
-        spotify_data = self.search_spotify_track(metadata)
+        spotify_data = self.search_spotify_track(metadata, file_path)
         if spotify_data:
             result['spotify_data'] = spotify_data
             result['status'] = 'found'
-            self.stats['spotify_matches'] += 1
-            
-            # Scrivi tag
-            if self.write_spotify_tags(file_path, spotify_data):
-                self.stats['tags_written'] += 1
-                result['message'] = f"Tag {'scritti' if self.write_tags else 'simulati'} con successo"
-            else:
-                result['message'] = 'Errore scrittura tag'
-                result['status'] = 'error'
-                self.stats['errors'] += 1
+            self._count('spotify_matches')
         else:
             result['status'] = 'not_found'
             result['message'] = 'Brano non trovato su Spotify'
             self.logger.info("Brano non trovato su Spotify")
-            self.stats['spotify_not_found'] += 1
+            self._count('spotify_not_found')
             
         return result
     
+    def tag_file(self, file_path: Path, result: Dict) -> Dict:
+        """Terzo stadio: scrive i tag Spotify di un brano trovato"""
+        if self.write_spotify_tags(file_path, result['spotify_data']):
+            self._count('tags_written')
+            result['message'] = f"Tag {'scritti' if self.write_tags else 'simulati'} con successo"
+        else:
+            result['message'] = 'Errore scrittura tag'
+            result['status'] = 'error'
+            self._count('errors')
+        return result
+    
+    def process_file(self, file_path: Path) -> Dict:
+        """Processa singolo file audio (i tre stadi in sequenza)"""
+        result = self.read_file(file_path)
+        if result['status'] == 'pending':
+            result = self.match_file(file_path, result)
+            if result['status'] == 'found':
+                result = self.tag_file(file_path, result)
+        return result
+    
     def scan_directory(self) -> List[Path]:
         """Scansiona directory per file audio"""
         audio_files = []
@@ -569,14 +649,85 @@ class MusicLibrarySync:
         print()  # Nuova riga dopo progress bar
         self.generate_final_report(duration)
     
+    def _process_files(self, audio_files, on_result):
+        """
+        Processa i file con una pipeline a tre stadi: lettura tag (read_workers thread),
+        ricerca Spotify (spotify_workers thread, con rate limiter condiviso) e scrittura
+        tag (write_workers thread), collegati da code limitate a queue_size elementi.
+        
+        on_result(result, done) è chiamata nel thread principale, in ordine di completamento;
+        il report dettagliato resta nell'ordine dei file.
+        """
+        to_read = queue.Queue(self.queue_size)
+        to_match = queue.Queue(self.queue_size)
+        to_tag = queue.Queue(self.queue_size)
+        finished = queue.Queue()
+        
+        def read(index, file_path):
+            self.logger.debug(f"Processando: {file_path.name}")
+            result = self.read_file(file_path)
+            if result['status'] == 'pending':
+                to_match.put((index, file_path, result))
+            else:
+                finished.put((index, result))
+        
+        def match(index, file_path, result):
+            result = self.match_file(file_path, result)
+            if result['status'] == 'found':
+                to_tag.put((index, file_path, result))
+            else:
+                finished.put((index, result))
+        
+        def tag(index, file_path, result):
+            finished.put((index, self.tag_file(file_path, result)))
+        
+        def feed():
+            for item in enumerate(audio_files):
+                to_read.put(item)
+        
+        stages = [
+            ('lettura', read, to_read, self.read_workers),
+            ('spotify', match, to_match, self.spotify_workers),
+            ('scrittura', tag, to_tag, self.write_workers),
+        ]
+        self.logger.info(f"Pipeline: {self.read_workers} thread lettura, {self.spotify_workers} thread Spotify "
+                         f"(una chiamata ogni {self.base_delay}s), {self.write_workers} thread scrittura")
+        
+        threading.Thread(target=feed, name="feed", daemon=True).start()
+        for name, handle, inbox, workers in stages:
+            for n in range(workers):
+                threading.Thread(target=self._stage_worker, args=(handle, inbox, finished),
+                                 name=f"{name}-{n}", daemon=True).start()
+        
+        # Ogni file esce dalla pipeline una sola volta: niente segnali di chiusura tra gli stadi
+        results = [None] * len(audio_files)
+        for done in range(1, len(audio_files) + 1):
+            index, result = finished.get()
+            results[index] = result
+            on_result(result, done)
+        self.detailed_report.extend(results)
+    
+    def _stage_worker(self, handle, inbox, finished):
+        """Thread di uno stadio: un errore imprevisto chiude il file come 'error' invece di perderlo"""
+        while True:
+            index, file_path, *rest = inbox.get()
+            try:
+                handle(index, file_path, *rest)
+            except Exception as e:
+                self.logger.error(f"Errore processando {file_path}: {e}")
+                self.logger.debug(f"Traceback completo:\n{traceback.format_exc()}")
+                self._count('errors')
+                finished.put((index, {
+                    'file': str(file_path),
+                    'status': 'error',
+                    'metadata': rest[0]['metadata'] if rest else {},
+                    'spotify_data': rest[0]['spotify_data'] if rest else {},
+                    'message': f'Errore imprevisto: {e}'
+                }))
+    
     def _process_files_with_progress(self, audio_files, progress):
         """Processa file con progress bar"""
-        for file_path in audio_files:
-            self.logger.debug(f"Processando: {file_path.name}")
-            
-            result = self.process_file(file_path)
-            self.detailed_report.append(result)
-            
+        def on_result(result, done):
             # Aggiorna progress in base al risultato
             status = result['status']
             if status in ['found', 'already_synced']:
@@ -585,24 +736,19 @@ class MusicLibrarySync:
                 progress.increment('skipped')
             else:  # error
                 progress.increment('failed')
-            
-            # Rate limiting Spotify
-            time.sleep(self.base_delay)
+        
+        self._process_files(audio_files, on_result)
     
     def _process_files_traditional(self, audio_files):
         """Processa file con output tradizionale (senza progress bar)"""
-        for i, file_path in enumerate(audio_files, 1):
-            self.logger.info(f"[{i}/{len(audio_files)}] Processando: {file_path.name}")
-            
-            result = self.process_file(file_path)
-            self.detailed_report.append(result)
-            
-            # Rate limiting Spotify
-            time.sleep(self.base_delay)
+        def on_result(result, done):
+            self.logger.info(f"[{done}/{len(audio_files)}] {Path(result['file']).name}: {result['status']}")
             
             # Progress report configurabile
-            if i % self.progress_report_interval == 0:
-                self.logger.info(f"Progresso: {i}/{len(audio_files)} file processati")
+            if done % self.progress_report_interval == 0:
+                self.logger.info(f"Progresso: {done}/{len(audio_files)} file processati")
+        
+        self._process_files(audio_files, on_result)
         
     def generate_final_report(self, duration):
         """Genera report finale"""
@@ -621,6 +767,7 @@ class MusicLibrarySync:
             f.write(f"Modalità: {'SCRITTURA' if self.write_tags else 'SIMULAZIONE'}\n")
             f.write(f"Audio Features: {'SÌ' if self.audio_features else 'NO'}\n")
             f.write(f"Max Retries: {self.max_retries}\n")
+            f.write(f"Thread (lettura/Spotify/scrittura): {self.read_workers}/{self.spotify_workers}/{self.write_workers}\n")
             f.write(f"Durata: {duration}\n\n")
             
             f.write("STATISTICHE:\n")
@@ -660,7 +807,11 @@ class MusicLibrarySync:
                 'music_dir': str(self.music_dir),
                 'write_tags': self.write_tags,
                 'audio_features': self.audio_features,
-                'max_retries': self.max_retries
+                'max_retries': self.max_retries,
+                'read_workers': self.read_workers,
+                'spotify_workers': self.spotify_workers,
+                'write_workers': self.write_workers,
+                'base_delay': self.base_delay
             },
             'stats': self.stats,
             'duration_seconds': duration.total_seconds(),
@@ -686,6 +837,8 @@ class MusicLibrarySync:
         print(f"Tag {'scritti' if self.write_tags else 'simulati'}: {self.stats['tags_written']}")
         print(f"Errori: {self.stats['errors']}")
         print(f"Retry rate limit: {self.stats['rate_limit_retries']}")
+        if user_inputs.deferred_count():
+            print(f"Scelte differite: {user_inputs.deferred_count()} (risolvile con resolve-deferred-choices.py {file_utils.append_dir_to_file_name(DEFERRED_FILE, REPORT_DIR)})")
         if self.stats['files_processed'] > 0:
             success_rate = (self.stats['spotify_matches'] / self.stats['files_processed']) * 100
             print(f"Tasso successo: {success_rate:.1f}%")
@@ -715,12 +868,16 @@ def main():
                        help='Livello di logging (sovrascrive config)')
     parser.add_argument('--max-retries', type=int,
                        help='Numero massimo di tentativi per rate limit (sovrascrive config)')
+    parser.add_argument('--spotify-workers', type=int,
+                       help='Numero di thread per le ricerche Spotify (sovrascrive config)')
     parser.add_argument('--skip-synced', action='store_true',
                        help='Salta tracce già sincronizzate (sovrascrive config)')
     parser.add_argument('--no-skip-synced', action='store_true',
                        help='Non saltare tracce già sincronizzate (sovrascrive config)')
     parser.add_argument('--no-progress-bar', action='store_true',
                        help='Disabilita progress bar (sovrascrive config)')
+    parser.add_argument('--defer-choices', action='store_true',
+                       help='Accoda le scelte ambigue invece di chiederle (sovrascrive config)')
     
     args = parser.parse_args()
     
@@ -741,12 +898,16 @@ def main():
         config['log_level'] = args.log_level
     if args.max_retries is not None:
         config['max_retries'] = args.max_retries
+    if args.spotify_workers is not None:
+        config['spotify_workers'] = args.spotify_workers
     if args.skip_synced:
         config['skip_synced'] = True
     if args.no_skip_synced:
         config['skip_synced'] = False
     if args.no_progress_bar:
         config['progress_bar']['enabled'] = False
+    if args.defer_choices:
+        config['defer_choices'] = True
     
     # Verifica directory
     if not os.path.exists(config['music_dir']):
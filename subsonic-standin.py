@@ -0,0 +1,42 @@
+import sys
+import os
+import time
+import logging
+import argparse
+
+import subsonic_standin
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import log_utils
+
+logger = log_utils.setup_logging(os.path.basename(__file__), logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description='Server Subsonic locale che simula Navidrome su una libreria sintetica, per test di carico')
+    parser.add_argument('--port', type=int, default=4533, help='Porta (default: 4533)')
+    parser.add_argument('--size', type=int, default=10000, help='Brani della libreria generata (default: 10000)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latenza aggiunta a ogni richiesta')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Latenza casuale aggiuntiva (da 0 a questo valore)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Quota di risposte HTTP 503 (0-1)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Quota di risposte Subsonic con status "failed" (0-1)')
+    parser.add_argument('--rate-limit', type=float, default=None, help='Richieste al secondo oltre le quali risponde 429')
+    args = parser.parse_args()
+
+    faults = subsonic_standin.Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.fail_rate, args.rate_limit, seed=args.seed)
+    standin = subsonic_standin.SubsonicStandIn(args.size, args.seed, args.port, faults=faults)
+    url = standin.start()
+    logger.info(f"Usa NAVIDROME_URL={url} (qualsiasi utente e password). Ctrl+C per fermare.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.stop()
+        standin.log_stats()
+
+if __name__ == "__main__":
+    main()
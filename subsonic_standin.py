@@ -0,0 +1,389 @@
+import gzip
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import synthetic_library
+
+logger = logging.getLogger(__name__)
+
+# Local Subsonic-compatible stand-in for Navidrome, backed by a synthetic library, for load tests.
+
+API_VERSION = "1.16.1"
+GZIP_MIN_BYTES = 1024
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _timestamp(moment=None):
+    return (moment or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _fold(text):
+    return synthetic_library.strip_accents(text or "").lower()
+
+
+class SubsonicError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class Faults:
+    """
+    Injected misbehaviour: latency (+ uniform jitter) per request, a share of HTTP 503
+    responses (error_rate), a share of Subsonic 'failed' responses (fail_rate) and a
+    token-bucket rate limit (requests per second, HTTP 429 with Retry-After when exceeded).
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, fail_rate=0.0, rate_limit=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.fail_rate = fail_rate
+        self.rate_limit = rate_limit
+        self._rng = random.Random(seed)
+        self._tokens = rate_limit or 0
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms)
+        return (self.latency_ms + jitter) / 1000
+
+    def allow(self):
+        """False if the request goes over the rate limit."""
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+            self._refilled = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def http_error(self):
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def subsonic_failure(self):
+        with self._lock:
+            return self._rng.random() < self.fail_rate
+
+
+class Library:
+    """Songs, albums and artists of a synthetic library, with starred flags, ratings and playlists."""
+
+    def __init__(self, size, seed=42):
+        self.songs = synthetic_library.generate_library(size, seed=seed)
+        self.by_id = {}
+        self.albums = {}
+        self.artists = {}
+        for position, song in enumerate(self.songs):
+            artist_id = "ar-" + hashlib.md5(song["artist"].encode("utf-8")).hexdigest()[:10]
+            song["artistId"] = artist_id
+            song["created"] = _timestamp(BASE_TIME + timedelta(minutes=position))
+            song["path"] = f"/music/{song['artist']}/{song['album']}/{song['track']:02d} - {song['title']}.mp3"
+            song["suffix"] = "mp3"
+            self.by_id[song["id"]] = song
+            album = self.albums.setdefault(song["albumId"], {
+                "id": song["albumId"], "name": song["album"], "artist": song["artist"], "artistId": artist_id,
+                "songCount": 0, "duration": 0, "created": song["created"], "year": song["year"], "genre": song["genre"],
+            })
+            album["songCount"] += 1
+            album["duration"] += song["duration"]
+            self.artists.setdefault(artist_id, {"id": artist_id, "name": song["artist"], "albums": set()})["albums"].add(song["albumId"])
+        self.album_songs = {}
+        for song in self.songs:
+            self.album_songs.setdefault(song["albumId"], []).append(song)
+        # Words of title, artist and album, accents and case folded (search2 matches word prefixes)
+        self.words = [_fold(f"{song['title']} {song['artist']} {song['album']}").split() for song in self.songs]
+
+        self.starred = {}
+        self.ratings = {}
+        self.playlists = {}
+        self.last_scan = _timestamp()
+        self.lock = threading.RLock()
+
+    def song(self, song_id):
+        song = self.by_id.get(song_id)
+        if song is None:
+            return None
+        song = dict(song)
+        if song_id in self.starred:
+            song["starred"] = self.starred[song_id]
+        if self.ratings.get(song_id):
+            song["userRating"] = self.ratings[song_id]
+        return song
+
+    def item(self, item_id):
+        if item_id in self.albums:
+            return self.albums[item_id]
+        if item_id in self.artists:
+            return self.artists[item_id]
+        return self.by_id.get(item_id)
+
+    def artist_entry(self, artist):
+        entry = {"id": artist["id"], "name": artist["name"], "albumCount": len(artist["albums"])}
+        if artist["id"] in self.starred:
+            entry["starred"] = self.starred[artist["id"]]
+        return entry
+
+    def album_entry(self, album):
+        album = dict(album)
+        if album["id"] in self.starred:
+            album["starred"] = self.starred[album["id"]]
+        return album
+
+    def search(self, query):
+        words = _fold(query).split()
+        if not words:
+            return self.songs
+        return [song for song, song_words in zip(self.songs, self.words)
+                if all(any(word.startswith(term) for word in song_words) for term in words)]
+
+    def playlist_entry(self, playlist, with_songs=False):
+        entry = {key: value for key, value in playlist.items() if key != "songs"}
+        entry["songCount"] = len(playlist["songs"])
+        entry["duration"] = sum(self.by_id[song_id]["duration"] for song_id in playlist["songs"] if song_id in self.by_id)
+        if with_songs and playlist["songs"]:
+            entry["entry"] = [self.song(song_id) for song_id in playlist["songs"] if song_id in self.by_id]
+        return entry
+
+
+class SubsonicStandIn:
+    """
+    HTTP server answering the Subsonic calls used by this project (f=json), on a synthetic library.
+
+    Authentication parameters are accepted as they are. stats counts the requests per
+    endpoint and the injected errors.
+    """
+
+    def __init__(self, size=10000, seed=42, port=4533, host="127.0.0.1", faults=None):
+        self.library = Library(size, seed)
+        self.faults = faults or Faults(seed=seed)
+        self.host = host
+        self.port = port
+        self.stats = Counter()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._server.server_port if self._server else self.port}/rest"
+
+    def start(self):
+        """Serves in a background thread; returns the URL to use as NAVIDROME_URL."""
+        handler = type("Handler", (_Handler,), {"standin": self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="subsonic-standin", daemon=True)
+        self._thread.start()
+        logger.info(f"Subsonic stand-in with {len(self.library.songs)} songs on {self.url}")
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def log_stats(self):
+        endpoints = ", ".join(f"{name} {count}" for name, count in sorted(self.stats.items()) if not name.startswith("!"))
+        logger.info(f"Requests: {endpoints or '-'}")
+        logger.info(f"Injected: {self.stats['!rate_limited']} rate limited, {self.stats['!http_error']} HTTP errors, "
+                    f"{self.stats['!failed']} Subsonic failures")
+
+    # Endpoints: each takes the query parameters (lists) and returns the subsonic-response fields
+
+    def handle(self, endpoint, params):
+        method = getattr(self, f"_{endpoint}", None)
+        if method is None:
+            raise SubsonicError(0, f"Unknown API: {endpoint}")
+        with self.library.lock:
+            return method(params)
+
+    def _ping(self, params):
+        return {}
+
+    def _getScanStatus(self, params):
+        return {"scanStatus": {"scanning": False, "count": len(self.library.songs), "lastScan": self.library.last_scan}}
+
+    def _search2(self, params):
+        songs = self.library.search(_first(params, "query", ""))
+        offset = int(_first(params, "songOffset", 0))
+        count = int(_first(params, "songCount", 20))
+        result = {}
+        if count:
+            result["song"] = [self.library.song(song["id"]) for song in songs[offset:offset + count]]
+        return {"searchResult2": result}
+
+    def _getSong(self, params):
+        song = self.library.song(_first(params, "id"))
+        if song is None:
+            raise SubsonicError(70, "Song not found")
+        return {"song": song}
+
+    def _getAlbum(self, params):
+        album = self.library.albums.get(_first(params, "id"))
+        if album is None:
+            raise SubsonicError(70, "Album not found")
+        entry = self.library.album_entry(album)
+        entry["song"] = [self.library.song(song["id"]) for song in self.library.album_songs[album["id"]]]
+        return {"album": entry}
+
+    def _getAlbumList2(self, params):
+        albums = sorted(self.library.albums.values(), key=lambda album: album["created"], reverse=True)
+        offset = int(_first(params, "offset", 0))
+        size = int(_first(params, "size", 10))
+        return {"albumList2": {"album": [self.library.album_entry(album) for album in albums[offset:offset + size]]}}
+
+    def _getArtists(self, params):
+        indexes = {}
+        for artist in sorted(self.library.artists.values(), key=lambda artist: _fold(artist["name"])):
+            letter = _fold(artist["name"])[:1].upper() or "#"
+            indexes.setdefault(letter, []).append(self.library.artist_entry(artist))
+        return {"artists": {"ignoredArticles": "The", "index": [{"name": name, "artist": artists} for name, artists in indexes.items()]}}
+
+    def _getArtistInfo(self, params):
+        artist = self.library.artists.get(_first(params, "id"))
+        if artist is None:
+            raise SubsonicError(70, "Artist not found")
+        return {"artistInfo": {"biography": f"{artist['name']} is a synthetic artist.", "similarArtist": []}}
+
+    def _getStarred2(self, params):
+        starred = {"song": [], "album": [], "artist": []}
+        for item_id in self.library.starred:
+            if item_id in self.library.by_id:
+                starred["song"].append(self.library.song(item_id))
+            elif item_id in self.library.albums:
+                starred["album"].append(self.library.album_entry(self.library.albums[item_id]))
+            elif item_id in self.library.artists:
+                starred["artist"].append(self.library.artist_entry(self.library.artists[item_id]))
+        return {"starred2": {key: items for key, items in starred.items() if items}}
+
+    def _star_ids(self, params):
+        ids = params.get("id", []) + params.get("albumId", []) + params.get("artistId", [])
+        missing = [item_id for item_id in ids if self.library.item(item_id) is None]
+        if missing:
+            raise SubsonicError(70, f"Item not found: {missing[0]}")
+        return ids
+
+    def _star(self, params):
+        now = _timestamp()
+        for item_id in self._star_ids(params):
+            self.library.starred.setdefault(item_id, now)
+        return {}
+
+    def _unstar(self, params):
+        for item_id in self._star_ids(params):
+            self.library.starred.pop(item_id, None)
+        return {}
+
+    def _setRating(self, params):
+        song_id = _first(params, "id")
+        rating = int(_first(params, "rating", 0))
+        if self.library.item(song_id) is None:
+            raise SubsonicError(70, "Item not found")
+        if not 0 <= rating <= 5:
+            raise SubsonicError(10, "Rating must be between 0 and 5")
+        self.library.ratings[song_id] = rating
+        return {}
+
+    def _getPlaylists(self, params):
+        return {"playlists": {"playlist": [self.library.playlist_entry(playlist) for playlist in self.library.playlists.values()]}}
+
+    def _playlist(self, params, name="playlistId"):
+        playlist = self.library.playlists.get(_first(params, name))
+        if playlist is None:
+            raise SubsonicError(70, "Playlist not found")
+        return playlist
+
+    def _getPlaylist(self, params):
+        return {"playlist": self.library.playlist_entry(self._playlist(params, "id"), with_songs=True)}
+
+    def _createPlaylist(self, params):
+        now = _timestamp()
+        playlist_id = f"pl-{len(self.library.playlists) + 1}"
+        self.library.playlists[playlist_id] = {
+            "id": playlist_id, "name": _first(params, "name", "Playlist"), "owner": _first(params, "u", "admin"),
+            "public": False, "created": now, "changed": now, "songs": list(params.get("songId", [])),
+        }
+        return {"playlist": self.library.playlist_entry(self.library.playlists[playlist_id], with_songs=True)}
+
+    def _updatePlaylist(self, params):
+        playlist = self._playlist(params)
+        if "name" in params:
+            playlist["name"] = _first(params, "name")
+        remove = {int(index) for index in params.get("songIndexToRemove", [])}
+        playlist["songs"] = [song_id for index, song_id in enumerate(playlist["songs"]) if index not in remove]
+        playlist["songs"] += params.get("songIdToAdd", [])
+        playlist["changed"] = _timestamp()
+        return {}
+
+
+def _first(params, name, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    standin = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        endpoint = endpoint[:-5] if endpoint.endswith(".view") else endpoint
+        standin = self.standin
+        standin.stats[endpoint] += 1
+
+        delay = standin.faults.delay()
+        if delay:
+            time.sleep(delay)
+        if not standin.faults.allow():
+            standin.stats["!rate_limited"] += 1
+            return self._send(429, b"", {"Retry-After": "1"})
+        if standin.faults.http_error():
+            standin.stats["!http_error"] += 1
+            return self._send(503, b"")
+
+        response = {"status": "ok", "version": API_VERSION, "type": "navidrome-standin"}
+        try:
+            if standin.faults.subsonic_failure():
+                standin.stats["!failed"] += 1
+                raise SubsonicError(0, "Injected failure")
+            response.update(standin.handle(endpoint, params))
+        except SubsonicError as e:
+            response.update({"status": "failed", "error": {"code": e.code, "message": e.message}})
+        except (ValueError, KeyError) as e:
+            response.update({"status": "failed", "error": {"code": 10, "message": f"Invalid parameter: {e}"}})
+
+        body = json.dumps({"subsonic-response": response}, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        self._send(200, body, headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
@@ -0,0 +1,101 @@
+import logging
+
+try:
+    import ijson
+    STREAM_BACKEND = True
+except ImportError:
+    STREAM_BACKEND = False
+
+logger = logging.getLogger(__name__)
+
+# Records handed to the caller at a time
+BATCH_SIZE = 500
+
+# OpenSubsonic detail fields the matching never reads: nested lists that are often most of a song's payload.
+# Dropped only when asked (compact_items): exports and snapshots keep every field
+DROPPED_FIELDS = {"contributors", "participants", "replayGain", "moods", "genres", "albumArtists",
+                  "artists", "displayArtist", "displayAlbumArtist", "displayComposer", "explicitStatus"}
+
+
+def compact(item):
+    """A song/album/artist without the fields in DROPPED_FIELDS."""
+    return {key: value for key, value in item.items() if key not in DROPPED_FIELDS}
+
+
+class _CountingReader:
+    """File-like wrapper of the raw response that counts the decoded bytes read."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes += len(data)
+        return data
+
+
+def iter_items(response, paths, stats=None, compact_items=False):
+    """
+    Yields (path, item) for each element of the arrays at paths, e.g.
+    "subsonic-response.starred2.song", as the response body arrives.
+
+    The response must be requested with stream=True. Only the current item is held in
+    memory (with ijson); without ijson the whole body is decoded first. A Subsonic error
+    raises RuntimeError. stats, if given, gets the decoded payload size in "bytes".
+    With compact_items the fields in DROPPED_FIELDS are left out.
+    """
+    finish = compact if compact_items else (lambda item: item)
+    if not STREAM_BACKEND:
+        data = response.json()
+        if stats is not None:
+            stats["bytes"] = len(response.content)
+        _check_status(data.get("subsonic-response", {}))
+        for path in paths:
+            node = data
+            for key in path.split("."):
+                node = node.get(key, {}) if isinstance(node, dict) else {}
+            for item in node if isinstance(node, list) else []:
+                yield path, finish(item)
+        return
+
+    response.raw.decode_content = True
+    reader = _CountingReader(response.raw)
+    item_paths = {f"{path}.item": path for path in paths}
+    status = {}
+    builder = None
+    # use_float: numbers as float, as response.json() does (Decimal is not JSON serializable)
+    for prefix, event, value in ijson.parse(reader, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == current and event == "end_map":
+                yield item_paths[current], finish(builder.value)
+                builder = None
+        elif prefix in item_paths and event == "start_map":
+            current = prefix
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix in ("subsonic-response.status", "subsonic-response.error.message"):
+            status[prefix.rsplit(".", 1)[-1]] = value
+            if "status" in status and "message" in status:
+                _check_status({"status": status["status"], "error": {"message": status["message"]}})
+    _check_status({"status": status.get("status"), "error": {"message": status.get("message")}})
+    if stats is not None:
+        stats["bytes"] = reader.bytes
+
+
+def _check_status(data):
+    if data.get("status") == "failed":
+        raise RuntimeError((data.get("error") or {}).get("message") or "Subsonic call failed")
+
+
+def iter_batches(response, path, batch_size=BATCH_SIZE, compact_items=False):
+    """Lists of up to batch_size items of the array at path (see iter_items)."""
+    batch = []
+    for _, item in iter_items(response, [path], compact_items=compact_items):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
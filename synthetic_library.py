@@ -0,0 +1,124 @@
+import random
+import unicodedata
+
+# Deterministic generator of Navidrome-shaped and Spotify-shaped song lists for the benchmarks.
+
+WORDS = ["love", "night", "heart", "città", "perché", "dream", "fire", "rain", "sole", "luna",
+         "road", "home", "time", "light", "notte", "blue", "girl", "world", "life", "star",
+         "deep", "sleep", "step", "amore", "mare", "vita", "sempre", "ancora", "domani", "cuore",
+         "café", "señor", "über", "noël", "déjà", "vu", "wild", "gold", "river", "sky"]
+FIRST_NAMES = ["Lucio", "Vasco", "Mina", "Franco", "Björk", "Zoë", "Renée", "Andrés", "Chloé", "José",
+               "Fabrizio", "Giorgia", "Måns", "Jürgen", "Noémie", "Elisa", "Marco", "Laura", "Ana", "Tom"]
+LAST_NAMES = ["Dalla", "Rossi", "Battiato", "Guðmundsdóttir", "Lefèvre", "García", "De André", "Müller",
+              "Pausini", "Mengoni", "Nuñez", "Brontë", "Smith", "Ferro", "Ramazzotti", "Øster"]
+BAND_WORDS = ["The", "Blue", "Night", "Sound", "Machine", "Kings", "Daft", "Arctic", "Rolling", "Måneskin"]
+REMASTER_SUFFIXES = [" (Remastered)", " - Remastered 2019", " - Live", " [Remastered Version]",
+                     " (2009 Remaster)", " - Mono / Remastered", " (Live)", " - Radio Edit", " (Deluxe Edition)"]
+CREDIT_SEPARATORS = [" feat. ", " & ", ", ", " ft. ", " x ", " / "]
+GENRES = ["Pop", "Rock", "Cantautori", "Electronic", "Jazz", "Hip-Hop"]
+
+
+def strip_accents(text):
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _words(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).title()
+
+
+def _artists(rng, count):
+    artists = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            artists.append(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+        else:
+            artists.append(" ".join(rng.choice(BAND_WORDS) for _ in range(rng.randint(1, 3))))
+    return artists
+
+
+def generate_library(size, seed=42):
+    """
+    Navidrome-shaped songs (as returned by navidrome.get_all_songs).
+
+    Includes remaster/live suffixes, multi-artist credits, accented names and near-duplicates
+    (the same song on several albums or in a remastered edition).
+    """
+    rng = random.Random(seed)
+    artists = _artists(rng, max(10, size // 40))
+    songs = []
+    while len(songs) < size:
+        artist = rng.choice(artists)
+        album = _words(rng, 1, 4)
+        album_id = f"al-{len(songs)}"
+        for track in range(1, rng.randint(6, 14) + 1):
+            if len(songs) >= size:
+                break
+            title = _words(rng, 1, 5)
+            credit = artist
+            if rng.random() < 0.15:
+                credit += rng.choice(CREDIT_SEPARATORS) + rng.choice(artists)
+            if rng.random() < 0.1:
+                title += rng.choice(REMASTER_SUFFIXES)
+            songs.append(_navidrome_song(len(songs), title, credit, album, album_id, track, rng))
+
+            # Near-duplicate: same song in a compilation, a remastered edition or with a typo
+            if rng.random() < 0.05 and len(songs) < size:
+                variant = rng.choice([title + rng.choice(REMASTER_SUFFIXES), strip_accents(title), title.upper()])
+                songs.append(_navidrome_song(len(songs), variant, credit, rng.choice([album, album + " (Deluxe Edition)", "Greatest Hits"]),
+                                             f"al-{len(songs)}", track, rng))
+    return songs
+
+
+def _navidrome_song(position, title, artist, album, album_id, track, rng):
+    return {
+        "id": f"nd-{position:07d}",
+        "parent": album_id,
+        "isDir": False,
+        "title": title,
+        "album": album,
+        "artist": artist,
+        "track": track,
+        "year": rng.randint(1960, 2024),
+        "genre": rng.choice(GENRES),
+        "duration": rng.randint(120, 420),
+        "albumId": album_id,
+        "type": "music",
+    }
+
+
+def generate_spotify_songs(library, size, missing_ratio=0.2, seed=42):
+    """
+    Spotify-shaped songs (as in spotify-playlists/*.json) derived from a library.
+
+    Most songs exist in the library with Spotify-style differences (remaster suffixes,
+    accents, credit order, album editions); missing_ratio of them are not in the library.
+    """
+    rng = random.Random(seed)
+    songs = []
+    for position in range(size):
+        if rng.random() < missing_ratio or not library:
+            title = _words(rng, 2, 5)
+            artists = _artists(rng, rng.randint(1, 2))
+            album = _words(rng, 1, 3)
+        else:
+            song = rng.choice(library)
+            title = song["title"]
+            artists = [part for part in song["artist"].replace(" feat. ", ", ").replace(" & ", ", ").split(", ") if part]
+            album = song["album"]
+            change = rng.random()
+            if change < 0.15:
+                title += rng.choice(REMASTER_SUFFIXES)
+            elif change < 0.25:
+                title = strip_accents(title)
+            elif change < 0.3:
+                artists = list(reversed(artists))
+            if rng.random() < 0.2:
+                album = album + rng.choice([" (Deluxe Edition)", " (Remastered)", " [Expanded]"])
+        songs.append({
+            "id": f"sp-{position:07d}",
+            "name": title,
+            "artists": [{"name": artist} for artist in artists],
+            "album": album,
+        })
+    return songs
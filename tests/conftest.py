@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live in the repository root, common_py_utils next to it (as for the scripts)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.dirname(ROOT))
@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("rapidfuzz")
+
+from common_py_utils import string_utils
+
+import batch_scoring
+import synthetic_library
+import utility
+
+# Title and artist pairs as they differ between Spotify and a local library
+PAIRS = [
+    ("Hey Jude", "Hey Jude - Remastered 2015"),
+    ("Bohemian Rhapsody", "Bohemian Rhapsody - Remastered 2011"),
+    ("Albachiara", "Albachiara (Live)"),
+    ("La cura", "La Cura (Remastered)"),
+    ("Don't Stop Me Now", "Dont Stop Me Now"),
+    ("Don’t Look Back in Anger", "Don't Look Back In Anger"),
+    ("Sympathy for the Devil", "Sympathy For The Devil - 50th Anniversary Edition"),
+    ("Smells Like Teen Spirit", "Smells Like Teen Spirit"),
+    ("Paranoid Android", "Paranoid Android (Remastered)"),
+    ("Wish You Were Here", "Wish You Were Here - 2011 Remastered Version"),
+    ("Vita spericolata", "Vita Spericolata - Live @ San Siro 2015"),
+    ("L'anno che verrà", "L'anno che verra"),
+    ("Caruso", "Caruso (Remastered 1996)"),
+    ("Yellow", "Yellow Submarine"),
+    ("Imagine", "Imagination"),
+    ("The Beatles", "Beatles"),
+    ("Björk", "Bjork"),
+    ("Lucio Dalla", "Dalla Lucio"),
+    ("Vasco Rossi", "Vasco"),
+    ("Måneskin", "Maneskin"),
+    ("Fabrizio De André", "Fabrizio De Andre"),
+    ("Simon & Garfunkel", "Simon and Garfunkel"),
+    ("AC/DC", "ACDC"),
+    ("Guns N' Roses", "Guns N Roses"),
+]
+
+
+@pytest.mark.parametrize("first, second", PAIRS)
+def test_similarity_equals_string_utils(first, second):
+    _, expected = string_utils.are_strings_similar(first, second)
+    assert batch_scoring.similarity_matrix([first], [second])[0][0] == pytest.approx(expected)
+
+
+def test_match_decisions_equal_pairwise_scoring(monkeypatch):
+    library = synthetic_library.generate_library(400, seed=5)
+    fields = [utility.get_song_fields(song, "navidrome") for song in library]
+    for song in synthetic_library.generate_spotify_songs(library, 60, seed=11):
+        query = (song["name"], [artist["name"] for artist in song["artists"]], song["album"])
+        for consider_album in (True, False):
+            monkeypatch.setattr(utility, "USE_BATCH_SCORING", False)
+            pairwise = utility.score_songs(*query, fields, consider_album=consider_album)
+            monkeypatch.setattr(utility, "USE_BATCH_SCORING", True)
+            batch = utility.score_songs(*query, fields, consider_album=consider_album)
+            assert [matched for matched, _ in batch] == [matched for matched, _ in pairwise], query
+            # Pruned candidates only report the components scored so far
+            for (matched, batch_score), (_, pairwise_score) in zip(batch, pairwise):
+                if matched:
+                    assert batch_score == pytest.approx(pairwise_score), query
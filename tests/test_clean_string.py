@@ -0,0 +1,44 @@
+import re
+
+import pytest
+
+import utility
+from common_py_utils import string_utils
+
+
+def reference_clean_string(input_string):
+    """utility.clean_string before precompilation."""
+    for old, new in [("’", "'"), ("×", "x"), ("·", ""), ("‐", "-"), ("…", "..."), (" / ", "/"), ("A'", "à"),
+                     ("E'", "è"), ("I'", "ì"), ("O'", "ò"), ("U'", "ù"), ("Sansiro", "San siro"), (" - ", "-"),
+                     ("I RIO", "Rio")]:
+        input_string = input_string.replace(old, new)
+    input_string = input_string.strip().lower()
+    for term in utility.IGNORE_TERMS:
+        input_string = re.sub(term, "", input_string, flags=re.IGNORECASE)
+    return input_string.strip()
+
+
+@pytest.mark.parametrize("text", [
+    "Hey Jude - Remastered 2015",
+    "Yellow - Remastered",
+    "Live Forever (Remastered)",
+    "PERCHE' NO [Remastered Version]",
+    "Città · Notte × Sole…",
+    "Love / Hate - Live",
+    "Viva La Vida or Death and All His Friends",
+    "I RIO - Sansiro",
+    "  spaces  ",
+    "",
+])
+def test_clean_string_equals_reference(text):
+    utility.clear_caches()
+    assert utility.clean_string(text) == reference_clean_string(text)
+    assert utility.clean_string(text) == reference_clean_string(text)  # Memoized
+
+
+def test_memoized_similarity_equals_string_utils():
+    pairs = [("Hey Jude", "Hey Jude - Remastered 2015"), ("The Beatles", "Beatles"), ("Help!", "")]
+    for first, second in pairs:
+        assert utility.similarity(first, second) == string_utils.are_strings_similar(first, second)[1]
+    assert utility.normalize("Hey Jude") == string_utils.clean_string("Hey Jude")
+    assert utility.normalize(None) == ""
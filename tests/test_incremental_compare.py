@@ -0,0 +1,67 @@
+import importlib.util
+import os
+
+import pytest
+
+import compare_utils
+import song_index
+from conftest import ROOT
+
+
+@pytest.fixture(scope="module")
+def compare_script():
+    """compare-spotify-navidrome.py is a script, not a module: loaded by path."""
+    spec = importlib.util.spec_from_file_location("compare_spotify_navidrome", os.path.join(ROOT, "compare-spotify-navidrome.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def spotify_song(song_id, name, artist, album):
+    return {"id": song_id, "name": name, "artists": [{"name": artist}], "album": album}
+
+
+def navidrome_song(song_id, title, artist, album):
+    return {"id": song_id, "title": title, "artist": artist, "album": album}
+
+
+def test_strict_candidates_have_no_full_scan_fallback():
+    index = song_index.SongIndex([navidrome_song("n1", "Yesterday", "The Beatles", "Help!")], "navidrome")
+    assert index.candidate_positions("Bohemian Rhapsody", ["Queen"]) == [0]
+    assert index.candidate_positions("Bohemian Rhapsody", ["Queen"], fallback=False) == []
+    assert index.candidate_positions("Yesterday", ["Beatles"], fallback=False) == [0]
+
+
+def test_unrelated_new_song_keeps_previous_results(compare_script, monkeypatch):
+    not_found = spotify_song("sp1", "Bohemian Rhapsody", "Queen", "A Night at the Opera")
+    partial = spotify_song("sp2", "Imagine", "John Lennon", "Imagine")
+    partial_match = navidrome_song("n1", "Imagine (Live)", "John Lennon", "Live in New York City")
+    spotify_songs = [not_found, partial]
+    old_library = [partial_match]
+    new_library = old_library + [navidrome_song("n2", "Smells Like Teen Spirit", "Nirvana", "Nevermind")]
+
+    reports = {compare_script.NOT_FOUND_FILE: [not_found],
+               compare_script.PART_MATCH_FILE: [{"spotify": partial, "navidrome": partial_match}]}
+    monkeypatch.setattr(compare_script, "load_report", lambda file_name: reports[file_name])
+
+    def hashes(library):
+        return (compare_utils.snapshot_hashes(spotify_songs, compare_script.spotify_key, compare_script.spotify_fields),
+                compare_utils.snapshot_hashes(library, lambda song: song["id"], compare_script.navidrome_fields))
+
+    spotify_hashes, old_hashes = hashes(old_library)
+    _, new_hashes = hashes(new_library)
+    state = {"spotify": spotify_hashes, "navidrome": old_hashes}
+
+    to_compare, kept_partial, kept_not_found = compare_script.select_incremental(
+        spotify_songs, new_library, [], state, spotify_hashes, new_hashes)
+    assert to_compare == []
+    assert kept_not_found == [not_found]
+    assert [entry["spotify"] for entry in kept_partial] == [partial]
+
+    # A new song that can match the not-found one sends it back to the comparison
+    new_library.append(navidrome_song("n3", "Bohemian Rhapsody", "Queen", "Greatest Hits"))
+    _, new_hashes = hashes(new_library)
+    to_compare, _, kept_not_found = compare_script.select_incremental(
+        spotify_songs, new_library, [], state, spotify_hashes, new_hashes)
+    assert to_compare == [not_found]
+    assert kept_not_found == []
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import navidrome
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+
+    def call_in_chunks(session, endpoint, ids, chunk_size, id_param="id", **params):
+        calls.append((endpoint, list(ids)))
+        return [{"ids": list(ids), "bulk": True, "failed": []}]
+
+    monkeypatch.setattr(navidrome, "_call_in_chunks", call_in_chunks)
+    return calls
+
+
+def write_journal(path, *entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def test_replay_of_completed_write_is_skipped(tmp_path, sent):
+    journal = tmp_path / "writes.jsonl"
+    write_journal(journal, {"op": ["star", "a"]}, {"op": ["star", "b"]}, {"done": [["star", "a", None]]})
+    queue = navidrome.MutationQueue(None, journal=str(journal))
+    queue.star("a")
+    queue.star("b")
+    queue.flush()
+    assert sent == [("star.view", ["b"])]
+
+
+def test_deliberate_write_after_a_different_one_is_sent(tmp_path, sent):
+    journal = tmp_path / "writes.jsonl"
+    write_journal(journal, {"op": ["star", "a"]}, {"done": [["star", "a", None]]})
+    queue = navidrome.MutationQueue(None, journal=str(journal))
+    queue.unstar("a")
+    queue.star("a")
+    queue.flush()
+    assert sent == [("star.view", ["a"])]
+
+
+def test_writes_after_flush_are_always_sent(tmp_path, sent):
+    journal = tmp_path / "writes.jsonl"
+    write_journal(journal, {"done": [["star", "a", None]]})
+    queue = navidrome.MutationQueue(None, journal=str(journal))
+    queue.flush()
+    queue.star("a")
+    queue.flush()
+    assert sent == [("star.view", ["a"])]
+
+
+def test_playlist_chunk_without_answer_is_not_replayed(tmp_path, monkeypatch):
+    calls = []
+
+    def call_with_ids(session, endpoint, ids, id_param="id", **params):
+        calls.append(list(ids))
+        return navidrome.CALL_ERROR if "b" in ids else navidrome.CALL_OK
+
+    monkeypatch.setattr(navidrome, "_call_with_ids", call_with_ids)
+    journal = tmp_path / "writes.jsonl"
+    queue = navidrome.MutationQueue(None, journal=str(journal), chunk_size=2)
+    for song_id in ("a", "b", "c"):
+        queue.add_to_playlist("p1", song_id)
+    assert queue.flush() == []
+    assert [mutation.song_id for mutation in queue.unknown] == ["a", "b"]
+    assert calls == [["a", "b"], ["c"]]
+    assert len(queue) == 0
+
+    # A rerun queuing the same additions sends only those never tried
+    write_journal(journal, {"op": ["addToPlaylist", "a", "p1"]}, {"op": ["addToPlaylist", "d", "p1"]},
+                  {"done": [["addToPlaylist", "a", "p1"]], "unknown": True})
+    calls.clear()
+    queue = navidrome.MutationQueue(None, journal=str(journal), chunk_size=2)
+    queue.add_to_playlist("p1", "a")
+    queue.flush()
+    assert calls == [["d"]]
@@ -0,0 +1,64 @@
+import pickle
+import threading
+
+import pytest
+
+import navidrome_cache
+import subsonic_standin
+
+
+@pytest.fixture(scope="module")
+def standin():
+    server = subsonic_standin.SubsonicStandIn(size=50, port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def new_session(path=None):
+    session = navidrome_cache.CachedSession(path=path)
+    session.params = {"u": "me", "t": "token", "s": "salt", "v": "1.16.1", "c": "tests"}
+    return session
+
+
+def get_song(session, standin, song_id):
+    response = session.get(f"{standin.url}/getSong.view", params={"id": song_id, "f": "json"})
+    return response.json()["subsonic-response"]["song"]["id"]
+
+
+def test_cache_file_round_trip(standin, tmp_path):
+    path = str(tmp_path / "cache.json")
+    session = new_session(path)
+    song_ids = [song["id"] for song in standin.library.songs[:3]]
+    for song_id in song_ids:
+        get_song(session, standin, song_id)
+    session.save()
+
+    reloaded = new_session(path)
+    assert [get_song(reloaded, standin, song_id) for song_id in song_ids] == song_ids
+    assert reloaded.stats["hits"] == 3 and reloaded.stats["misses"] == 0
+
+
+def test_foreign_cache_file_is_not_loaded(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_bytes(pickle.dumps({"not": "a cache"}))
+    assert len(new_session(str(path))._entries) == 0
+    path.write_text('{"format": "something else", "entries": []}', encoding="utf-8")
+    assert len(new_session(str(path))._entries) == 0
+
+
+def test_stats_are_counted_by_every_thread(standin):
+    session = new_session()
+    song_id = standin.library.songs[0]["id"]
+    get_song(session, standin, song_id)
+
+    def read():
+        for _ in range(200):
+            get_song(session, standin, song_id)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert session.stats["hits"] == 800 and session.stats["misses"] == 1
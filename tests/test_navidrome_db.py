@@ -0,0 +1,111 @@
+import ntpath
+import sqlite3
+
+import pytest
+
+import navidrome_db
+
+# A song of search2.view / getSong.view as Navidrome returns it (the shape the scripts read)
+API_SONG = {
+    "id": "s1", "parent": "al1", "isDir": False, "title": "Title 1", "album": "Album", "artist": "Artist",
+    "track": 1, "year": 2020, "genre": "Rock", "size": 1000, "contentType": "audio/flac", "suffix": "flac",
+    "duration": 200, "bitRate": 900, "path": "/music/Artist/Album/01.flac", "playCount": 3,
+    "played": "2024-06-01T00:00:00Z", "discNumber": 1, "created": "2024-05-01T10:20:30Z", "albumId": "al1",
+    "artistId": "ar1", "type": "music", "isVideo": False, "starred": "2024-06-02T00:00:00Z", "userRating": 4,
+}
+
+
+def build_database(path, layout):
+    """Minimal navidrome.db: absolute paths before 0.55, library-relative paths and `missing` from 0.55."""
+    connection = sqlite3.connect(path)
+    new = layout == "0.55"
+    user_column = "user_name" if new else "username"
+    connection.execute(f"CREATE TABLE user (id TEXT, {user_column} TEXT)")
+    connection.execute("INSERT INTO user VALUES ('u1', 'me'), ('u2', 'other')")
+    extra = ", library_id INTEGER, missing BOOL DEFAULT 0" if new else ""
+    connection.execute(
+        "CREATE TABLE media_file (id TEXT, path TEXT, title TEXT, album TEXT, artist TEXT, artist_id TEXT, album_id TEXT, "
+        "track_number INT, disc_number INT, year INT, genre TEXT, size INT, suffix TEXT, duration REAL, bit_rate INT, "
+        f"created_at DATETIME{extra})")
+    connection.execute("CREATE TABLE album (id TEXT, name TEXT, album_artist TEXT, album_artist_id TEXT, song_count INT, "
+                       "duration REAL, created_at DATETIME, max_year INT, genre TEXT)")
+    connection.execute("CREATE TABLE artist (id TEXT, name TEXT, album_count INT)")
+    connection.execute("CREATE TABLE annotation (ann_id TEXT, user_id TEXT, item_id TEXT, item_type TEXT, play_count INT, "
+                       "play_date DATETIME, rating INT, starred BOOL, starred_at DATETIME)")
+    songs = []
+    for number in range(4):
+        path = f"Artist/Album/{number:02d}.flac"
+        row = [f"s{number}", path if new else f"/music/{path}", f"Title {number}", "Album", "Artist", "ar1", "al1",
+               number, 1, 2020, "Rock", 1000, "flac", 200.5, 900, "2024-05-01 10:20:30.123456789+00:00"]
+        if new:
+            row += [1, int(number == 3)]
+        songs.append(row)
+    connection.executemany(f"INSERT INTO media_file VALUES ({', '.join('?' * len(songs[0]))})", songs)
+    if new:
+        connection.execute("CREATE TABLE library (id INTEGER, path TEXT)")
+        connection.execute("INSERT INTO library VALUES (1, '/music')")
+    connection.execute("INSERT INTO album VALUES ('al1', 'Album', 'Artist', 'ar1', 4, 802, '2024-05-01 10:20:30+00:00', 2020, 'Rock')")
+    connection.execute("INSERT INTO artist VALUES ('ar1', 'Artist', 1)")
+    connection.executemany("INSERT INTO annotation VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        ("a1", "u1", "s1", "media_file", 3, "2024-06-01 00:00:00+00:00", 4, 1, "2024-06-02 00:00:00+00:00"),
+        ("a2", "u2", "s2", "media_file", 7, "2024-06-01 00:00:00+00:00", 5, 1, "2024-06-02 00:00:00+00:00"),
+        ("a3", "u2", "s1", "media_file", 9, "2024-06-01 00:00:00+00:00", 1, 0, None),
+        ("a4", "u1", "al1", "album", 0, None, 0, 1, "2024-06-03 00:00:00+00:00"),
+    ])
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture(params=["0.54", "0.55"])
+def database(request, tmp_path):
+    path = tmp_path / "navidrome.db"
+    build_database(str(path), request.param)
+    with navidrome_db.NavidromeDatabase(str(path), "me") as database:
+        yield database
+
+
+def test_song_has_the_api_shape(database):
+    song = database.get_song_by_id("s1")
+    assert song == API_SONG
+    for record in database.get_all_songs():
+        assert set(record) <= set(API_SONG)
+        assert all(type(record[field]) is type(API_SONG[field]) for field in record)
+
+
+def test_annotations_are_those_of_the_user(database):
+    songs = {song["id"]: song for song in database.get_all_songs()}
+    assert songs["s1"]["userRating"] == 4 and songs["s1"]["playCount"] == 3
+    assert "starred" not in songs["s2"] and "userRating" not in songs["s2"] and "playCount" not in songs["s2"]
+    assert [song["id"] for song in database.get_starred()] == ["s1"]
+    starred = database.get_starred_items()
+    assert [album["id"] for album in starred["album"]] == ["al1"]
+    assert starred["artist"] == []
+
+
+def test_paths_are_absolute(database):
+    songs = database.get_all_songs()
+    assert songs and all(song["path"] == f"/music/Artist/Album/{song['id'][1:].zfill(2)}.flac" for song in songs)
+
+
+def test_missing_files_are_skipped(database):
+    ids = [song["id"] for song in database.get_all_songs()]
+    expected = ["s0", "s1", "s2"] if "missing" in database.columns("media_file") else ["s0", "s1", "s2", "s3"]
+    assert ids == expected
+
+
+def test_database_is_read_only(database):
+    with pytest.raises(sqlite3.OperationalError):
+        database.connection.execute("DELETE FROM media_file")
+
+
+def test_unknown_user(tmp_path):
+    path = tmp_path / "navidrome.db"
+    build_database(str(path), "0.55")
+    with pytest.raises(ValueError):
+        navidrome_db.NavidromeDatabase(str(path), "nobody")
+
+
+def test_library_paths_are_joined_as_posix(database, monkeypatch):
+    # os.path is ntpath when the tools run on Windows: the server path must not change
+    monkeypatch.setattr(navidrome_db.os, "path", ntpath)
+    assert database.get_song_by_id("s1")["path"] == "/music/Artist/Album/01.flac"
@@ -0,0 +1,34 @@
+import synthetic_library
+import song_index
+import utility
+
+
+def spotify_queries(library, size, seed=7):
+    songs = synthetic_library.generate_spotify_songs(library, size, seed=seed)
+    return [(song["name"], [artist["name"] for artist in song["artists"]], song["album"]) for song in songs]
+
+
+def test_long_suffix_and_article_still_candidates():
+    library = [
+        {"title": "Hey Jude", "artist": "Beatles", "album": "1"},
+        {"title": "Something Else", "artist": "Someone", "album": "Other"},
+    ]
+    index = song_index.SongIndex(library, "navidrome")
+    positions = index.candidate_positions("Hey Jude - Remastered 2015 / Live at the BBC Session Version", ["The Beatles"])
+    assert 0 in positions
+
+
+def test_no_candidates_falls_back_to_full_scan():
+    library = [{"title": "Hey Jude", "artist": "Beatles", "album": "1"}]
+    index = song_index.SongIndex(library, "navidrome")
+    assert index.candidate_positions("Zzz", ["Nobody"]) == [0]
+
+
+def test_indexed_best_matches_equal_full_scan():
+    library = synthetic_library.generate_library(2000, seed=3)
+    index = song_index.SongIndex(library, "navidrome")
+    for title, artists, album in spotify_queries(library, 300):
+        for consider_album in (True, False):
+            full = utility.find_best_matches(title, artists, album, library, "navidrome", consider_album=consider_album)
+            indexed = utility.find_best_matches(title, artists, album, library, "navidrome", consider_album=consider_album, index=index)
+            assert [song["id"] for song in indexed] == [song["id"] for song in full], (title, artists, album)
@@ -0,0 +1,49 @@
+import io
+import json
+
+import pytest
+
+import subsonic_stream
+
+BODY = {"subsonic-response": {"status": "ok", "starred2": {"song": [
+    {"id": "s1", "title": "One", "duration": 200, "averageRating": 4.5,
+     "replayGain": {"trackGain": -6.2, "albumPeak": 0.98}},
+    {"id": "s2", "title": "Two", "duration": 180},
+]}}}
+
+
+class Response:
+    """The parts of a streamed requests.Response read by subsonic_stream."""
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode("utf-8")
+        self.raw = io.BytesIO(self.content)
+
+    def json(self):
+        return json.loads(self.content)
+
+
+@pytest.fixture(params=[True, False], ids=["ijson", "json"])
+def backend(request, monkeypatch):
+    if request.param and not subsonic_stream.STREAM_BACKEND:
+        pytest.skip("ijson not installed")
+    monkeypatch.setattr(subsonic_stream, "STREAM_BACKEND", request.param)
+
+
+def test_float_fields_are_json_serializable(backend):
+    songs = [item for _, item in subsonic_stream.iter_items(Response(BODY), ["subsonic-response.starred2.song"])]
+    assert songs == BODY["subsonic-response"]["starred2"]["song"]
+    assert type(songs[0]["averageRating"]) is float
+    json.dumps(songs)
+
+
+def test_compact_items_drops_detail_fields(backend):
+    batches = list(subsonic_stream.iter_batches(Response(BODY), "subsonic-response.starred2.song", compact_items=True))
+    assert [song["id"] for song in batches[0]] == ["s1", "s2"]
+    assert "replayGain" not in batches[0][0] and batches[0][0]["averageRating"] == 4.5
+
+
+def test_failed_response_raises(backend):
+    body = {"subsonic-response": {"status": "failed", "error": {"code": 40, "message": "Wrong username or password"}}}
+    with pytest.raises(RuntimeError, match="Wrong username"):
+        list(subsonic_stream.iter_items(Response(body), ["subsonic-response.starred2.song"]))
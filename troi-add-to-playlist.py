@@ -14,6 +14,7 @@ from pathlib import Path
 
 import utility
 import navidrome
+import navidrome_mirror
 import troi_utils
 
 sys.path.append('../')
@@ -26,14 +27,18 @@ logger = log_utils.setup_logging(os.path.basename(__file__), logging.DEBUG)
 # Default playlist name
 DEFAULT_PLAYLIST_NAME = "Discover New"
 
+# Playlist additions not sent yet (see navidrome.MutationQueue)
+WRITES_JOURNAL = "navidrome-playlists/pending_troi_writes.jsonl"
 
-def main(input_file, playlist_name=None):
+
+def main(input_file, playlist_name=None, offline=False):
     """
     Process unresolved file and add tracks to Navidrome playlist.
     
     Args:
         input_file (str): Path to unresolved input file
         playlist_name (str): Name of playlist to create/update
+        offline (bool): Search the tracks in the local library mirror instead of Navidrome
     """
     if playlist_name is None:
         playlist_name = DEFAULT_PLAYLIST_NAME
@@ -51,6 +56,13 @@ def main(input_file, playlist_name=None):
 
     # Authenticate to Navidrome
     session = navidrome.authenticate()
+
+    # Searches: one search2 request per track, or none with the local mirror
+    if offline:
+        mirror = navidrome_mirror.open_mirror(session)
+        search_song = lambda artists, album, title: navidrome_mirror.search_song(mirror, artists, album, title)
+    else:
+        search_song = lambda artists, album, title: navidrome.search_song(session, artists, album, title)
     
     # Find or create the playlist
     playlist_id = navidrome.find_or_create_playlist(session, playlist_name)
@@ -61,6 +73,7 @@ def main(input_file, playlist_name=None):
     # Counters for the summary
     found_count = 0
     added_count = 0
+    unknown_count = 0
     not_found_count = 0
     songs_to_add = []
 
@@ -80,19 +93,12 @@ def main(input_file, playlist_name=None):
             else:
                 artists = artist
                 
-            match = navidrome.search_song(session, artists, album, title)
+            match = search_song(artists, album, title)
             
             if match:
                 logger.info(f"✅ Found: {title} - {artist} ({album})")
                 found_count += 1
                 songs_to_add.append(match["id"])
-                
-                # Add songs in batches to avoid too many API calls
-                if len(songs_to_add) >= 10:
-                    success = navidrome.add_songs_to_playlist(session, playlist_id, songs_to_add)
-                    if success:
-                        added_count += len(songs_to_add)
-                    songs_to_add = []
             else:
                 logger.info(f"❌ Not found: {title} - {artist} ({album})")
                 not_found_count += 1
@@ -101,11 +107,14 @@ def main(input_file, playlist_name=None):
             logger.error(f"Error searching for {title} - {artist}: {e}")
             not_found_count += 1
     
-    # Add remaining songs
+    # Add the songs found, many per request; an interrupted run resumes from the journal without adding them twice
     if songs_to_add:
-        success = navidrome.add_songs_to_playlist(session, playlist_id, songs_to_add)
-        if success:
-            added_count += len(songs_to_add)
+        writes = navidrome.MutationQueue(session, journal=WRITES_JOURNAL)
+        for song_id in songs_to_add:
+            writes.add_to_playlist(playlist_id, song_id)
+        queued = len(writes)
+        added_count = queued - len(writes.flush()) - len(writes.unknown)
+        unknown_count = len(writes.unknown)
 
     # Summary
     logger.info("\n" + "="*50)
@@ -115,6 +124,8 @@ def main(input_file, playlist_name=None):
     logger.info(f"Found in Navidrome: {found_count}")
     logger.info(f"Not found: {not_found_count}")
     logger.info(f"Added to playlist '{playlist_name}': {added_count}")
+    if unknown_count:
+        logger.info(f"No answer from Navidrome (check the playlist): {unknown_count}")
     logger.info(f"Success rate: {(found_count/len(tracks)*100):.1f}%")
     
     return True
@@ -134,6 +145,12 @@ if __name__ == "__main__":
         help=f"Name of playlist to create/update (default: {DEFAULT_PLAYLIST_NAME})"
     )
     
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Search tracks in the local library mirror (navidrome_mirror.py) instead of one request per track"
+    )
+    
     args = parser.parse_args()
     
     # Validate input file
@@ -146,7 +163,7 @@ if __name__ == "__main__":
     
     logger.info(f"🚀 Start time: {start_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    success = main(args.input_file, args.playlist)
+    success = main(args.input_file, args.playlist, args.offline)
 
     end_time = time.time()
     end_datetime = datetime.now()
@@ -3,6 +3,7 @@ import json
 import os
 import logging
 import winsound
+from contextlib import contextmanager
 
 sys.path.append('../')
 sys.path.append('../common_py_utils')
@@ -95,6 +96,126 @@ def _persist_choice(key: str, info: list, chosen_song) -> None:
     _save_album_cache()
 
 
+def set_album_cache_file(path: str) -> None:
+    """Usa un file di cache diverso da quello dello script chiamante (es. in fase di resolve)."""
+    global _album_cache, _album_cache_file
+    _album_cache_file = path
+    _album_cache = None
+
+
+# ---------------------------------------------------------------------------
+# Deferred choices
+# In modalità differita le scelte ambigue non bloccano l'esecuzione: ogni caso
+# (query + candidati + contesto del chiamante) viene accodato in un file JSONL
+# e choose_song restituisce None come per "Skip". Le scelte vengono poi fatte
+# tutte insieme con resolve-deferred-choices.py.
+# ---------------------------------------------------------------------------
+
+_deferred_queue_file = None   # None = modalità interattiva
+_deferred_keys = None         # chiavi dei casi già in coda, lazy loaded
+_deferred_context = {}
+_deferred_count = 0
+
+
+def set_deferred_mode(queue_file: str | None) -> None:
+    """Attiva (queue_file) o disattiva (None) la modalità differita."""
+    global _deferred_queue_file, _deferred_keys
+    _deferred_queue_file = queue_file
+    _deferred_keys = None
+    if queue_file:
+        logger.info(f"Scelte differite in: {queue_file}")
+
+
+def is_deferred_mode() -> bool:
+    return _deferred_queue_file is not None
+
+
+def deferred_count() -> int:
+    """Numero di casi accodati in questa esecuzione."""
+    return _deferred_count
+
+
+def reset_state() -> None:
+    """Torna allo stato iniziale: per ogni comando eseguito dal servizio residente (music_service.py)."""
+    global _deferred_context, _deferred_count
+    set_album_cache_file(None)  # Ricalcolata dallo script del comando
+    set_deferred_mode(None)
+    _deferred_context = {}
+    _deferred_count = 0
+
+
+@contextmanager
+def deferred_context(**context):
+    """Informazioni del chiamante salvate con i casi accodati (es. report e brano sorgente)."""
+    global _deferred_context
+    previous = _deferred_context
+    _deferred_context = {**previous, **context}
+    try:
+        yield
+    finally:
+        _deferred_context = previous
+
+
+def _song_id(song) -> str:
+    return str(song.get('id', json.dumps(song, sort_keys=True, ensure_ascii=False)))
+
+
+def _deferred_key(entry: dict) -> str:
+    query = entry["query"]
+    return json.dumps([
+        query["title"], query["artist"], query["album"], entry["song_list_format"],
+        entry["context"].get("report"), sorted(_song_id(song) for song in entry["candidates"])
+    ], ensure_ascii=False, default=str)
+
+
+def load_deferred_queue(path: str) -> list:
+    entries = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+    return entries
+
+
+def save_deferred_queue(path: str, entries: list) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _defer_choice(matches, input_title, input_artist, input_album, song_list_format) -> None:
+    global _deferred_keys, _deferred_count
+    entry = {
+        "script": os.path.basename(sys.argv[0]),
+        "song_list_format": song_list_format,
+        "album_cache_file": os.path.abspath(_cache_file()),
+        "query": {"title": input_title, "artist": input_artist, "album": input_album},
+        "candidates": matches,
+        "context": _deferred_context,
+        "resolved": False,
+    }
+
+    if _deferred_keys is None:
+        _deferred_keys = {_deferred_key(e) for e in load_deferred_queue(_deferred_queue_file)}
+    key = _deferred_key(entry)
+    _deferred_count += 1
+    if key in _deferred_keys:
+        logger.info(f"Scelta già in coda per: {input_title} - {input_artist} [{input_album}]")
+        return None
+
+    directory = os.path.dirname(_deferred_queue_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(_deferred_queue_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    _deferred_keys.add(key)
+    logger.info(f"Scelta differita ({len(matches)} candidati) per: {input_title} - {input_artist} [{input_album}]")
+    return None
+
+
 # ---------------------------------------------------------------------------
 # Funzione pubblica — firma invariata (retrocompatibile)
 # ---------------------------------------------------------------------------
@@ -121,6 +242,10 @@ def choose_song(matches, input_title, input_artist, input_album, song_list_forma
             # Album in cache non presente tra i candidati attuali → chiedi all'utente
             logger.warning(f"Cache hit ma album '{chosen_id}' non tra i candidati, chiedo all'utente")
 
+    # Modalità differita: accoda il caso e prosegui
+    if is_deferred_mode():
+        return _defer_choice(matches, input_title, input_artist, input_album, song_list_format)
+
     # Nessuna cache valida: chiedi all'utente
     winsound.MessageBeep()
 
@@ -1,7 +1,13 @@
 import re
+import os
+import functools
+from collections import Counter
 import sys
 import logging
+import threading
 import user_inputs
+import batch_scoring
+from dotenv import load_dotenv
 
 sys.path.append('../')
 sys.path.append('../common_py_utils')
@@ -10,6 +16,30 @@ from common_py_utils import string_utils
 
 logger = logging.getLogger(__name__)
 
+load_dotenv()
+
+# MATCH_BATCH_SCORING=1: score candidates in one vectorized pass (needs numpy and rapidfuzz).
+# Off by default: tests/test_batch_scoring.py checks it against string_utils.are_strings_similar
+USE_BATCH_SCORING = os.getenv("MATCH_BATCH_SCORING", "0") == "1"
+
+# Candidates scored, pruned at each stage (title, album) and matched
+MATCH_STATS = Counter()
+# Songs are also matched from the spotify_workers threads: updates go through add_match_stats
+_match_stats_lock = threading.Lock()
+
+
+def add_match_stats(counts):
+    """Adds counts (a mapping) to MATCH_STATS."""
+    with _match_stats_lock:
+        MATCH_STATS.update(counts)
+
+def _count(stats, key):
+    """One more key in stats, the Counter of the query being scored (added once at its end), or in MATCH_STATS."""
+    if stats is None:
+        add_match_stats({key: 1})
+    else:
+        stats[key] += 1
+
 # Terms to ignore
 IGNORE_TERMS = [
     r"\[Remastered Version\]",
@@ -58,44 +88,115 @@ IGNORE_TERMS = [
 ]
 
 
+# Single character replacements, applied at once through a translation table
+CHAR_REPLACEMENTS = {
+    "’": "'",
+    "×": "x",
+    "·": "",
+    "‐": "-",
+    "…": "...",
+}
+
+# Multi character replacements, applied in this order
+STRING_REPLACEMENTS = [
+    (" / ", "/"),
+    ("A'", "à"),
+    ("E'", "è"),
+    ("I'", "ì"),
+    ("O'", "ò"),
+    ("U'", "ù"),
+    ("Sansiro", "San siro"),
+    (" - ", "-"),
+    ("I RIO", "Rio"),
+]
+
+_CHAR_TABLE = str.maketrans(CHAR_REPLACEMENTS)
+_IGNORE_PATTERNS = [re.compile(term, re.IGNORECASE) for term in IGNORE_TERMS]
+# One alternation of all the terms: most strings contain none of them
+_IGNORE_ANY = re.compile("|".join(f"(?:{term})" for term in IGNORE_TERMS), re.IGNORECASE)
+
+# Memoized normalizations and scores: titles, artists and albums repeat many times in a run
+NORMALIZE_CACHE_SIZE = 65536
+SIMILARITY_CACHE_SIZE = 262144
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def clean_string(input_string):
     """Remove terms to ignore, extra spaces and convert in lowercase."""
 
     # Sostituzione di caratteri specifici
-    input_string = input_string.replace("’", "'")
-    input_string = input_string.replace("×", "x")
-    input_string = input_string.replace("·", "")
-    input_string = input_string.replace("‐", "-")
-    input_string = input_string.replace("…", "...")
-    input_string = input_string.replace(" / ", "/")
-    input_string = input_string.replace("A'", "à")
-    input_string = input_string.replace("E'", "è")
-    input_string = input_string.replace("I'", "ì")
-    input_string = input_string.replace("O'", "ò")
-    input_string = input_string.replace("U'", "ù")
-    input_string = input_string.replace("Sansiro", "San siro")
-    input_string = input_string.replace(" - ", "-")
-    input_string = input_string.replace("I RIO", "Rio")
+    input_string = input_string.translate(_CHAR_TABLE)
+    for old, new in STRING_REPLACEMENTS:
+        input_string = input_string.replace(old, new)
     
     input_string = input_string.strip().lower()
     
-    for term in IGNORE_TERMS:
-        input_string = re.sub(term, "", input_string, flags=re.IGNORECASE)
+    # Terms are removed one after the other (a removal can expose a later term),
+    # so the sequence only runs when the alternation finds at least one of them
+    if _IGNORE_ANY.search(input_string):
+        for pattern in _IGNORE_PATTERNS:
+            input_string = pattern.sub("", input_string)
     return input_string.strip()
 
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize(text):
+    """string_utils.clean_string, memoized: the text the matching compares ("" for an empty one)."""
+    return string_utils.clean_string(text) if text else ""
+
+@functools.lru_cache(maxsize=SIMILARITY_CACHE_SIZE)
+def similarity(text1, text2):
+    """Score of string_utils.are_strings_similar, memoized: the same artist and album pairs come back for every song."""
+    return string_utils.are_strings_similar(text1, text2)[1]
+
+def clear_caches():
+    """Empties the memoized normalizations and scores."""
+    clean_string.cache_clear()
+    normalize.cache_clear()
+    similarity.cache_clear()
+
 def album_title_match(input_string):
     """Manual match for irregoular album title."""
     input_string = input_string.replace("Greatest Hits Volume One - The Singles", "Greatest Hits, Volume One: The Singles")
     return input_string
 
-def match_song_weighed(title1, artistList1, album1, title2, artistList2, album2, 
-                       title_weight=0.6, artist_weight=0.3, album_weight=0.1, 
-                       threshold=0.85, consider_album=True):
+def get_song_fields(song, song_list_format):
+    """Returns title, artist(s) and album of a song in the given list format."""
+    if (song_list_format=="spotify"):
+        return song['name'], [artist["name"] for artist in song["artists"]], song['album']
+    elif (song_list_format=="spotify_ext"):
+        return song['name'], [artist["name"] for artist in song["artists"]], song['album']['name']
+    elif (song_list_format=="navidrome"):
+        return song['title'], song['artist'], song['album']
+    raise ValueError(f"Unknown song list format: {song_list_format}")
+
+def song_scores(title1, artistList1, album1, title2, artistList2, album2, consider_album=True,
+                weights=None, threshold=None, stats=None):
     """
-    Confronta metadati completi di canzoni
+    Title, artist (best pair) and album similarity of two songs; album is 0 if not considered.
+
+    With weights and threshold the components are scored from the most selective and cheapest
+    (title, album, then every artist pair) and scoring stops as soon as the threshold can't be
+    reached even with the remaining components at 1: those components are returned as None.
+    Counts go to stats (a Counter) if given, otherwise straight to MATCH_STATS.
     """
+    prune = weights is not None and threshold is not None
+    if prune:
+        title_weight, artist_weight, album_weight = weights
+    _count(stats, "scored")
+
     # Confronta i titoli
-    _, title_score = string_utils.are_strings_similar(title1, title2)
+    title_score = similarity(title1, title2)
+    if prune and title_score * title_weight + 1 * artist_weight + (1 if consider_album else 0) * album_weight < threshold:
+        _count(stats, "pruned_title")
+        return title_score, None, None
+
+    # Confronta gli album solo se considerato
+    album_score = 0
+    if consider_album:
+        album_score = similarity(album1, album2)
+        if prune and title_score * title_weight + 1 * artist_weight + album_score * album_weight < threshold:
+            _count(stats, "pruned_album")
+            return title_score, None, album_score
     
     # Assicurati che artistList1 e artistList2 siano liste
     if isinstance(artistList1, str):
@@ -104,13 +205,32 @@ def match_song_weighed(title1, artistList1, album1, title2, artistList2, album2,
         artistList2 = [artistList2]
     
     # Calcola il punteggio per gli artisti
-    artist_scores = [string_utils.are_strings_similar(artist1, artist2)[1] for artist1 in artistList1 for artist2 in artistList2]
+    artist_scores = [similarity(artist1, artist2) for artist1 in artistList1 for artist2 in artistList2]
     artist_score = max(artist_scores) if artist_scores else 0  # Usa il punteggio massimo tra gli artisti
-    
-    # Confronta gli album solo se considerato
-    album_score = 0
-    if consider_album:
-        _, album_score = string_utils.are_strings_similar(album1, album2)
+
+    return title_score, artist_score, album_score
+
+def is_complete_match(title1, artistList1, album1, title2, artistList2, album2):
+    """Same title and album and at least one artist in common."""
+    if isinstance(artistList1, str):
+        artistList1 = [artistList1]
+    if isinstance(artistList2, str):
+        artistList2 = [artistList2]
+    return title1 == title2 and bool(set(artistList1) & set(artistList2)) and album1 == album2
+
+def match_song_weighed(title1, artistList1, album1, title2, artistList2, album2, 
+                       title_weight=0.6, artist_weight=0.3, album_weight=0.1, 
+                       threshold=0.85, consider_album=True, stats=None):
+    """
+    Confronta metadati completi di canzoni
+    """
+    title_score, artist_score, album_score = song_scores(
+        title1, artistList1, album1, title2, artistList2, album2, consider_album=consider_album,
+        weights=(title_weight, artist_weight, album_weight), threshold=threshold, stats=stats)
+
+    # Scartato in anticipo: il punteggio conta solo le componenti calcolate
+    if artist_score is None:
+        return False, title_score * title_weight + (album_score or 0) * album_weight
     
     # Calcola punteggio pesato
     score = (
@@ -122,14 +242,15 @@ def match_song_weighed(title1, artistList1, album1, title2, artistList2, album2,
     matched = score >= threshold
 
     if matched:
+        _count(stats, "matched")
         logger.info(f" score:{score} [title_score:{title_score};artist_score:{artist_score};album_score:{album_score}] [title:{title2};artistList:{artistList2};album:{album2}]")
-    else:
+    elif logger.isEnabledFor(logging.DEBUG):
         logger.debug(f"score:{score} [title_score:{title_score};artist_score:{artist_score};album_score:{album_score}] [title:{title2};artistList:{artistList2};album:{album2}]")
 
     return matched, score
 
 def match_song(title1, artistList1, album1, title2, artistList2, album2,
-               consider_album=True, simple_match=True):
+               consider_album=True, simple_match=True, stats=None):
     
     # Assicurati che artistList1 e artistList2 siano liste
     if isinstance(artistList1, str):
@@ -145,86 +266,207 @@ def match_song(title1, artistList1, album1, title2, artistList2, album2,
 
     if matched:
         score = 1.0
+        _count(stats, "scored")
+        _count(stats, "matched")
         logger.info(f"score:{score} COMPLETE MATCH!")
     else:
         matched, score = match_song_weighed(
             title1, artistList1, album1,
-            title2, artistList2, album2, consider_album=consider_album)
+            title2, artistList2, album2, consider_album=consider_album, stats=stats)
     
     return matched, score
 
-def find_song(input_title, input_artist, input_album, song_list,
-              song_list_format="navidrome", only_first_result=False, permit_choice=True,
-              consider_album=True):
+def score_songs(input_title, input_artist, input_album, song_fields, consider_album=True):
     """
-    Find a song in a list of songs.
+    Scores a query against a list of (title, artist, album) tuples.
+    Returns a (matched, score) pair for each of them, as match_song does.
     """
+    song_fields = [(title, artist, album_title_match(album)) for title, artist, album in song_fields]
 
-    if only_first_result and permit_choice:
-        raise ValueError("Parameters 'only_first_result' and 'permit_choice' cannot both be True.") 
+    if USE_BATCH_SCORING and batch_scoring.BATCH_BACKEND:
+        stats = Counter()
+        matched, scores, _ = batch_scoring.score_candidates(
+            input_title, input_artist, input_album, song_fields, consider_album=consider_album, stats=stats)
+        add_match_stats(stats)
+        _log_matches(song_fields, matched, scores)
+        return list(zip(matched.tolist(), scores.tolist()))
+
+    stats = Counter()
+    results = [
+        match_song(input_title, input_artist, input_album, title, artist, album,
+                   consider_album=consider_album, simple_match=False, stats=stats)
+        for title, artist, album in song_fields
+    ]
+    add_match_stats(stats)
+    return results
 
+def score_songs_by_album(input_title, input_artist, input_album, song_fields,
+                         title_weight=0.6, artist_weight=0.3, album_weight=0.1, threshold=0.85):
+    """
+    Scores a query against a list of (title, artist, album) tuples with and without album in one pass.
+
+    Title, artist and album scores are computed once per song and both verdicts are derived from them.
+    Returns two lists of (matched, score) pairs: as score_songs with consider_album True and False.
+    """
+    song_fields = [(title, artist, album_title_match(album)) for title, artist, album in song_fields]
+
+    if USE_BATCH_SCORING and batch_scoring.BATCH_BACKEND:
+        weights = (title_weight, artist_weight, album_weight)
+        # Pruned with the album-aware bound: it is never lower than the album-agnostic one
+        stats = Counter()
+        title_scores, artist_scores, album_scores, exact = batch_scoring.component_scores(
+            input_title, input_artist, input_album, song_fields,
+            weights=weights, threshold=threshold, stats=stats)
+        add_match_stats(stats)
+        matched, scores = batch_scoring.weigh(title_scores, artist_scores, album_scores, exact, weights, threshold)
+        partial_matched, partial_scores = batch_scoring.weigh(title_scores, artist_scores, None, None, weights, threshold)
+        _log_matches(song_fields, matched, scores)
+        return list(zip(matched.tolist(), scores.tolist())), list(zip(partial_matched.tolist(), partial_scores.tolist()))
+
+    with_album = []
+    without_album = []
+    weights = (title_weight, artist_weight, album_weight)
+    stats = Counter()
+    for title, artist, album in song_fields:
+        if is_complete_match(input_title, input_artist, input_album, title, artist, album):
+            title_score, artist_score, album_score = song_scores(
+                input_title, input_artist, input_album, title, artist, album, stats=stats)
+            score = 1.0
+        else:
+            # Pruned with the album-aware bound: it is never lower than the album-agnostic one
+            title_score, artist_score, album_score = song_scores(
+                input_title, input_artist, input_album, title, artist, album, weights=weights, threshold=threshold,
+                stats=stats)
+            if artist_score is None:
+                with_album.append((False, 0))
+                without_album.append((False, 0))
+                continue
+            score = title_score * title_weight + artist_score * artist_weight + album_score * album_weight
+        with_album.append((score >= threshold, score))
+
+        partial_score = title_score * title_weight + artist_score * artist_weight + 0 * album_weight
+        without_album.append((partial_score >= threshold, partial_score))
+
+        if score >= threshold:
+            stats["matched"] += 1
+            logger.info(f" score:{score} [title_score:{title_score};artist_score:{artist_score};album_score:{album_score}] [title:{title};artistList:{artist};album:{album}]")
+
+    add_match_stats(stats)
+    return with_album, without_album
+
+def log_match_stats():
+    """Logs how many candidates were scored, pruned at each stage and matched."""
+    scored = MATCH_STATS["scored"]
+    if not scored:
+        return
+    pruned_title = MATCH_STATS["pruned_title"]
+    pruned_album = MATCH_STATS["pruned_album"]
+    logger.info(f"Candidates scored: {scored}; pruned after title: {pruned_title} ({pruned_title / scored:.1%}); "
+                f"pruned after album: {pruned_album} ({pruned_album / scored:.1%}); matched: {MATCH_STATS['matched']}")
+
+
+def _log_matches(song_fields, matched, scores):
+    add_match_stats({"matched": int(matched.sum())})
+    for position in matched.nonzero()[0]:
+        title, artist, album = song_fields[position]
+        logger.info(f" score:{scores[position]} [title:{title};artistList:{artist};album:{album}]")
+
+def _candidates(input_title, input_artist, song_list, song_list_format, index):
+    """Songs to score and their (title, artist, album) fields: the index candidates, if any."""
+    if index is not None:
+        positions = index.candidate_positions(input_title, input_artist)
+        return [index.songs[position] for position in positions], [index.fields[position] for position in positions]
+    return song_list, [get_song_fields(song, song_list_format) for song in song_list]
+
+def _best_matches(song_list, scores, only_first_result=False):
+    """Matching songs sharing the highest score, in list order."""
     highest_score = 0
     best_matches = []
-    
-    logger.info(f"Searching match for song: {input_title} - {input_artist} - {input_album}")
-
-    for song in song_list:
-        if (song_list_format=="spotify"):
-            title = song['name']
-            artist = [artist["name"] for artist in song["artists"]]
-            album = song['album']
-        elif (song_list_format=="spotify_ext"):
-            title = song['name']
-            artist = [artist["name"] for artist in song["artists"]]
-            album = song['album']['name']
-        elif (song_list_format=="navidrome"):
-            title = song['title']
-            artist = song['artist']
-            album = song['album']
-        
-        matched, score = match_song(
-            input_title, input_artist, input_album,
-            title, artist, album_title_match(album),
-            consider_album=consider_album, simple_match=False
-        )
-        
+    for song, (matched, score) in zip(song_list, scores):
         if matched:
             if score > highest_score:
                 highest_score = score
                 best_matches = [song]
             elif score == highest_score and not only_first_result:
                 best_matches.append(song)
+    return best_matches
+
+def find_best_matches(input_title, input_artist, input_album, song_list,
+                      song_list_format="navidrome", only_first_result=False,
+                      consider_album=True, index=None):
+    """
+    Returns the matching songs sharing the highest score (only the first one if only_first_result).
+
+    If a song_index.SongIndex built on song_list is given, only its candidates are scored.
+    """
+    logger.info(f"Searching match for song: {input_title} - {input_artist} - {input_album}")
+
+    song_list, song_fields = _candidates(input_title, input_artist, song_list, song_list_format, index)
+    scores = score_songs(input_title, input_artist, input_album, song_fields, consider_album=consider_album)
+    return _best_matches(song_list, scores, only_first_result)
+
+def find_best_matches_by_album(input_title, input_artist, input_album, song_list,
+                               song_list_format="navidrome", only_first_result=False, index=None):
+    """
+    Same as find_best_matches with consider_album True and False, in a single scoring pass.
+    Returns the two lists of best matches.
+    """
+    logger.info(f"Searching match for song: {input_title} - {input_artist} - {input_album}")
+
+    song_list, song_fields = _candidates(input_title, input_artist, song_list, song_list_format, index)
+    scores, partial_scores = score_songs_by_album(input_title, input_artist, input_album, song_fields)
+    return _best_matches(song_list, scores, only_first_result), _best_matches(song_list, partial_scores, only_first_result)
+
+def choose_match(best_matches, input_title, input_artist, input_album, song_list_format="navidrome"):
+    """Picks one song among several best matches, asking the user if needed."""
+    # Se ci sono canzoni duplicate, scegli quella con available_markets più grande
+    if song_list_format == "spotify_ext":
+        # Raggruppa le canzoni per titolo, artista e album
+        grouped_matches = {}
+        for song in best_matches:
+            title = song['name']
+            artist = [artist["name"] for artist in song["artists"]]
+            album = song['album']['name']
+            
+            # Crea una chiave unica per titolo, artista e album
+            key = (title, tuple(sorted(artist)), album)
+            
+            if key not in grouped_matches:
+                grouped_matches[key] = []
+            grouped_matches[key].append(song)
+        
+        if len(grouped_matches) > 1:
+            logger.info("User choice required")
+            return user_inputs.choose_song(best_matches, input_title, input_artist, input_album, song_list_format)
+
+        # Per ogni gruppo di canzoni duplicate, scegli quella con available_markets più grande
+        for key, songs in grouped_matches.items():
+            # Trova la canzone con available_markets più grande
+            logger.info("Selected song by larger available_markets")
+            return max(songs, key=lambda s: len(s.get('available_markets', [])))
+
+    logger.info("User choice required")
+    return user_inputs.choose_song(best_matches, input_title, input_artist, input_album, song_list_format)
+
+def find_song(input_title, input_artist, input_album, song_list,
+              song_list_format="navidrome", only_first_result=False, permit_choice=True,
+              consider_album=True, index=None):
+    """
+    Find a song in a list of songs.
+
+    If a song_index.SongIndex built on song_list is given, only its candidates are scored.
+    """
+
+    if only_first_result and permit_choice:
+        raise ValueError("Parameters 'only_first_result' and 'permit_choice' cannot both be True.") 
+
+    best_matches = find_best_matches(
+        input_title, input_artist, input_album, song_list, song_list_format,
+        only_first_result=only_first_result, consider_album=consider_album, index=index)
     
     # Asks user to choose
     if permit_choice and len(best_matches) > 1:
-        # Se ci sono canzoni duplicate, scegli quella con available_markets più grande
-        if song_list_format == "spotify_ext":
-            # Raggruppa le canzoni per titolo, artista e album
-            grouped_matches = {}
-            for song in best_matches:
-                title = song['name']
-                artist = [artist["name"] for artist in song["artists"]]
-                album = song['album']['name']
-                
-                # Crea una chiave unica per titolo, artista e album
-                key = (title, tuple(sorted(artist)), album)
-                
-                if key not in grouped_matches:
-                    grouped_matches[key] = []
-                grouped_matches[key].append(song)
-            
-            if len(grouped_matches) > 1:
-                logger.info("User choice required")
-                return user_inputs.choose_song(best_matches, input_title, input_artist, input_album, song_list_format)
-
-            # Per ogni gruppo di canzoni duplicate, scegli quella con available_markets più grande
-            for key, songs in grouped_matches.items():
-                # Trova la canzone con available_markets più grande
-                logger.info("Selected song by larger available_markets")
-                return max(songs, key=lambda s: len(s.get('available_markets', [])))
-
-        logger.info("User choice required")
-        return user_inputs.choose_song(best_matches, input_title, input_artist, input_album, song_list_format)
+        return choose_match(best_matches, input_title, input_artist, input_album, song_list_format)
 
     if only_first_result and best_matches:
         logger.info("Selected first result")
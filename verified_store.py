@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import logging
+
+sys.path.append('../')
+sys.path.append('../common_py_utils')
+
+from common_py_utils import json_utils
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    return " ".join(str(value or "").casefold().split())
+
+
+def spotify_keys(song):
+    """
+    Keys of a Spotify song: the first one is used for lookups, all of them for indexing.
+    Songs with an id are looked up by id only, the others by (title, first artist, album).
+    """
+    artists = song.get("artists") or [{}]
+    meta_key = ("meta", _normalize(song.get("name")), _normalize(artists[0].get("name")), _normalize(song.get("album")))
+    if song.get("id"):
+        return [("id", song["id"]), meta_key]
+    return [meta_key]
+
+
+def csv_keys(song):
+    """Keys of a CSV row: its first three fields (title, artist, album)."""
+    return [("meta", _normalize(song[0]), _normalize(song[1]), _normalize(song[2]))]
+
+
+def journal_path(path):
+    """Append-only journal stored next to the legacy verified file."""
+    return os.path.splitext(path)[0] + ".jsonl"
+
+
+class VerifiedStore:
+    """
+    Persistent set of verified songs with O(1) lookups.
+
+    Entries are loaded from the legacy JSON list (if any) and from its JSONL journal;
+    new entries are appended to the journal as soon as they are verified, so the whole
+    file is never rewritten.
+    """
+
+    def __init__(self, path, keys=spotify_keys):
+        self.path = path
+        self.journal_path = journal_path(path)
+        self.keys = keys
+        self._keys = set()
+        self._count = 0
+
+        if os.path.exists(self.path):
+            for song in json_utils.load_json_data(self.path) or []:
+                self._index(song)
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+        logger.info(f"Verified songs loaded: {self._count} ({self.path}, {self.journal_path})")
+
+    def _index(self, song):
+        self._keys.update(self.keys(song))
+        self._count += 1
+
+    def __contains__(self, song):
+        return self.keys(song)[0] in self._keys
+
+    def __len__(self):
+        return self._count
+
+    def add(self, song):
+        """Adds a song, appending it to the journal. Returns False if it was already verified."""
+        if song in self:
+            return False
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(song, ensure_ascii=False) + "\n")
+        self._index(song)
+        return True